@@ -1,6 +1,8 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from openrouteservice import convert
 import logging
 import os
@@ -8,12 +10,31 @@ from datetime import datetime, timedelta
 import zipfile
 import io
 import csv
-from collections import defaultdict
+import mmap
+import fcntl
+import tempfile
+import shutil
+from contextlib import contextmanager
+from collections import defaultdict, OrderedDict
+from collections.abc import Mapping, MutableMapping, Sequence
+from array import array
+from bisect import bisect_left
+import heapq
+import itertools
 import math
+import numpy as np
 import threading
 import time
-from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait, TimeoutError as FutureTimeoutError
 import json
+import hashlib
+import re
+import argparse
+import struct
+import sys
+import sqlite3
+import queue
+import unicodedata
 
 # Configuration du logging
 logging.basicConfig(
@@ -26,16 +47,986 @@ app = Flask(__name__)
 CORS(app)
 
 # Configuration
+ORS_BASE_URL = os.getenv('ORS_BASE_URL', 'https://api.openrouteservice.org').rstrip('/')
 ORS_API_KEY = os.getenv('ORS_API_KEY', 'eyJvcmciOiI1YjNjZTM1OTc4NTExMTAwMDFjZjYyNDgiLCJpZCI6ImIxM2U1NzhhNDJlMjQ1MzZhNTVlYjUyZjBhYzAyY2UzIiwiaCI6Im11cm11cjY0In0=')
 FLASK_ENV = os.getenv('FLASK_ENV', 'development')
 PORT = int(os.getenv('PORT', 5001))
 
-# Cache global pour GTFS par région
-gtfs_cache = {}
+# Géocodage (Photon, fallback Nominatim)
+PHOTON_URL = 'https://photon.komoot.io'
+PHOTON_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org/search'
+NOMINATIM_HEADERS = {
+    'User-Agent': 'TransportOptimization/1.0 (contact@example.com)'
+}
+
+# Téléchargement GTFS en streaming (taille plafonnée)
+GTFS_MAX_DOWNLOAD_MB = int(os.getenv('GTFS_MAX_DOWNLOAD_MB', 1024))
+GTFS_DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # 1 Mo
+GTFS_DOWNLOAD_LOG_STEP_MB = 50
+GTFS_TMP_DIR = os.getenv('GTFS_TMP_DIR') or None
+
+# Chargement des flux complets: budget mémoire du timetable par flux (0 = sans limite)
+GTFS_MEMORY_BUDGET_MB = float(os.getenv('GTFS_MEMORY_BUDGET_MB', 512))
+# Chargements partiels (zones de 5km) gardés par flux, dans la limite de GTFS_MEMORY_BUDGET_MB à eux tous
+GTFS_PARTIAL_MAX_PER_FEED = int(os.getenv('GTFS_PARTIAL_MAX_PER_FEED', 8))
+GTFS_PARSE_BUFFER_SIZE = 4 * 1024 * 1024  # Lecture de stop_times.txt par blocs de 4 Mo
+GTFS_PARSE_LOG_STEP = 1000000
+# Jours de service précalculés (calendar.txt / calendar_dates.txt) à partir de la veille
+GTFS_CALENDAR_HORIZON_DAYS = int(os.getenv('GTFS_CALENDAR_HORIZON_DAYS', 14))
+
+# Calcul d'itinéraires sur les horaires (RAPTOR)
+WALK_SPEED_KMH = 4.5
+FOOTPATH_RADIUS_KM = 0.3  # Correspondances à pied entre arrêts
+MAX_TRANSFERS = int(os.getenv('PLANNER_MAX_TRANSFERS', 2))
+PLANNER_ACCESS_STOPS = 15  # Arrêts candidats au départ / à l'arrivée
+
+# Appels amont en parallèle (pool borné, délai par tâche en secondes)
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 8))
+UPSTREAM_TASK_TIMEOUT = float(os.getenv('UPSTREAM_TASK_TIMEOUT', 20))
+TRANSIT_TASK_TIMEOUT = float(os.getenv('TRANSIT_TASK_TIMEOUT', 90))
+upstream_executor = ThreadPoolExecutor(max_workers=UPSTREAM_POOL_SIZE, thread_name_prefix='upstream')
+# Résultats par défaut d'une tâche en échec (lieu inconnu, aucun itinéraire)
+UNKNOWN_LOCATION = {'country': '', 'country_code': '', 'city': '', 'state': ''}
+NO_ROUTE = ([], 0, 0)
+
+# Itinéraires par lots (/api/itineraire/batch) : pool dédié, taille max d'un lot,
+# points par appel matrix ORS (origines + destinations)
+BATCH_POOL_SIZE = int(os.getenv('BATCH_POOL_SIZE', 4))
+BATCH_MAX_PAIRS = int(os.getenv('BATCH_MAX_PAIRS', 5000))
+BATCH_MATRIX_MAX_LOCATIONS = int(os.getenv('BATCH_MATRIX_MAX_LOCATIONS', 50))
+# Fenêtre (secondes) regroupant les couples géocodés presque en même temps avant leur lancement
+BATCH_GEOCODE_WINDOW = float(os.getenv('BATCH_GEOCODE_WINDOW', 0.05))
+# Durée max d'un lot (secondes) : au-delà, couples restants complétés par défaut et tâches annulées
+BATCH_DEADLINE_S = float(os.getenv('BATCH_DEADLINE_S', 900))
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_POOL_SIZE, thread_name_prefix='batch')
+
+# Sessions HTTP mutualisées par fournisseur (keep-alive, tentatives avec backoff)
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 10))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', 2))
+HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', 0.3))
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Overpass bascule déjà sur un autre miroir en cas d'échec : pas de nouvelle tentative
+HTTP_PROVIDER_RETRIES = {'overpass': 0}
+
+# Miroirs Overpass interrogés en course : le suivant part après OVERPASS_HEDGE_DELAY_S sans réponse
+# (ou dès un échec), la première réponse valide l'emporte. Ordre ajusté selon latence et santé.
+OVERPASS_MIRRORS = [url.strip() for url in os.getenv('OVERPASS_MIRRORS', ','.join([
+    "https://overpass.kumi.systems/api/interpreter",
+    "https://overpass-api.de/api/interpreter",
+    "https://overpass.openstreetmap.ru/cgi/interpreter",
+])).split(',') if url.strip()]
+OVERPASS_HEDGE_DELAY_S = float(os.getenv('OVERPASS_HEDGE_DELAY_S', 2))
+OVERPASS_TIMEOUT_S = float(os.getenv('OVERPASS_TIMEOUT_S', 25))
+OVERPASS_COOLDOWN_S = float(os.getenv('OVERPASS_COOLDOWN_S', 300))  # Miroir en échec relégué en fin de liste
+overpass_executor = ThreadPoolExecutor(max_workers=max(2 * len(OVERPASS_MIRRORS), 1), thread_name_prefix='overpass')
+
+# Caches persistants (SQLite partagé entre workers gunicorn et redémarrages)
+CACHE_DIR = os.getenv('CACHE_DIR', os.path.join(tempfile.gettempdir(), 'transport-cache'))
+GEOCODE_CACHE_TTL_HOURS = float(os.getenv('GEOCODE_CACHE_TTL_HOURS', 24 * 30))
+GEOCODE_CACHE_NEGATIVE_TTL_MINUTES = float(os.getenv('GEOCODE_CACHE_NEGATIVE_TTL_MINUTES', 60))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.getenv('GEOCODE_CACHE_MAX_ENTRIES', 50000))
+
+# Cache des itinéraires ORS (coordonnées arrondies à ROUTE_CACHE_PRECISION décimales, 4 ≈ 11 m)
+ROUTE_CACHE_PRECISION = int(os.getenv('ROUTE_CACHE_PRECISION', 4))
+ROUTE_CACHE_TTL_HOURS = float(os.getenv('ROUTE_CACHE_TTL_HOURS', 24 * 7))
+ROUTE_CACHE_MAX_MB = float(os.getenv('ROUTE_CACHE_MAX_MB', 64))
+ROUTE_CACHE_DISK = os.getenv('ROUTE_CACHE_DISK', 'false').lower() in ('1', 'true', 'yes')
+ROUTE_CACHE_DISK_MAX_ENTRIES = int(os.getenv('ROUTE_CACHE_DISK_MAX_ENTRIES', 100000))
+
+# Cache Overpass par tuiles (grille lat/lon de OVERPASS_TILE_DEG degrés, 0.02 ≈ 2 km)
+OVERPASS_TILE_DEG = float(os.getenv('OVERPASS_TILE_DEG', 0.02))
+OVERPASS_TILE_TTL_HOURS = float(os.getenv('OVERPASS_TILE_TTL_HOURS', 24 * 7))
+OVERPASS_TILE_MAX_ENTRIES = int(os.getenv('OVERPASS_TILE_MAX_ENTRIES', 20000))
+
+# Instantanés binaires des flux GTFS parsés (mmap, partagés entre workers)
+GTFS_CACHE_TTL = timedelta(hours=24)
+GTFS_SNAPSHOTS = os.getenv('GTFS_SNAPSHOTS', 'true').lower() in ('1', 'true', 'yes')
+GTFS_SNAPSHOT_DIR = os.getenv('GTFS_SNAPSHOT_DIR', os.path.join(CACHE_DIR, 'gtfs'))
+# Préchargement et rafraîchissement en arrière-plan de gtfs_cache
+# GTFS_WARMUP_REGIONS: "lat,lon;lat,lon" chargées au démarrage et maintenues à jour
+GTFS_WARMUP_REGIONS = os.getenv('GTFS_WARMUP_REGIONS', '')
+GTFS_SCHEDULER = os.getenv('GTFS_SCHEDULER', 'true').lower() in ('1', 'true', 'yes')
+GTFS_SCHEDULER_INTERVAL_S = float(os.getenv('GTFS_SCHEDULER_INTERVAL_S', 300))
+GTFS_REFRESH_AHEAD = timedelta(hours=float(os.getenv('GTFS_REFRESH_AHEAD_HOURS', 2)))
+GTFS_STALE_GRACE = timedelta(hours=float(os.getenv('GTFS_STALE_GRACE_HOURS', 24)))
+GTFS_REFRESH_WORKERS = int(os.getenv('GTFS_REFRESH_WORKERS', 2))
+GTFS_HOT_REGIONS = int(os.getenv('GTFS_HOT_REGIONS', 10))  # Régions les plus demandées maintenues à jour
+GTFS_LOAD_WAIT_S = float(os.getenv('GTFS_LOAD_WAIT_S', 90))  # Attente max d'un chargement déjà en cours
+GTFS_READY_REQUIRES_WARMUP = os.getenv('GTFS_READY_REQUIRES_WARMUP', 'true').lower() in ('1', 'true', 'yes')
+
+# Artefacts précompilés (python app.py compile-feed), ex. intégrés à l'image Docker
+GTFS_ARTIFACT_DIR = os.getenv('GTFS_ARTIFACT_DIR') or None
+
+# Cache global des flux chargés : clé de flux (URL GTFS, artefact ou osm:<région>) -> données.
+# Une position est résolue vers un flux chargé par son emprise (marge GTFS_COVERAGE_MARGIN_KM),
+# résolution mémorisée par région de 0.01° dans region_feeds.
+GTFS_COVERAGE_MARGIN_KM = float(os.getenv('GTFS_COVERAGE_MARGIN_KM', 2))
+region_feeds = {}  # clé de région -> clé de flux (gtfs_cache : LoadedFeeds, après FeedCatalog)
+_artifact_headers = {}  # (chemin, mtime) -> en-tête d'artefact
+prefetched_archives = {}  # URL -> archive GTFS téléchargée par asgi.py (ou erreur), reprise par le chargement
 cache_lock = threading.Lock()
 
-# Base de données des sources GTFS mondiales (The Mobility Database)
-MOBILITY_DATABASE_API = "https://api.mobilitydatabase.org/v1"
+# Catalogue des sources GTFS mondiales (export CSV de The Mobility Database), lu sur disque au
+# démarrage et rafraîchi en arrière-plan : aucune requête réseau sur le chemin d'une requête
+GTFS_CATALOG_URL = os.getenv('GTFS_CATALOG_URL', 'https://files.mobilitydatabase.org/feeds_v2.csv')
+GTFS_CATALOG_PATH = os.getenv('GTFS_CATALOG_PATH', os.path.join(CACHE_DIR, 'gtfs_catalog.csv'))
+GTFS_CATALOG_REFRESH_HOURS = float(os.getenv('GTFS_CATALOG_REFRESH_HOURS', 24))
+GTFS_CATALOG_CHECK_S = 600  # Relecture du fichier si un autre worker l'a remplacé
+GTFS_CATALOG_WAIT_S = 10  # Catalogue absent, téléchargé par un autre processus : relecture rapprochée
+GTFS_CATALOG_CELL_DEG = 1.0  # Grille de l'index spatial des emprises
+
+# Principales villes avec GTFS open data
+LOCAL_GTFS_SOURCES = [
+    # France - URLs DIRECTES 2025 (validées)
+    {'name': 'TBM Bordeaux', 'country': 'FR', 'lat': 44.8378, 'lon': -0.5792, 
+     'url': 'https://eu.ftp.opendatasoft.com/bdx/gtfs_bdx.zip'},
+    {'name': 'RATP Paris', 'country': 'FR', 'lat': 48.8566, 'lon': 2.3522,
+     'url': 'https://eu.ftp.opendatasoft.com/stif/gtfs-lines-last.zip'},
+    {'name': 'TCL Lyon', 'country': 'FR', 'lat': 45.7640, 'lon': 4.8357,
+     'url': 'https://eu.ftp.opendatasoft.com/sytral/GTFS/GTFS_TCL.zip'},
+    
+    # USA
+    {'name': 'MTA New York', 'country': 'US', 'lat': 40.7128, 'lon': -74.0060,
+     'url': 'http://web.mta.info/developers/data/nyct/subway/google_transit.zip'},
+    {'name': 'BART San Francisco', 'country': 'US', 'lat': 37.7749, 'lon': -122.4194,
+     'url': 'https://www.bart.gov/dev/schedules/google_transit.zip'},
+    {'name': 'CTA Chicago', 'country': 'US', 'lat': 41.8781, 'lon': -87.6298,
+     'url': 'https://www.transitchicago.com/downloads/sch_data/google_transit.zip'},
+    
+    # UK
+    {'name': 'TfL London', 'country': 'UK', 'lat': 51.5074, 'lon': -0.1278,
+     'url': 'https://api.tfl.gov.uk/timetables/tfl-gtfs.zip'},
+    
+    # Canada
+    {'name': 'STM Montreal', 'country': 'CA', 'lat': 45.5017, 'lon': -73.5673,
+     'url': 'https://www.stm.info/sites/default/files/gtfs/gtfs_stm.zip'},
+    {'name': 'TTC Toronto', 'country': 'CA', 'lat': 43.6532, 'lon': -79.3832,
+     'url': 'http://opendata.toronto.ca/toronto.transit.commission/ttc-routes-and-schedules/TTC_Routes_and_Schedules_Data.zip'},
+    
+    # Allemagne
+    {'name': 'BVG Berlin', 'country': 'DE', 'lat': 52.5200, 'lon': 13.4050,
+     'url': 'https://www.vbb.de/media/download/2029'},
+    
+    # Espagne
+    {'name': 'EMT Madrid', 'country': 'ES', 'lat': 40.4168, 'lon': -3.7038,
+     'url': 'https://opendata.emtmadrid.es/Datos-estaticos/Datos-generales-(1)'},
+    {'name': 'TMB Barcelona', 'country': 'ES', 'lat': 41.3851, 'lon': 2.1734,
+     'url': 'https://www.tmb.cat/en/barcelona/shared/gtfs'},
+    
+    # Italie
+    {'name': 'ATAC Rome', 'country': 'IT', 'lat': 41.9028, 'lon': 12.4964,
+     'url': 'https://romamobilita.it/sites/default/files/rome_gtfs.zip'},
+    {'name': 'ATM Milan', 'country': 'IT', 'lat': 45.4642, 'lon': 9.1900,
+     'url': 'https://www.atm.it/it/ViaggiaConNoi/Pagine/GTFSDataset.aspx'},
+    
+    # Pays-Bas
+    {'name': 'GVB Amsterdam', 'country': 'NL', 'lat': 52.3676, 'lon': 4.9041,
+     'url': 'https://gtfs.ovapi.nl/nl/gtfs-nl.zip'},
+    
+    # Belgique
+    {'name': 'STIB Brussels', 'country': 'BE', 'lat': 50.8503, 'lon': 4.3517,
+     'url': 'https://stibmivb.opendatasoft.com/api/explore/v2.1/catalog/datasets/gtfs-files-production/files'},
+    
+    # Suisse
+    {'name': 'SBB Swiss', 'country': 'CH', 'lat': 47.3769, 'lon': 8.5417,
+     'url': 'https://opentransportdata.swiss/en/dataset/timetable-2020-gtfs'},
+    
+    # Australie
+    {'name': 'Transport NSW Sydney', 'country': 'AU', 'lat': -33.8688, 'lon': 151.2093,
+     'url': 'https://opendata.transport.nsw.gov.au/dataset/public-transport-gtfs-realtime'},
+    {'name': 'PTV Melbourne', 'country': 'AU', 'lat': -37.8136, 'lon': 144.9631,
+     'url': 'https://data.ptv.vic.gov.au/downloads/gtfs.zip'},
+    
+    # Japon
+    {'name': 'Tokyo Metro', 'country': 'JP', 'lat': 35.6762, 'lon': 139.6503,
+     'url': 'https://api-public.odpt.org/api/v4/files/tokyometro/data/odpt_train.zip'},
+]
+LOCAL_GTFS_SOURCE_LATS = np.array([source['lat'] for source in LOCAL_GTFS_SOURCES])
+LOCAL_GTFS_SOURCE_LONS = np.array([source['lon'] for source in LOCAL_GTFS_SOURCES])
+
+
+_http_sessions = {}
+_http_sessions_pid = None
+_http_sessions_lock = threading.Lock()
+
+
+def http_session(provider):
+    """
+    Session requests mutualisée pour un fournisseur (photon, nominatim, ors, overpass,
+    mobility_database, gtfs) : connexions keep-alive réutilisées et tentatives bornées.
+    Les sessions sont créées à la demande et recréées dans chaque processus après un fork.
+    """
+    global _http_sessions_pid
+    pid = os.getpid()
+    if _http_sessions_pid == pid:
+        session = _http_sessions.get(provider)
+        if session is not None:
+            return session
+    
+    with _http_sessions_lock:
+        if _http_sessions_pid != pid:
+            # Sessions héritées du processus parent : ne pas partager leurs sockets
+            _http_sessions.clear()
+            _http_sessions_pid = pid
+        
+        session = _http_sessions.get(provider)
+        if session is None:
+            retries = HTTP_PROVIDER_RETRIES.get(provider, HTTP_RETRIES)
+            retry = Retry(
+                total=retries,
+                backoff_factor=HTTP_BACKOFF_FACTOR,
+                status_forcelist=HTTP_RETRY_STATUSES if retries else (),
+                allowed_methods=frozenset(['GET', 'POST']),
+                respect_retry_after_header=False,
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _http_sessions[provider] = session
+        return session
+
+
+class PersistentCache:
+    """
+    Cache clé/valeur persistant (SQLite) avec expiration (TTL) et éviction LRU.
+    Le fichier est partagé entre processus ; les compteurs de hits/misses sont propres au worker.
+    Les valeurs sont sérialisées en JSON, None sert d'entrée négative.
+    """
+    
+    TOUCH_INTERVAL = 60  # Secondes entre deux mises à jour de l'horodatage LRU d'une entrée
+    TRIM_INTERVAL = 1000  # Écritures entre deux comptages exacts (écritures des autres workers)
+    
+    def __init__(self, path, ttl_seconds, max_entries, table='cache'):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.errors = 0
+        self._entries = None  # Nombre d'entrées estimé : dernier comptage + écritures du worker depuis
+        self._writes = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+    
+    def _connection(self):
+        """Connexion SQLite propre au thread (et recréée après un fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table} ('
+            'key TEXT PRIMARY KEY, value TEXT, expires REAL NOT NULL, accessed REAL NOT NULL)'
+        )
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table}(accessed)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+    
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+    
+    def lookup(self, key):
+        """Retourne (trouvé, valeur) ; une entrée négative donne (True, None)"""
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                f'SELECT value, expires, accessed FROM {self.table} WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and row[1] <= now:
+                conn.execute(f'DELETE FROM {self.table} WHERE key = ? AND expires <= ?', (key, now))
+                row = None
+            if row is not None and now - row[2] > self.TOUCH_INTERVAL:
+                conn.execute(f'UPDATE {self.table} SET accessed = ? WHERE key = ?', (now, key))
+        except sqlite3.Error as e:
+            logger.warning(f"Cache {self.table} indisponible: {e}")
+            self._count('errors')
+            row = None
+        
+        if row is None:
+            self._count('misses')
+            return False, None
+        
+        value = json.loads(row[0]) if row[0] is not None else None
+        self._count('hits' if value is not None else 'negative_hits')
+        return True, value
+    
+    def set(self, key, value, ttl_seconds=None):
+        """Enregistre une valeur (None = résultat négatif) puis évince les entrées les moins utilisées"""
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        payload = json.dumps(value) if value is not None else None
+        try:
+            conn = self._connection()
+            conn.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                (key, payload, now + ttl, now)
+            )
+            if self._needs_trim():
+                self._trim(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Écriture cache {self.table} impossible: {e}")
+            self._count('errors')
+    
+    def _needs_trim(self):
+        """Compte une écriture ; vrai si l'estimation dépasse max_entries ou si un recomptage est dû"""
+        with self._stats_lock:
+            self._writes += 1
+            if self._entries is not None:
+                self._entries += 1
+            return self._entries is None or self._entries > self.max_entries or self._writes >= self.TRIM_INTERVAL
+    
+    def _trim(self, conn):
+        """
+        Comptage exact ; au-delà de max_entries, éviction des entrées les moins utilisées jusqu'à
+        90 % de la limite, pour que les écritures suivantes ne recomptent pas la table à chaque fois
+        """
+        count = conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+        if count > self.max_entries:
+            excess = count - (self.max_entries - self.max_entries // 10)
+            conn.execute(
+                f'DELETE FROM {self.table} WHERE key IN '
+                f'(SELECT key FROM {self.table} ORDER BY accessed LIMIT ?)', (excess,)
+            )
+            count -= excess
+        with self._stats_lock:
+            self._entries = count
+            self._writes = 0
+    
+    def stats(self):
+        """Compteurs du worker et nombre d'entrées du fichier partagé"""
+        try:
+            entries = self._connection().execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'hit_rate': round((self.hits + self.negative_hits) / lookups, 3) if lookups else None,
+            'entries': entries
+        }
+
+
+geocode_cache = PersistentCache(
+    os.path.join(CACHE_DIR, 'geocode.sqlite3'),
+    ttl_seconds=GEOCODE_CACHE_TTL_HOURS * 3600,
+    max_entries=GEOCODE_CACHE_MAX_ENTRIES,
+    table='geocode'
+)
+
+overpass_tile_cache = PersistentCache(
+    os.path.join(CACHE_DIR, 'overpass.sqlite3'),
+    ttl_seconds=OVERPASS_TILE_TTL_HOURS * 3600,
+    max_entries=OVERPASS_TILE_MAX_ENTRIES,
+    table='overpass_tiles'
+)
+
+
+class RouteCache:
+    """
+    Cache des itinéraires (géométrie, distance, durée) : niveau mémoire avec TTL et
+    éviction LRU bornée en octets, plus un niveau disque PersistentCache optionnel.
+    Clé : profil + coordonnées arrondies à `precision` décimales.
+    """
+    
+    ENTRY_BYTES = 400   # Estimation du coût fixe d'une entrée (clé, tuple, OrderedDict)
+    POINT_BYTES = 120   # Estimation d'un point [lon, lat] (liste + 2 floats)
+    
+    def __init__(self, ttl_seconds, max_bytes, precision=4, disk=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.precision = precision
+        self.disk = disk
+        self.entries = OrderedDict()  # clé -> (expiration, (coords, km, min), octets)
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    def key(self, profile, lat1, lon1, lat2, lon2):
+        """Clé normalisée (arrondi, sans -0.0)"""
+        p = self.precision
+        snapped = [round(v, p) + 0.0 for v in (lat1, lon1, lat2, lon2)]
+        return f"{profile}:{snapped[0]:.{p}f},{snapped[1]:.{p}f}:{snapped[2]:.{p}f},{snapped[3]:.{p}f}"
+    
+    def get(self, key):
+        """Retourne (coords, km, min) ou None"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+        
+        if self.disk is not None:
+            found, value = self.disk.lookup(key)
+            if found and value is not None:
+                route = (value[0], value[1], value[2])
+                self._store(key, route, now)
+                with self.lock:
+                    self.disk_hits += 1
+                return route
+        
+        with self.lock:
+            self.misses += 1
+        return None
+    
+    def put(self, key, route):
+        """Mémorise un itinéraire (coords, km, min)"""
+        self._store(key, route, time.time())
+        if self.disk is not None:
+            self.disk.set(key, list(route))
+    
+    def _store(self, key, route, now):
+        size = self.ENTRY_BYTES + self.POINT_BYTES * len(route[0])
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (now + self.ttl_seconds, route, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+    
+    def _remove(self, key):
+        self.nbytes -= self.entries.pop(key)[2]
+    
+    def stats(self):
+        """Compteurs du worker"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.disk_hits) / lookups, 3) if lookups else None,
+            'entries': len(self.entries),
+            'memory_mb': round(self.nbytes / (1024 * 1024), 2),
+            'disk': self.disk.stats() if self.disk is not None else None
+        }
+
+
+route_cache = RouteCache(
+    ttl_seconds=ROUTE_CACHE_TTL_HOURS * 3600,
+    max_bytes=int(ROUTE_CACHE_MAX_MB * 1024 * 1024),
+    precision=ROUTE_CACHE_PRECISION,
+    disk=PersistentCache(
+        os.path.join(CACHE_DIR, 'routes.sqlite3'),
+        ttl_seconds=ROUTE_CACHE_TTL_HOURS * 3600,
+        max_entries=ROUTE_CACHE_DISK_MAX_ENTRIES,
+        table='routes'
+    ) if ROUTE_CACHE_DISK else None
+)
+
+
+class SingleFlight:
+    """
+    Exécution unique par clé : pendant qu'un appel est en cours, les appels concurrents
+    de même clé attendent son résultat (ou son exception) au lieu de refaire le travail.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}  # clé -> {'done': Event, 'result', 'error'}
+        self.executed = 0
+        self.coalesced = 0
+        self.timeouts = 0
+    
+    def do(self, key, func, *args, timeout=None):
+        """Exécute func(*args) une seule fois pour les appels simultanés de même clé"""
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        
+        if leader:
+            try:
+                call['result'] = func(*args)
+                return call['result']
+            except Exception as e:
+                call['error'] = e
+                raise
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call['done'].set()
+        
+        logger.info(f"⏳ Chargement {key} déjà en cours, attente du résultat")
+        if not call['done'].wait(timeout):
+            with self.lock:
+                self.timeouts += 1
+            raise TimeoutError(f"Chargement {key}: délai d'attente dépassé")
+        if call['error'] is not None:
+            raise call['error']
+        return call['result']
+    
+    def stats(self):
+        """Compteurs du worker (appels exécutés, appels regroupés)"""
+        with self.lock:
+            in_flight = sorted(self.calls)
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts,
+            'in_flight': in_flight
+        }
+
+
+gtfs_loads = SingleFlight()
+
+
+class MirrorPool:
+    """
+    Miroirs interchangeables d'un même service (Overpass), interrogés en course avec relance décalée.
+    Latence moyenne (EWMA) et santé suivies par miroir pour ordonner les tentatives suivantes.
+    """
+    
+    LATENCY_ALPHA = 0.3  # Poids de la dernière mesure dans la latence moyenne
+    
+    def __init__(self, urls, hedge_delay_s, cooldown_s, executor):
+        self.urls = list(urls)
+        self.hedge_delay_s = hedge_delay_s
+        self.cooldown_s = cooldown_s
+        self.executor = executor
+        self.lock = threading.Lock()
+        self.mirrors = {
+            url: {'requests': 0, 'successes': 0, 'failures': 0, 'wins': 0, 'consecutive_failures': 0,
+                  'latency_s': None, 'failed_at': None, 'last_error': None}
+            for url in self.urls
+        }
+    
+    def ordered(self):
+        """Miroirs par préférence : sains avant ceux en échec récent, puis latence moyenne croissante"""
+        now = time.time()
+        with self.lock:
+            def rank(item):
+                position, url = item
+                mirror = self.mirrors[url]
+                cooling = bool(mirror['consecutive_failures']) and now - mirror['failed_at'] < self.cooldown_s
+                # Miroir jamais mesuré: essayé en priorité parmi les sains pour obtenir une mesure
+                return cooling, mirror['latency_s'] or 0, position
+            return [url for _, url in sorted(enumerate(self.urls), key=rank)]
+    
+    def record(self, url, elapsed, error=None):
+        """Enregistre le résultat d'une tentative"""
+        with self.lock:
+            mirror = self.mirrors[url]
+            mirror['requests'] += 1
+            if error is None:
+                mirror['successes'] += 1
+                mirror['consecutive_failures'] = 0
+                previous = mirror['latency_s']
+                mirror['latency_s'] = elapsed if previous is None else (
+                    self.LATENCY_ALPHA * elapsed + (1 - self.LATENCY_ALPHA) * previous
+                )
+            else:
+                mirror['failures'] += 1
+                mirror['consecutive_failures'] += 1
+                mirror['failed_at'] = time.time()
+                mirror['last_error'] = str(error)[:200]
+    
+    def record_win(self, url):
+        """Enregistre la réponse retenue d'une course"""
+        with self.lock:
+            self.mirrors[url]['wins'] += 1
+    
+    def _attempt(self, send, url):
+        start = time.time()
+        try:
+            result = send(url)
+        except Exception as e:
+            self.record(url, time.time() - start, e)
+            raise
+        self.record(url, time.time() - start)
+        return result
+    
+    def request(self, send):
+        """
+        Appelle send(url) sur le meilleur miroir, puis sur le suivant après hedge_delay_s sans réponse
+        ou dès un échec. Renvoie (url, résultat) de la première réussite ; les tentatives pas encore
+        démarrées sont annulées et les réponses tardives ignorées. Lève la dernière erreur si tout échoue.
+        """
+        remaining = self.ordered()
+        pending = {}
+        last_error = None
+        try:
+            while remaining or pending:
+                if remaining:
+                    url = remaining.pop(0)
+                    logger.info(f"Tentative {url}")
+                    pending[self.executor.submit(self._attempt, send, url)] = url
+                
+                done, _ = wait(pending, timeout=self.hedge_delay_s if remaining else None,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.warning(f"{url} échoué: {e}")
+                        last_error = e
+                        continue
+                    self.record_win(url)
+                    return url, result
+        finally:
+            for future in pending:
+                future.cancel()
+        
+        raise last_error or RuntimeError("Aucun miroir configuré")
+    
+    def stats(self):
+        """Santé et latence moyenne (ms) par miroir, dans l'ordre de préférence courant"""
+        order = self.ordered()
+        stats = []
+        with self.lock:
+            for url in order:
+                mirror = dict(self.mirrors[url])
+                latency_s = mirror.pop('latency_s')
+                mirror.pop('failed_at')
+                stats.append({'url': url, **mirror,
+                              'latency_ms': round(latency_s * 1000) if latency_s is not None else None})
+        return stats
+
+
+overpass_mirrors = MirrorPool(OVERPASS_MIRRORS, OVERPASS_HEDGE_DELAY_S, OVERPASS_COOLDOWN_S, overpass_executor)
+
+
+class FeedCatalog:
+    """
+    Catalogue des flux GTFS (export Mobility Database, CSV ou JSON) indexé par emprise :
+    grille de GTFS_CATALOG_CELL_DEG degrés -> flux dont l'emprise touche la cellule.
+    Les emprises très étendues (flux nationaux) sont testées à part. Le fichier est partagé
+    entre workers ; il est retéléchargé en arrière-plan quand il dépasse refresh_hours.
+    """
+    
+    MAX_CELLS = 400  # Au-delà, emprise testée pour chaque recherche plutôt qu'indexée
+    COLUMNS = {
+        'id': ('id', 'mdb_source_id'),  # Export v2, ou ancien sources.csv
+        'data_type': 'data_type',
+        'status': 'status',
+        'country': 'location.country_code',
+        'municipality': 'location.municipality',
+        'provider': 'provider',
+        'name': 'name',
+        'auth': 'urls.authentication_type',
+        'latest': 'urls.latest',
+        'direct': 'urls.direct_download',
+        'min_lat': 'location.bounding_box.minimum_latitude',
+        'max_lat': 'location.bounding_box.maximum_latitude',
+        'min_lon': 'location.bounding_box.minimum_longitude',
+        'max_lon': 'location.bounding_box.maximum_longitude',
+    }
+    
+    def __init__(self, path, url, refresh_hours, cell_deg=GTFS_CATALOG_CELL_DEG):
+        self.path = path
+        self.url = url
+        self.refresh_hours = refresh_hours
+        self.cell_deg = cell_deg
+        self.lock = threading.Lock()
+        self.pid = None
+        self.feeds = []
+        self.cells = {}
+        self.wide = []
+        self.mtime = None
+        self.loaded_at = None
+        self.last_error = None
+        self.lookups = 0
+    
+    @staticmethod
+    def parse_rows(rows):
+        """Flux GTFS utilisables d'un export : actifs, sans authentification, avec URL et emprise"""
+        columns = {name: keys if isinstance(keys, tuple) else (keys,) for name, keys in FeedCatalog.COLUMNS.items()}
+        feeds = []
+        for row in rows:
+            def field(name):
+                return next((str(row[key]).strip() for key in columns[name] if row.get(key)), '')
+            
+            if field('data_type') not in ('', 'gtfs') or field('status') in ('deprecated', 'inactive'):
+                continue
+            if field('auth') not in ('', '0'):
+                continue
+            url = field('latest') or field('direct')
+            try:
+                bbox = [float(field('min_lat')), float(field('min_lon')), float(field('max_lat')), float(field('max_lon'))]
+            except ValueError:
+                continue
+            if not url or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+                continue
+            feeds.append({
+                'id': field('id'),
+                'name': ' - '.join(part for part in (field('provider'), field('name')) if part),
+                'country': field('country'),
+                'municipality': field('municipality'),
+                'url': url,
+                'bbox': bbox
+            })
+        return feeds
+    
+    @staticmethod
+    def read(path):
+        """Flux d'un export sur disque (.json: liste d'objets aux colonnes du CSV)"""
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            if path.endswith('.json'):
+                return FeedCatalog.parse_rows(json.load(f))
+            return FeedCatalog.parse_rows(csv.DictReader(f))
+    
+    @staticmethod
+    def grid_cells(bbox, cell_deg):
+        """Cellules de la grille touchées par une emprise, None au-delà de MAX_CELLS"""
+        min_lat, min_lon, max_lat, max_lon = bbox
+        rows = range(math.floor(min_lat / cell_deg), math.floor(max_lat / cell_deg) + 1)
+        cols = range(math.floor(min_lon / cell_deg), math.floor(max_lon / cell_deg) + 1)
+        if len(rows) * len(cols) > FeedCatalog.MAX_CELLS:
+            return None
+        return [(row, col) for row in rows for col in cols]
+    
+    def build(self, feeds):
+        """Index en grille des emprises"""
+        cells = defaultdict(list)
+        wide = []
+        for i, feed in enumerate(feeds):
+            feed_cells = self.grid_cells(feed['bbox'], self.cell_deg)
+            if feed_cells is None:
+                wide.append(i)
+                continue
+            for cell in feed_cells:
+                cells[cell].append(i)
+        return dict(cells), wide
+    
+    def load(self):
+        """(Re)charge le catalogue depuis le disque ; False si absent ou illisible"""
+        try:
+            mtime = os.path.getmtime(self.path)
+            feeds = self.read(self.path)
+        except OSError:
+            return False
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning(f"Catalogue GTFS illisible ({self.path}): {e}")
+            return False
+        
+        cells, wide = self.build(feeds)
+        with self.lock:
+            self.feeds, self.cells, self.wide = feeds, cells, wide
+            self.mtime = mtime
+            self.loaded_at = datetime.now()
+        logger.info(f"✓ Catalogue GTFS: {len(feeds)} flux indexés ({self.path})")
+        return True
+    
+    def resolve(self, lat, lon, limit=5):
+        """Flux dont l'emprise contient la position, du plus local (plus petite emprise) au plus large"""
+        cell = (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+        with self.lock:
+            feeds = self.feeds
+            candidates = self.cells.get(cell, []) + self.wide
+            self.lookups += 1
+        
+        matches = []
+        for i in candidates:
+            min_lat, min_lon, max_lat, max_lon = feeds[i]['bbox']
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                matches.append(((max_lat - min_lat) * (max_lon - min_lon), i))
+        return [feeds[i] for _, i in sorted(matches)[:limit]]
+    
+    def refresh(self):
+        """Télécharge l'export (fichier temporaire validé puis remplacement atomique) et le recharge"""
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.catalog_', suffix=os.path.splitext(self.path)[1], dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with http_session('mobility_database').get(self.url, timeout=60, stream=True) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+            if not self.read(tmp_path):
+                raise ValueError("catalogue téléchargé vide")
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning(f"Rafraîchissement du catalogue GTFS échoué: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return False
+        
+        self.last_error = None
+        return self.load()
+    
+    def tick(self):
+        """
+        Relit le fichier remplacé par un autre worker, retélécharge s'il est trop ancien.
+        Un seul processus télécharge (verrou flock sur <fichier>.lock) ; les autres relisent le résultat.
+        """
+        if not self.stale():
+            return
+        lock_fd = self.try_lock()
+        if lock_fd is None:
+            return  # Téléchargement en cours dans un autre processus
+        try:
+            # Fichier remplacé entre-temps par le processus qui détenait le verrou
+            if self.stale():
+                self.refresh()
+        finally:
+            os.close(lock_fd)  # Libère le verrou
+    
+    def stale(self):
+        """Recharge le fichier s'il a changé sur disque ; True s'il est absent ou trop ancien"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return True
+        if mtime != self.mtime:
+            self.load()
+        return time.time() - mtime >= self.refresh_hours * 3600
+    
+    def try_lock(self):
+        """
+        Verrou exclusif non bloquant sur <fichier>.lock : descripteur à fermer pour le libérer,
+        None s'il est tenu ailleurs. Le noyau le libère si le processus meurt : pas de marqueur abandonné.
+        """
+        lock_path = self.path + '.lock'
+        os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+        fd = os.open(lock_path, os.O_CREAT | os.O_WRONLY, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+    
+    def ensure_started(self):
+        """Lit le catalogue sur disque et démarre son rafraîchissement en arrière-plan (une fois par processus)"""
+        pid = os.getpid()
+        if self.pid == pid:
+            return
+        with self.lock:
+            if self.pid == pid:
+                return
+            self.pid = pid
+        self.load()
+        threading.Thread(target=self._run, name='gtfs-catalog', daemon=True).start()
+    
+    def _run(self):
+        while True:
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Erreur catalogue GTFS: {e}")
+            time.sleep(GTFS_CATALOG_CHECK_S if self.mtime is not None else GTFS_CATALOG_WAIT_S)
+    
+    def status(self):
+        with self.lock:
+            return {
+                'feeds': len(self.feeds),
+                'wide_feeds': len(self.wide),
+                'loaded_at': self.loaded_at.isoformat() if self.loaded_at else None,
+                'lookups': self.lookups,
+                'last_error': self.last_error
+            }
+
+
+feed_catalog = FeedCatalog(GTFS_CATALOG_PATH, GTFS_CATALOG_URL, GTFS_CATALOG_REFRESH_HOURS)
+
+
+class LoadedFeeds(MutableMapping):
+    """
+    Flux chargés (clé de flux -> entrée de GTFSManager.cache_feed) indexés par emprise, marge
+    GTFS_COVERAGE_MARGIN_KM comprise, sur la grille de FeedCatalog : find() ne teste que les flux
+    de la cellule de la position. Accès protégés par cache_lock chez l'appelant.
+    """
+    
+    def __init__(self, entries=(), cell_deg=GTFS_CATALOG_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.entries = {}
+        self.cells = defaultdict(set)
+        self.wide = set()
+        self.update(entries)
+    
+    def __getitem__(self, key):
+        return self.entries[key]
+    
+    def __iter__(self):
+        return iter(self.entries)
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def __setitem__(self, key, entry):
+        if key in self.entries:
+            self._unindex(key, self.entries[key])
+        self.entries[key] = entry
+        cells = self._cells(entry)
+        if cells is None:
+            self.wide.add(key)
+        for cell in cells or ():
+            self.cells[cell].add(key)
+    
+    def __delitem__(self, key):
+        self._unindex(key, self.entries.pop(key))
+    
+    def _unindex(self, key, entry):
+        self.wide.discard(key)
+        for cell in self._cells(entry) or ():
+            keys = self.cells.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.cells[cell]
+    
+    def _cells(self, entry):
+        """Cellules de l'emprise élargie de la marge ; [] sans emprise, None si trop étendue"""
+        bbox = entry.get('coverage')
+        if not bbox:
+            return []
+        dlat = GTFS_COVERAGE_MARGIN_KM / StopSpatialIndex.KM_PER_DEGREE
+        dlon = dlat / max(math.cos(math.radians(max(abs(bbox[0]), abs(bbox[2])))), 0.01)
+        return FeedCatalog.grid_cells((bbox[0] - dlat, bbox[1] - dlon, bbox[2] + dlat, bbox[3] + dlon), self.cell_deg)
+    
+    def find(self, lat, lon):
+        """
+        Clé du flux couvrant la position (None sinon) : flux GTFS avant fallback OSM,
+        puis emprise la plus petite
+        """
+        cell = (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+        best = None
+        for key in self.cells.get(cell, set()) | self.wide:
+            entry = self.entries[key]
+            if GTFSManager.covers(entry, lat, lon):
+                bbox = entry['coverage']
+                rank = (entry.get('source') == 'osm', (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]))
+                if best is None or rank < best[0]:
+                    best = (rank, key)
+        return best[1] if best else None
+
+
+gtfs_cache = LoadedFeeds()
+
 
 class TransitAPIManager:
     """
@@ -47,53 +1038,40 @@ class TransitAPIManager:
         """Détecte le pays et la ville à partir des coordonnées"""
         try:
             # Utiliser Photon pour le reverse geocoding
-            url = f"https://photon.komoot.io/reverse?lon={lon}&lat={lat}"
-            response = requests.get(url, timeout=5)
+            url = f"{PHOTON_URL}/reverse?lon={lon}&lat={lat}"
+            response = http_session('photon').get(url, timeout=5)
             response.raise_for_status()
-            data = response.json()
-            
-            if data.get('features'):
-                props = data['features'][0]['properties']
-                return {
-                    'country': props.get('country', ''),
-                    'country_code': props.get('countrycode', '').upper(),
-                    'city': props.get('city') or props.get('name', ''),
-                    'state': props.get('state', '')
-                }
+            location = TransitAPIManager.parse_photon_location(response.json())
+            if location:
+                return location
         except Exception as e:
             logger.warning(f"Erreur détection localisation: {e}")
         
-        return {'country': '', 'country_code': '', 'city': '', 'state': ''}
+        return dict(UNKNOWN_LOCATION)
+    
+    @staticmethod
+    def parse_photon_location(data):
+        """Pays/ville de la première réponse Photon reverse, None si aucune"""
+        if not data.get('features'):
+            return None
+        props = data['features'][0]['properties']
+        return {
+            'country': props.get('country', ''),
+            'country_code': props.get('countrycode', '').upper(),
+            'city': props.get('city') or props.get('name', ''),
+            'state': props.get('state', '')
+        }
     
     @staticmethod
-    @lru_cache(maxsize=100)
-    def search_gtfs_feeds(lat, lon, radius_km=50):
+    def search_gtfs_feeds(lat, lon):
         """
-        Recherche les flux GTFS disponibles pour une zone géographique
-        via The Mobility Database
+        Recherche les flux GTFS couvrant une position dans le catalogue local
+        (The Mobility Database), sinon parmi les sources préconfigurées
         """
-        try:
-            logger.info(f"Recherche flux GTFS pour ({lat}, {lon})")
-            
-            # API Mobility Database pour trouver les feeds
-            url = f"{MOBILITY_DATABASE_API}/gtfs_feeds"
-            params = {
-                'lat': lat,
-                'lon': lon,
-                'radius': radius_km * 1000  # en mètres
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            
-            if response.status_code == 200:
-                feeds = response.json()
-                logger.info(f"✓ {len(feeds)} flux GTFS trouvés")
-                return feeds
-            else:
-                logger.warning(f"Mobility Database: {response.status_code}")
-                
-        except Exception as e:
-            logger.error(f"Erreur recherche GTFS: {e}")
+        feeds = feed_catalog.resolve(lat, lon)
+        if feeds:
+            logger.info(f"✓ {len(feeds)} flux GTFS au catalogue pour ({lat}, {lon})")
+            return feeds
         
         # Fallback: recherche dans une base locale
         return TransitAPIManager.get_local_gtfs_sources(lat, lon)
@@ -103,462 +1081,2262 @@ class TransitAPIManager:
         """
         Base de données locale des principales sources GTFS mondiales
         """
-        # Principales villes avec GTFS open data
-        gtfs_sources = [
-            # France - URLs DIRECTES 2025 (validées)
-            {'name': 'TBM Bordeaux', 'country': 'FR', 'lat': 44.8378, 'lon': -0.5792, 
-             'url': 'https://eu.ftp.opendatasoft.com/bdx/gtfs_bdx.zip'},
-            {'name': 'RATP Paris', 'country': 'FR', 'lat': 48.8566, 'lon': 2.3522,
-             'url': 'https://eu.ftp.opendatasoft.com/stif/gtfs-lines-last.zip'},
-            {'name': 'TCL Lyon', 'country': 'FR', 'lat': 45.7640, 'lon': 4.8357,
-             'url': 'https://eu.ftp.opendatasoft.com/sytral/GTFS/GTFS_TCL.zip'},
-            
-            # USA
-            {'name': 'MTA New York', 'country': 'US', 'lat': 40.7128, 'lon': -74.0060,
-             'url': 'http://web.mta.info/developers/data/nyct/subway/google_transit.zip'},
-            {'name': 'BART San Francisco', 'country': 'US', 'lat': 37.7749, 'lon': -122.4194,
-             'url': 'https://www.bart.gov/dev/schedules/google_transit.zip'},
-            {'name': 'CTA Chicago', 'country': 'US', 'lat': 41.8781, 'lon': -87.6298,
-             'url': 'https://www.transitchicago.com/downloads/sch_data/google_transit.zip'},
-            
-            # UK
-            {'name': 'TfL London', 'country': 'UK', 'lat': 51.5074, 'lon': -0.1278,
-             'url': 'https://api.tfl.gov.uk/timetables/tfl-gtfs.zip'},
-            
-            # Canada
-            {'name': 'STM Montreal', 'country': 'CA', 'lat': 45.5017, 'lon': -73.5673,
-             'url': 'https://www.stm.info/sites/default/files/gtfs/gtfs_stm.zip'},
-            {'name': 'TTC Toronto', 'country': 'CA', 'lat': 43.6532, 'lon': -79.3832,
-             'url': 'http://opendata.toronto.ca/toronto.transit.commission/ttc-routes-and-schedules/TTC_Routes_and_Schedules_Data.zip'},
-            
-            # Allemagne
-            {'name': 'BVG Berlin', 'country': 'DE', 'lat': 52.5200, 'lon': 13.4050,
-             'url': 'https://www.vbb.de/media/download/2029'},
-            
-            # Espagne
-            {'name': 'EMT Madrid', 'country': 'ES', 'lat': 40.4168, 'lon': -3.7038,
-             'url': 'https://opendata.emtmadrid.es/Datos-estaticos/Datos-generales-(1)'},
-            {'name': 'TMB Barcelona', 'country': 'ES', 'lat': 41.3851, 'lon': 2.1734,
-             'url': 'https://www.tmb.cat/en/barcelona/shared/gtfs'},
-            
-            # Italie
-            {'name': 'ATAC Rome', 'country': 'IT', 'lat': 41.9028, 'lon': 12.4964,
-             'url': 'https://romamobilita.it/sites/default/files/rome_gtfs.zip'},
-            {'name': 'ATM Milan', 'country': 'IT', 'lat': 45.4642, 'lon': 9.1900,
-             'url': 'https://www.atm.it/it/ViaggiaConNoi/Pagine/GTFSDataset.aspx'},
-            
-            # Pays-Bas
-            {'name': 'GVB Amsterdam', 'country': 'NL', 'lat': 52.3676, 'lon': 4.9041,
-             'url': 'https://gtfs.ovapi.nl/nl/gtfs-nl.zip'},
-            
-            # Belgique
-            {'name': 'STIB Brussels', 'country': 'BE', 'lat': 50.8503, 'lon': 4.3517,
-             'url': 'https://stibmivb.opendatasoft.com/api/explore/v2.1/catalog/datasets/gtfs-files-production/files'},
-            
-            # Suisse
-            {'name': 'SBB Swiss', 'country': 'CH', 'lat': 47.3769, 'lon': 8.5417,
-             'url': 'https://opentransportdata.swiss/en/dataset/timetable-2020-gtfs'},
-            
-            # Australie
-            {'name': 'Transport NSW Sydney', 'country': 'AU', 'lat': -33.8688, 'lon': 151.2093,
-             'url': 'https://opendata.transport.nsw.gov.au/dataset/public-transport-gtfs-realtime'},
-            {'name': 'PTV Melbourne', 'country': 'AU', 'lat': -37.8136, 'lon': 144.9631,
-             'url': 'https://data.ptv.vic.gov.au/downloads/gtfs.zip'},
-            
-            # Japon
-            {'name': 'Tokyo Metro', 'country': 'JP', 'lat': 35.6762, 'lon': 139.6503,
-             'url': 'https://api-public.odpt.org/api/v4/files/tokyometro/data/odpt_train.zip'},
-        ]
+        # Trouver la source la plus proche (distances calculées en un seul lot)
+        distances = haversine_batch(lat, lon, LOCAL_GTFS_SOURCE_LATS, LOCAL_GTFS_SOURCE_LONS)
+        nearest = int(np.argmin(distances))
+        closest = LOCAL_GTFS_SOURCES[nearest] if distances[nearest] < 100 else None  # Dans les 100km
         
-        # Trouver la source la plus proche
-        closest = None
-        min_distance = float('inf')
+        return [closest] if closest else []
+    
+    @staticmethod
+    def get_transit_data_overpass(lat, lon, radius_m=2000):
+        """
+        Récupère les données de transport en commun via Overpass API (OpenStreetMap)
+        Fallback universel quand GTFS n'est pas disponible.
+        La zone est assemblée à partir des tuiles en cache (overpass_tile_cache) ; seules les tuiles
+        manquantes sont demandées, en une requête envoyée en course aux miroirs.
+        """
+        tiles = TransitAPIManager.overpass_tiles(lat, lon, radius_m)
+        cached = TransitAPIManager.cached_overpass_tiles(tiles)
         
-        for source in gtfs_sources:
-            dist = haversine_distance(lat, lon, source['lat'], source['lon'])
-            if dist < min_distance and dist < 100:  # Dans les 100km
-                min_distance = dist
-                closest = source
+        missing = [tile for tile in tiles if tile not in cached]
+        if missing:
+            logger.info(f"Récupération données OSM Overpass ({lat}, {lon}): "
+                        f"{len(missing)}/{len(tiles)} tuiles manquantes")
+            fetched = TransitAPIManager.fetch_overpass_tiles(missing)
+            if fetched is None and not cached:
+                return {'stops': [], 'routes': []}
+            cached.update(fetched or {})
+        else:
+            logger.info(f"✓ OSM cache tuiles pour ({lat}, {lon}): {len(tiles)} tuiles")
         
-        return [closest] if closest else []
+        return TransitAPIManager.assemble_overpass_tiles(cached.values(), lat, lon, radius_m)
+    
+    @staticmethod
+    def overpass_tiles(lat, lon, radius_m):
+        """Tuiles (ligne, colonne) de la grille OVERPASS_TILE_DEG recouvrant le cercle de recherche"""
+        dlat = radius_m / 1000 / StopSpatialIndex.KM_PER_DEGREE
+        dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+        rows = range(math.floor((lat - dlat) / OVERPASS_TILE_DEG), math.floor((lat + dlat) / OVERPASS_TILE_DEG) + 1)
+        cols = range(math.floor((lon - dlon) / OVERPASS_TILE_DEG), math.floor((lon + dlon) / OVERPASS_TILE_DEG) + 1)
+        return [(row, col) for row in rows for col in cols]
+    
+    @staticmethod
+    def overpass_tile_key(tile):
+        return f"{OVERPASS_TILE_DEG:g}:{tile[0]}:{tile[1]}"
+    
+    @staticmethod
+    def cached_overpass_tiles(tiles):
+        """Tuiles présentes dans overpass_tile_cache : {tuile: données}"""
+        cached = {}
+        for tile in tiles:
+            found, tile_data = overpass_tile_cache.lookup(TransitAPIManager.overpass_tile_key(tile))
+            if found and tile_data is not None:
+                cached[tile] = tile_data
+        return cached
+    
+    @staticmethod
+    def missing_overpass_tiles(lat, lon, radius_m=2000):
+        """Tuiles de la zone absentes du cache (à télécharger avant get_transit_data_overpass)"""
+        tiles = TransitAPIManager.overpass_tiles(lat, lon, radius_m)
+        cached = TransitAPIManager.cached_overpass_tiles(tiles)
+        return [tile for tile in tiles if tile not in cached]
+    
+    @staticmethod
+    def overpass_request(tiles):
+        """Emprise commune des tuiles demandées : (lignes, colonnes, requête Overpass)"""
+        rows = range(min(row for row, _ in tiles), max(row for row, _ in tiles) + 1)
+        cols = range(min(col for _, col in tiles), max(col for _, col in tiles) + 1)
+        bbox = (rows[0] * OVERPASS_TILE_DEG, cols[0] * OVERPASS_TILE_DEG,
+                (rows[-1] + 1) * OVERPASS_TILE_DEG, (cols[-1] + 1) * OVERPASS_TILE_DEG)
+        return rows, cols, TransitAPIManager.overpass_query(bbox)
+    
+    @staticmethod
+    def check_overpass_response(data):
+        """Délai ou mémoire dépassés côté serveur: réponse 200 avec un message d'erreur"""
+        if 'runtime error' in data.get('remark', ''):
+            raise ValueError(data['remark'])
+        return data
+    
+    @staticmethod
+    def fetch_overpass_tiles(tiles):
+        """
+        Télécharge les tuiles demandées (une requête sur leur emprise commune) et les met en cache.
+        Toutes les tuiles de l'emprise sont enregistrées ; None si tous les miroirs ont échoué.
+        """
+        rows, cols, query = TransitAPIManager.overpass_request(tiles)
+        
+        def send(overpass_url):
+            response = http_session('overpass').post(overpass_url, data={'data': query}, timeout=OVERPASS_TIMEOUT_S)
+            response.raise_for_status()
+            return TransitAPIManager.check_overpass_response(response.json())
+        
+        try:
+            overpass_url, data = overpass_mirrors.request(send)
+        except Exception as e:
+            logger.error(f"Tous les serveurs Overpass ont échoué: {e}")
+            return None
+        
+        return TransitAPIManager.store_overpass_tiles(rows, cols, data, overpass_url)
+    
+    @staticmethod
+    def store_overpass_tiles(rows, cols, data, overpass_url):
+        """Parse une réponse Overpass, la répartit par tuile de l'emprise et met les tuiles en cache"""
+        osm_data = TransitAPIManager.parse_overpass(data)
+        logger.info(f"✓ OSM: {len(osm_data['stops'])} arrêts, {len(osm_data['routes'])} lignes via {overpass_url}")
+        
+        # Répartition par tuile ; une ligne est rangée dans chaque tuile contenant l'un de ses arrêts
+        fetched = {(row, col): {'stops': [], 'routes': []} for row in rows for col in cols}
+        stop_tiles = {}
+        for stop in osm_data['stops']:
+            tile = (math.floor(stop['lat'] / OVERPASS_TILE_DEG), math.floor(stop['lon'] / OVERPASS_TILE_DEG))
+            if tile in fetched:
+                fetched[tile]['stops'].append(stop)
+                stop_tiles[stop['id']] = tile
+        for route in osm_data['routes']:
+            for tile in {stop_tiles[stop_id] for stop_id in route['stop_ids'] if stop_id in stop_tiles}:
+                fetched[tile]['routes'].append(route)
+        
+        for tile, tile_data in fetched.items():
+            overpass_tile_cache.set(TransitAPIManager.overpass_tile_key(tile), tile_data)
+        return fetched
+    
+    @staticmethod
+    def assemble_overpass_tiles(tiles_data, lat, lon, radius_m):
+        """Arrêts des tuiles situés dans le rayon, et lignes desservant au moins l'un d'eux"""
+        stops = {}
+        for tile_data in tiles_data:
+            for stop in tile_data['stops']:
+                if haversine_distance(lat, lon, stop['lat'], stop['lon']) * 1000 <= radius_m:
+                    stops[stop['id']] = stop
+        
+        # Même ligne présente dans plusieurs tuiles : membres complets identiques, une seule copie
+        routes = {route['id']: route for tile_data in tiles_data for route in tile_data['routes']}
+        
+        served = []
+        for route in routes.values():
+            stop_ids = [stop_id for stop_id in route['stop_ids'] if stop_id in stops]
+            if stop_ids:
+                served.append({**route, 'stop_ids': stop_ids})
+        
+        return {'stops': list(stops.values()), 'routes': served}
+    
+    @staticmethod
+    def overpass_query(bbox):
+        """Requête Overpass unique : arrêts de l'emprise (sud, ouest, nord, est), puis lignes dont ils sont membres"""
+        south, west, north, east = bbox
+        return f"""
+        [out:json][timeout:{int(OVERPASS_TIMEOUT_S)}][bbox:{south:.6f},{west:.6f},{north:.6f},{east:.6f}];
+        (
+          node["public_transport"="stop_position"];
+          node["highway"="bus_stop"];
+          node["railway"~"^(tram_stop|station|halt|subway_entrance)$"];
+          node["amenity"="bus_station"];
+        )->.stops;
+        .stops out body;
+        rel(bn.stops)["type"="route"]["route"~"^(bus|trolleybus|tram|subway|train|light_rail)$"];
+        out body;
+        """
+    
+    @staticmethod
+    def parse_overpass(data):
+        """
+        Arrêts (nœuds nommés) et lignes (relations) d'une réponse Overpass.
+        stop_ids d'une ligne : tous ses nœuds membres, dans l'ordre de la relation (y compris hors zone) ;
+        headsign : tag to= de la relation, sinon nom de son dernier nœud membre, fixé avant tout découpage.
+        """
+        stops = []
+        routes = []
+        names = {}
+        
+        for element in data.get('elements', []):
+            if element['type'] == 'node':
+                tags = element.get('tags', {})
+                if 'name' in tags:
+                    names[f"osm_{element['id']}"] = tags['name']
+                    stops.append({
+                        'id': f"osm_{element['id']}",
+                        'name': tags.get('name', 'Unknown'),
+                        'lat': element['lat'],
+                        'lon': element['lon'],
+                        'type': tags.get('highway') or tags.get('railway') or tags.get('amenity', 'stop'),
+                        'source': 'osm'
+                    })
+            
+            elif element['type'] == 'relation':
+                tags = element.get('tags', {})
+                if 'ref' in tags or 'name' in tags:
+                    stop_ids = list(dict.fromkeys(
+                        f"osm_{member['ref']}" for member in element.get('members', []) if member['type'] == 'node'
+                    ))
+                    routes.append({
+                        'id': f"osm_route_{element['id']}",
+                        'short_name': tags.get('ref', ''),
+                        'long_name': tags.get('name', ''),
+                        'type': tags.get('route', 'bus'),
+                        'color': '#' + tags.get('colour', '0066CC').replace('#', ''),
+                        'source': 'osm',
+                        'stop_ids': stop_ids,
+                        'headsign': tags.get('to') or (names.get(stop_ids[-1], '') if stop_ids else '')
+                    })
+        
+        return {'stops': stops, 'routes': routes}
+
+
+class MappedFile(io.RawIOBase):
+    """Vue fichier (lecture seule) sur un mmap, utilisable par zipfile"""
+    
+    def __init__(self, mapped):
+        self._mapped = mapped
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def read(self, size=-1):
+        return self._mapped.read(None if size is None or size < 0 else size)
+    
+    def readinto(self, buffer):
+        data = self._mapped.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        self._mapped.seek(offset, whence)
+        return self._mapped.tell()
+    
+    def tell(self):
+        return self._mapped.tell()
+
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+class GTFSBudgetExceeded(ValueError):
+    """Flux GTFS trop volumineux pour le budget mémoire configuré"""
+
+
+class TimetableStore:
+    """
+    Stockage compact des stop_times en colonnes (array) au lieu de dicts par ligne.
+    Les lignes sont regroupées par arrêt: stop_offsets[stop_id] = (début, fin).
+    Les horaires sont en secondes depuis le début du jour de service (-1 si absent).
+    
+    Index des lignes: patterns = séquences d'arrêts distinctes par route (route_id, (stop_idx, ...)),
+    stop_patterns[stop_id] = [(pattern, position), ...]. Pour chaque pattern, les trips triés par
+    départ et leurs horaires (pattern_arrivals/pattern_departures[position * n_trips + trip]).
+    
+    Les index par arrêt et par pattern sont des tableaux CSR (stop_row_offsets, stop_pattern_*,
+    pattern_stop_offsets/pattern_stops) ; stop_offsets, stop_patterns et patterns en sont des vues.
+    """
+    
+    # Octets par ligne stop_times: colonnes (trip, arrêt, arrivée, départ, séquence) + horaires par pattern
+    ROW_BYTES = 4 + 4 + 4 + 4 + 2 + 8
+    
+    def __init__(self):
+        self.trip_ids = []      # index -> trip_id
+        self.trip_index = {}    # trip_id -> index
+        self.stop_ids = []      # index -> stop_id
+        self.stop_index = {}    # stop_id -> index
+        self.stop_offsets = {}  # stop_id -> (début, fin), vue sur stop_row_offsets
+        self.stop_row_offsets = array('i', [0])
+        self.max_time = 0
+        self.trip_idx = array('i')
+        self.arrival = array('i')
+        self.departure = array('i')
+        self.sequence = array('h')
+        
+        self.patterns = []
+        self.pattern_routes = []  # route_id distincts des patterns
+        self.pattern_route = array('i')
+        self.pattern_stop_offsets = array('i', [0])
+        self.pattern_stops = array('i')
+        self.trip_pattern = array('i')
+        self.stop_patterns = {}
+        self.stop_pattern_offsets = array('i', [0])
+        self.stop_pattern_ids = array('i')
+        self.stop_pattern_positions = array('i')
+        self.pattern_trip_offsets = array('i', [0])
+        self.pattern_trip_list = array('i')
+        self.pattern_time_offsets = array('i', [0])
+        self.pattern_arrivals = array('i')
+        self.pattern_departures = array('i')
+        
+        # Colonne temporaire pendant la construction
+        self._stop_col = array('i')
+    
+    def add(self, trip_id, stop_id, arrival_time, departure_time, stop_sequence=0):
+        """Ajoute une ligne stop_times (horaires au format GTFS HH:MM:SS)"""
+        self.append(trip_id, stop_id, parse_gtfs_time(arrival_time), parse_gtfs_time(departure_time), stop_sequence)
+    
+    def append(self, trip_id, stop_id, arrival, departure, stop_sequence=0):
+        """Ajoute une ligne stop_times (horaires déjà en secondes, -1 si absent)"""
+        trip = self.trip_index.get(trip_id)
+        if trip is None:
+            trip = self.trip_index[trip_id] = len(self.trip_ids)
+            self.trip_ids.append(trip_id)
+        
+        stop = self.stop_index.get(stop_id)
+        if stop is None:
+            stop = self.stop_index[stop_id] = len(self.stop_ids)
+            self.stop_ids.append(stop_id)
+        
+        self.trip_idx.append(trip)
+        self._stop_col.append(stop)
+        self.arrival.append(arrival)
+        self.departure.append(departure)
+        try:
+            self.sequence.append(stop_sequence)
+        except OverflowError:
+            # stop_sequence hors int16: passage en int32
+            self.sequence = array('i', self.sequence)
+            self.sequence.append(stop_sequence)
+    
+    def finalize(self, trips):
+        """
+        Construit l'index des lignes (patterns), puis regroupe les lignes par arrêt
+        (triées par heure de départ) et calcule les plages d'offsets
+        """
+        self._build_patterns(trips)
+        
+        # Tri stable (arrêt, départ) en NumPy sur des vues sans copie des colonnes
+        stop_col = np.frombuffer(self._stop_col, dtype=np.int32)
+        departure = np.frombuffer(self.departure, dtype=np.int32)
+        order = np.lexsort((departure, stop_col))
+        
+        self.trip_idx = TimetableStore._gather(self.trip_idx, order)
+        self.arrival = TimetableStore._gather(self.arrival, order)
+        self.departure = TimetableStore._gather(self.departure, order)
+        self.sequence = TimetableStore._gather(self.sequence, order)
+        
+        self.max_time = max(max(self.departure, default=0), max(self.arrival, default=0))
+        
+        # Plages par arrêt (CSR): lignes de l'arrêt s = stop_row_offsets[s]:stop_row_offsets[s + 1]
+        bounds = np.searchsorted(stop_col[order], np.arange(len(self.stop_ids) + 1))
+        self.stop_row_offsets = array('i', bounds.astype(np.int32).tobytes())
+        
+        self._stop_col = array('i')
+        self.build_views()
+        return self
+    
+    def build_views(self):
+        """Vues dict/liste (stop_offsets, stop_patterns, patterns) sur les tableaux CSR, sans copie"""
+        self.stop_offsets = CSRMapping(self.stop_ids, self.stop_index, self.stop_row_offsets,
+                                       lambda start, end: (start, end))
+        self.stop_patterns = CSRMapping(
+            self.stop_ids, self.stop_index, self.stop_pattern_offsets,
+            lambda start, end: list(zip(self.stop_pattern_ids[start:end], self.stop_pattern_positions[start:end]))
+        )
+        self.patterns = PatternTable(self.pattern_routes, self.pattern_route,
+                                     self.pattern_stop_offsets, self.pattern_stops)
+    
+    @staticmethod
+    def _gather(column, order):
+        """Colonne array réordonnée (même typecode)"""
+        result = array(column.typecode)
+        result.frombytes(np.frombuffer(column, dtype=column.typecode)[order].tobytes())
+        return result
+    
+    def _build_patterns(self, trips):
+        """Séquences d'arrêts ordonnées distinctes par route, et positions de chaque arrêt"""
+        trip_col, stop_col = self.trip_idx, self._stop_col
+        order = np.lexsort((
+            np.frombuffer(self.sequence, dtype=self.sequence.typecode),
+            np.frombuffer(trip_col, dtype=np.int32)
+        )).tolist()
+        
+        runs_by_key = defaultdict(list)  # (route_id, arrêts) -> [(premier départ, trip, début dans order)]
+        self.trip_pattern = array('i', [-1]) * len(self.trip_ids)
+        start = 0
+        for pos in range(1, len(order) + 1):
+            if pos == len(order) or trip_col[order[pos]] != trip_col[order[start]]:
+                trip = trip_col[order[start]]
+                trip_info = trips.get(self.trip_ids[trip])
+                if trip_info:
+                    key = (trip_info['route_id'], tuple(stop_col[i] for i in order[start:pos]))
+                    first_departure = max(self.departure[order[start]], self.arrival[order[start]])
+                    runs_by_key[key].append((first_departure, trip, start))
+                start = pos
+        
+        # Un pattern par séquence, scindé quand un trip en dépasse un autre : les colonnes
+        # d'horaires de chaque pattern restent triées à chaque position (bisect du calculateur)
+        patterns = []
+        pattern_trips = []  # pattern -> [(trip, arrivées, départs)] triés
+        for key, runs in runs_by_key.items():
+            n_stops = len(key[1])
+            groups = []
+            for _, trip, first in sorted(runs):
+                arrivals, departures = self._trip_times(order, first, n_stops)
+                for group in groups:
+                    _, last_arrivals, last_departures = group[-1]
+                    if all(a >= b for a, b in zip(arrivals, last_arrivals)) and \
+                            all(d >= b for d, b in zip(departures, last_departures)):
+                        group.append((trip, arrivals, departures))
+                        break
+                else:
+                    groups.append([(trip, arrivals, departures)])
+            for group in groups:
+                for trip, _, _ in group:
+                    self.trip_pattern[trip] = len(patterns)
+                patterns.append(key)
+                pattern_trips.append(group)
+        
+        # Horaires par pattern (tableaux plats, disposition position-major) pour le calculateur
+        self.pattern_trip_offsets = array('i', [0])
+        self.pattern_trip_list = array('i')
+        self.pattern_time_offsets = array('i', [0])
+        self.pattern_arrivals = array('i')
+        self.pattern_departures = array('i')
+        for pattern, (_, stops) in enumerate(patterns):
+            group = pattern_trips[pattern]
+            n_trips, n_stops = len(group), len(stops)
+            arrivals = array('i', [0]) * (n_trips * n_stops)
+            departures = array('i', [0]) * (n_trips * n_stops)
+            for k, (_, trip_arrivals, trip_departures) in enumerate(group):
+                arrivals[k::n_trips] = trip_arrivals
+                departures[k::n_trips] = trip_departures
+            
+            self.pattern_trip_list.extend(trip for trip, _, _ in group)
+            self.pattern_trip_offsets.append(len(self.pattern_trip_list))
+            self.pattern_arrivals.extend(arrivals)
+            self.pattern_departures.extend(departures)
+            self.pattern_time_offsets.append(len(self.pattern_arrivals))
+        
+        # Séquences d'arrêts par pattern (CSR)
+        self.pattern_routes, self.pattern_route = GTFSSnapshot._strings(route_id for route_id, _ in patterns)
+        self.pattern_stop_offsets = array('i', [0])
+        self.pattern_stops = array('i')
+        stop_patterns = defaultdict(list)
+        for pattern, (_, stops) in enumerate(patterns):
+            self.pattern_stops.extend(stops)
+            self.pattern_stop_offsets.append(len(self.pattern_stops))
+            for position, stop in enumerate(stops):
+                stop_patterns[stop].append((pattern, position))
+        
+        # (pattern, position) par arrêt (CSR, indexé par stop_idx)
+        self.stop_pattern_offsets = array('i', [0])
+        self.stop_pattern_ids = array('i')
+        self.stop_pattern_positions = array('i')
+        for stop in range(len(self.stop_ids)):
+            for pattern, position in stop_patterns.get(stop, ()):
+                self.stop_pattern_ids.append(pattern)
+                self.stop_pattern_positions.append(position)
+            self.stop_pattern_offsets.append(len(self.stop_pattern_ids))
+    
+    def _trip_times(self, order, first, n_stops):
+        """Arrivées et départs d'un trip à chaque arrêt (lignes order[first:first + n_stops])"""
+        arrivals = array('i', [0]) * n_stops
+        departures = array('i', [0]) * n_stops
+        last = 0
+        for i in range(n_stops):
+            row = order[first + i]
+            arrival, departure = self.arrival[row], self.departure[row]
+            # Arrêt non minuté: reprendre le dernier horaire connu
+            if arrival < 0:
+                arrival = departure if departure >= 0 else last
+            if departure < 0:
+                departure = arrival
+            last = departure
+            arrivals[i] = arrival
+            departures[i] = departure
+        return arrivals, departures
+    
+    def __len__(self):
+        return len(self.trip_idx)
+    
+    def has_stop(self, stop_id):
+        return stop_id in self.stop_offsets
+    
+    def rows(self, stop_id):
+        """Itère (trip_idx, arrivée, départ, séquence) pour un arrêt"""
+        start, end = self.stop_offsets.get(stop_id, (0, 0))
+        for i in range(start, end):
+            yield self.trip_idx[i], self.arrival[i], self.departure[i], self.sequence[i]
+    
+    def departures_after(self, stop_id, seconds):
+        """
+        Départs d'un arrêt à partir de `seconds` (heure du jour), en ordre chronologique:
+        itère (secondes depuis minuit aujourd'hui, trip_idx, jour de service: 0 = aujourd'hui, -1 = veille).
+        Les horaires >= 24:00 du jour de service précédent sont inclus.
+        """
+        start, end = self.stop_offsets.get(stop_id, (0, 0))
+        departure = self.departure
+        trip_idx = self.trip_idx
+        
+        def scan(first, shift, service_day):
+            for i in range(first, end):
+                yield departure[i] - shift, trip_idx[i], service_day
+        
+        today = bisect_left(departure, seconds, start, end)
+        previous_day = bisect_left(departure, seconds + SECONDS_PER_DAY, start, end)
+        return heapq.merge(scan(today, 0, 0), scan(previous_day, SECONDS_PER_DAY, -1))
+    
+    def routes_at(self, stop_id):
+        """Routes desservant un arrêt (via les patterns)"""
+        return {self.patterns[pattern][0] for pattern, _ in self.stop_patterns.get(stop_id, ())}
+    
+    def routes_between(self, start_stop_id, end_stop_id):
+        """Routes passant par le départ PUIS par l'arrivée (même pattern, position croissante)"""
+        first_position = {}
+        for pattern, position in self.stop_patterns.get(start_stop_id, ()):
+            if position < first_position.get(pattern, position + 1):
+                first_position[pattern] = position
+        
+        routes = set()
+        for pattern, position in self.stop_patterns.get(end_stop_id, ()):
+            if first_position.get(pattern, position) < position:
+                routes.add(self.patterns[pattern][0])
+        return routes
+    
+    def trips_at(self, stop_id):
+        """Index des trips passant par un arrêt"""
+        start, end = self.stop_offsets.get(stop_id, (0, 0))
+        return self.trip_idx[start:end]
+    
+    @property
+    def nbytes(self):
+        """Taille mémoire des colonnes (octets)"""
+        return sum(col.itemsize * len(col) for col in (self.trip_idx, self.arrival, self.departure, self.sequence))
+    
+    @property
+    def pattern_nbytes(self):
+        """Taille mémoire des tableaux par pattern et des index CSR (octets)"""
+        columns = (self.trip_pattern, self.pattern_trip_offsets, self.pattern_trip_list,
+                   self.pattern_time_offsets, self.pattern_arrivals, self.pattern_departures,
+                   self.pattern_route, self.pattern_stop_offsets, self.pattern_stops, self.stop_row_offsets,
+                   self.stop_pattern_offsets, self.stop_pattern_ids, self.stop_pattern_positions)
+        return sum(col.itemsize * len(col) for col in columns)
+
+
+class ServiceCalendar:
+    """
+    Calendrier de service d'un flux (calendar.txt + calendar_dates.txt) en colonnes :
+    règles hebdomadaires par service (jours en bits, lundi = bit 0, dates en ordinaux) et exceptions
+    triées par date (1 = ajout, 2 = suppression). Pour chaque date, bytearray des services actifs
+    indexé par service, précalculé sur un horizon glissant puis calculé à la demande.
+    trip_service[trip_idx] : service du trip (dernier index = service inconnu, toujours actif).
+    """
+    
+    def __init__(self, service_ids, weekdays, start_dates, end_dates,
+                 exception_services, exception_dates, exception_types, trip_service=None):
+        self.service_ids = list(service_ids)
+        self.service_index = {service_id: i for i, service_id in enumerate(self.service_ids)}
+        self.weekdays = weekdays
+        self.start_dates = start_dates
+        self.end_dates = end_dates
+        self.exception_services = exception_services
+        self.exception_dates = exception_dates
+        self.exception_types = exception_types
+        self.trip_service = trip_service if trip_service is not None else array('i')
+        self.days = {}  # ordinal -> services actifs
+        self.days_lock = threading.Lock()  # Partagé par les threads de requêtes, de lots et du planificateur
+    
+    @staticmethod
+    def build(rules, exceptions):
+        """
+        rules: [(service_id, masque des jours, date de début, date de fin)] (dates en ordinaux),
+        exceptions: [(service_id, date, type)]
+        """
+        services = {}
+        for service_id, *_ in list(rules) + list(exceptions):
+            services.setdefault(service_id, len(services))
+        
+        weekdays = array('b', [0]) * len(services)
+        start_dates = array('i', [0]) * len(services)
+        end_dates = array('i', [-1]) * len(services)  # Service sans règle: actif par exceptions seulement
+        for service_id, mask, start, end in rules:
+            i = services[service_id]
+            weekdays[i], start_dates[i], end_dates[i] = mask, start, end
+        
+        exceptions = sorted(exceptions, key=lambda exception: exception[1])
+        return ServiceCalendar(
+            services, weekdays, start_dates, end_dates,
+            array('i', (services[service_id] for service_id, _, _ in exceptions)),
+            array('i', (day for _, day, _ in exceptions)),
+            array('b', (kind for _, _, kind in exceptions))
+        )
+    
+    def bind(self, trip_ids, trips):
+        """Colonne trip_idx -> service (alignée sur les trip_ids du timetable)"""
+        unknown = len(self.service_ids)
+        self.trip_service = array('i', (
+            self.service_index.get(trips[trip_id]['service_id'], unknown) if trip_id in trips else unknown
+            for trip_id in trip_ids
+        ))
+        return self
+    
+    def active_services(self, day):
+        """Services actifs à une date (bytearray indexé par service, + service inconnu actif)"""
+        ordinal = day.toordinal()
+        services = self.days.get(ordinal)
+        if services is not None:
+            return services
+        
+        weekday = day.weekday()
+        weekdays = np.frombuffer(self.weekdays, dtype=np.int8)
+        active = ((weekdays >> weekday) & 1).astype(bool)
+        active &= np.frombuffer(self.start_dates, dtype=np.int32) <= ordinal
+        active &= np.frombuffer(self.end_dates, dtype=np.int32) >= ordinal
+        
+        dates = np.frombuffer(self.exception_dates, dtype=np.int32)
+        first, last = np.searchsorted(dates, ordinal, 'left'), np.searchsorted(dates, ordinal, 'right')
+        for i in range(first, last):
+            active[self.exception_services[i]] = self.exception_types[i] == 1
+        
+        services = bytearray(active.astype(np.uint8).tobytes()) + b'\x01'
+        with self.days_lock:
+            # Horizon glissant : les jours les plus anciens sont oubliés
+            if len(self.days) > 2 * GTFS_CALENDAR_HORIZON_DAYS + 2:
+                del self.days[min(self.days)]
+            return self.days.setdefault(ordinal, services)
+    
+    def precompute(self, first_day, days=GTFS_CALENDAR_HORIZON_DAYS):
+        """Calcule les services actifs des jours de l'horizon"""
+        for offset in range(days + 1):
+            self.active_services(first_day + timedelta(days=offset))
+    
+    def trip_filter(self, day):
+        """Prédicat active_trip(trip_idx) pour un jour de service, en O(1) par trip"""
+        services = self.active_services(day)
+        trip_service = self.trip_service
+        return lambda trip_idx: services[trip_service[trip_idx]]
+    
+    @property
+    def nbytes(self):
+        columns = (self.weekdays, self.start_dates, self.end_dates, self.exception_services,
+                   self.exception_dates, self.exception_types, self.trip_service)
+        return sum(col.itemsize * len(col) for col in columns)
+
+
+class RouteMembership:
+    """
+    Appartenance arrêts <-> lignes des relations OSM, en listes d'adjacence compactes (CSR):
+    route_stops[route_offsets[r]:route_offsets[r + 1]] = arrêts de la ligne r dans l'ordre de la relation,
+    stop_routes[stop_offsets[s]:stop_offsets[s + 1]] = lignes desservant l'arrêt s.
+    Pas d'horaires : les départs estimés sont générés à la demande (fréquence par type de ligne).
+    """
+    
+    HEADWAY_MINUTES = {'subway': 5, 'tram': 8, 'light_rail': 10, 'trolleybus': 12, 'bus': 15, 'train': 30}
+    DEFAULT_HEADWAY_MINUTES = 15
+    
+    def __init__(self, stop_ids, route_stop_ids, route_types=None, route_headsigns=None):
+        """
+        stop_ids: arrêts connus ; route_stop_ids: route_id -> arrêts membres (ordonnés) ;
+        route_types: route_id -> type OSM (bus, tram...) pour la fréquence estimée ;
+        route_headsigns: route_id -> direction de la relation complète (tag to=, sinon son dernier arrêt)
+        """
+        self.stop_ids = list(stop_ids)
+        self.stop_index = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+        self.route_ids = []
+        self.headsigns = []
+        self.route_offsets = array('i', [0])
+        self.route_stops = array('i')
+        self.headways = array('h')
+        
+        for route_id, members in route_stop_ids.items():
+            members = [self.stop_index[stop_id] for stop_id in members if stop_id in self.stop_index]
+            if not members:
+                continue
+            route_type = str((route_types or {}).get(route_id, '')).lower()
+            self.route_ids.append(route_id)
+            self.headsigns.append((route_headsigns or {}).get(route_id) or '')
+            self.route_stops.extend(members)
+            self.route_offsets.append(len(self.route_stops))
+            self.headways.append(self.HEADWAY_MINUTES.get(route_type, self.DEFAULT_HEADWAY_MINUTES) * 60)
+        self.route_index = {route_id: r for r, route_id in enumerate(self.route_ids)}
+        
+        # Transposée: lignes par arrêt (tri par arrêt avec numpy)
+        route_col = np.repeat(np.arange(len(self.route_ids), dtype=np.int32), np.diff(self.route_offsets))
+        stop_col = np.frombuffer(self.route_stops, dtype=np.int32)
+        pairs = np.unique(np.stack([stop_col, route_col], axis=1), axis=0) if len(stop_col) else np.empty((0, 2), np.int32)
+        self.stop_routes = array('i', pairs[:, 1].astype(np.int32).tobytes())
+        bounds = np.searchsorted(pairs[:, 0], np.arange(len(self.stop_ids) + 1))
+        self.stop_offsets = array('i', bounds.astype(np.int32).tobytes())
+    
+    def __len__(self):
+        return len(self.route_stops)
+    
+    def has_stop(self, stop_id):
+        i = self.stop_index.get(stop_id)
+        return i is not None and self.stop_offsets[i] < self.stop_offsets[i + 1]
+    
+    def _routes(self, stop_id):
+        i = self.stop_index.get(stop_id)
+        if i is None:
+            return ()
+        return self.stop_routes[self.stop_offsets[i]:self.stop_offsets[i + 1]]
+    
+    def routes_at(self, stop_id):
+        """Lignes dont la relation contient l'arrêt"""
+        return {self.route_ids[r] for r in self._routes(stop_id)}
+    
+    def routes_between(self, start_stop_id, end_stop_id):
+        """Lignes passant par le départ PUIS par l'arrivée (ordre des membres de la relation)"""
+        start, end = self.stop_index.get(start_stop_id), self.stop_index.get(end_stop_id)
+        routes = set()
+        for r in set(self._routes(start_stop_id)) & set(self._routes(end_stop_id)):
+            members = self.route_stops[self.route_offsets[r]:self.route_offsets[r + 1]]
+            first = members.index(start)
+            if end in members[first + 1:]:
+                routes.add(self.route_ids[r])
+        return routes
+    
+    def terminus(self, route_id):
+        """Dernier arrêt connu de la ligne (dans la zone chargée)"""
+        r = self.route_index[route_id]
+        return self.stop_ids[self.route_stops[self.route_offsets[r + 1] - 1]]
+    
+    def headsign(self, route_id):
+        """Direction de la relation, '' si inconnue"""
+        return self.headsigns[self.route_index[route_id]]
+    
+    def departures_after(self, stop_id, seconds, route_filter=None):
+        """
+        Départs estimés d'un arrêt à partir de `seconds`, en ordre chronologique et générés à la demande :
+        itère (secondes depuis minuit, route_id). Chaque ligne passe toutes les `headway` secondes,
+        avec un décalage propre à la ligne.
+        """
+        def scan(r):
+            headway = self.headways[r]
+            phase = (r * 7 * 60) % headway
+            first = seconds + (phase - seconds) % headway
+            for departure in itertools.count(first, headway):
+                yield departure, self.route_ids[r]
+        
+        routes = [r for r in self._routes(stop_id) if not route_filter or self.route_ids[r] in route_filter]
+        return heapq.merge(*(scan(r) for r in routes))
+    
+    @property
+    def nbytes(self):
+        """Taille mémoire des listes d'adjacence (octets)"""
+        columns = (self.route_offsets, self.route_stops, self.headways, self.stop_offsets, self.stop_routes)
+        return sum(col.itemsize * len(col) for col in columns)
+
+
+class StopSpatialIndex:
+    """
+    Index spatial des arrêts (grille lat/lon uniforme), construit une fois au chargement.
+    Requêtes par rayon et k plus proches, distances haversine exactes.
+    """
+    
+    KM_PER_DEGREE = 6371 * math.pi / 180
+    
+    def __init__(self, stops, cell_deg=0.01):
+        self.cell_deg = cell_deg
+        self.columns = int(round(360 / cell_deg))
+        if isinstance(stops, StopTable):
+            # Instantané : coordonnées lues dans les colonnes mmap, sans dict par arrêt
+            self.stop_ids = stops.stop_ids
+            self.lats = np.frombuffer(stops.lat_col, dtype=np.float64)
+            self.lons = np.frombuffer(stops.lon_col, dtype=np.float64)
+        else:
+            self.stop_ids = list(stops)  # Ordre d'insertion conservé
+            self.lats = np.array([stops[sid]['lat'] for sid in self.stop_ids], dtype=np.float64)
+            self.lons = np.array([stops[sid]['lon'] for sid in self.stop_ids], dtype=np.float64)
+        
+        self.cells = defaultdict(list)
+        for pos, (lat, lon) in enumerate(zip(self.lats.tolist(), self.lons.tolist())):
+            self.cells[self._cell(lat, lon)].append(pos)
+    
+    def __len__(self):
+        return len(self.stop_ids)
+    
+    def _cell(self, lat, lon):
+        row = math.floor(lat / self.cell_deg)
+        col = math.floor(lon / self.cell_deg) % self.columns
+        return row, col
+    
+    def _candidates(self, lat, lon, radius_km):
+        """Positions des arrêts des cellules couvrant le cercle (ordre d'insertion)"""
+        dlat = radius_km / self.KM_PER_DEGREE
+        max_lat = min(abs(lat) + dlat, 90.0)
+        cos_lat = math.cos(math.radians(max_lat))
+        dlon = 180.0 if cos_lat < 1e-6 else min(dlat / cos_lat, 180.0)
+        
+        row_min = math.floor((lat - dlat) / self.cell_deg)
+        row_max = math.floor((lat + dlat) / self.cell_deg)
+        col_min = math.floor((lon - dlon) / self.cell_deg)
+        col_max = math.floor((lon + dlon) / self.cell_deg)
+        
+        n_cells = (row_max - row_min + 1) * min(col_max - col_min + 1, self.columns)
+        if n_cells >= len(self.cells):
+            # Zone trop large: parcours complet plus rapide que la grille
+            return np.arange(len(self.stop_ids))
+        
+        positions = []
+        cols = {col % self.columns for col in range(col_min, col_max + 1)}
+        for row in range(row_min, row_max + 1):
+            for col in cols:
+                cell = self.cells.get((row, col))
+                if cell:
+                    positions.extend(cell)
+        return np.sort(np.array(positions, dtype=np.int64))
+    
+    def within(self, lat, lon, radius_km, sort=True):
+        """Arrêts dans le rayon: [(stop_id, distance_km)] triés par distance (sinon ordre d'insertion)"""
+        positions = self._candidates(lat, lon, radius_km)
+        distances = haversine_batch(lat, lon, self.lats[positions], self.lons[positions])
+        
+        mask = distances <= radius_km
+        positions, distances = positions[mask], distances[mask]
+        if sort:
+            order = np.argsort(distances, kind='stable')
+            positions, distances = positions[order], distances[order]
+        
+        return [(self.stop_ids[pos], distance) for pos, distance in zip(positions.tolist(), distances.tolist())]
+    
+    def nearest(self, lat, lon, k=1, max_radius_km=None):
+        """k arrêts les plus proches (rayon de recherche croissant)"""
+        if not self.stop_ids:
+            return []
+        
+        limit = max_radius_km if max_radius_km is not None else math.pi * 6371
+        radius = min(0.5, limit)
+        while True:
+            results = self.within(lat, lon, radius)
+            if len(results) >= k or radius >= limit:
+                return results[:k]
+            radius = min(radius * 2, limit)
+
+
+class JourneyPlanner:
+    """
+    Calculateur d'itinéraires RAPTOR sur les horaires GTFS chargés.
+    Tours successifs (1 tour = 1 trajet en véhicule), correspondances à pied entre arrêts proches.
+    """
+    
+    INFINITY = 2 ** 31 - 1
+    
+    def __init__(self, timetable, stops, footpath_radius_km=None, walk_speed_kmh=None, footpaths=None):
+        self.timetable = timetable
+        self.walk_speed_kmh = walk_speed_kmh or WALK_SPEED_KMH
+        self.footpath_radius_km = footpath_radius_km or FOOTPATH_RADIUS_KM
+        if footpaths is not None:
+            # Correspondances précalculées (instantané)
+            self.foot_offsets, self.foot_targets, self.foot_seconds = footpaths
+        else:
+            self._build_footpaths(stops, self.footpath_radius_km)
+    
+    def _build_footpaths(self, stops, radius_km):
+        """Correspondances à pied (CSR) entre arrêts du timetable à moins de radius_km"""
+        stop_ids = self.timetable.stop_ids
+        n_stops = len(stop_ids)
+        lats = np.array([stops[sid]['lat'] if sid in stops else np.nan for sid in stop_ids], dtype=np.float64)
+        lons = np.array([stops[sid]['lon'] if sid in stops else np.nan for sid in stop_ids], dtype=np.float64)
+        
+        # Grille dont les cellules font au moins radius_km de côté
+        valid = ~np.isnan(lats)
+        cell_lat = radius_km / StopSpatialIndex.KM_PER_DEGREE
+        max_abs_lat = float(np.max(np.abs(lats[valid]))) if valid.any() else 0.0
+        cell_lon = min(cell_lat / max(math.cos(math.radians(max_abs_lat)), 0.01), 360.0)
+        
+        cells = defaultdict(list)
+        for pos in np.flatnonzero(valid).tolist():
+            cells[(math.floor(lats[pos] / cell_lat), math.floor(lons[pos] / cell_lon))].append(pos)
+        
+        walks = defaultdict(list)
+        for (row, col), members in cells.items():
+            neighbours = [pos for dr in (-1, 0, 1) for dc in (-1, 0, 1)
+                          for pos in cells.get((row + dr, col + dc), ())]
+            distances = haversine_matrix(lats[members], lons[members], lats[neighbours], lons[neighbours])
+            for i, j in zip(*np.nonzero(distances <= radius_km)):
+                source, target = members[i], neighbours[j]
+                if source != target:
+                    walks[source].append((target, int(math.ceil(distances[i, j] / self.walk_speed_kmh * 3600))))
+        
+        self.foot_offsets = array('i', [0])
+        self.foot_targets = array('i')
+        self.foot_seconds = array('i')
+        for stop in range(n_stops):
+            for target, seconds in walks.get(stop, ()):
+                self.foot_targets.append(target)
+                self.foot_seconds.append(seconds)
+            self.foot_offsets.append(len(self.foot_targets))
+    
+    def plan(self, sources, targets, departure, max_transfers=None, trip_filter=None):
+        """
+        Itinéraire arrivant au plus tôt.
+        sources: {stop_id: secondes de marche d'accès}, targets: {stop_id: secondes de marche finale},
+        departure: secondes depuis minuit. Retourne un dict (legs, horaires) ou None.
+        trip_filter(shift): prédicat active_trip(trip_idx) pour le jour de service décalé de `shift`
+        secondes (0 = jour du départ, 86400 = veille), ex. ServiceCalendar.trip_filter.
+        """
+        timetable = self.timetable
+        max_transfers = MAX_TRANSFERS if max_transfers is None else max_transfers
+        source_idx = {timetable.stop_index[sid]: secs for sid, secs in sources.items() if sid in timetable.stop_index}
+        target_idx = {timetable.stop_index[sid]: secs for sid, secs in targets.items() if sid in timetable.stop_index}
+        if not source_idx or not target_idx:
+            return None
+        
+        best = None
+        # Trips après minuit du jour de service précédent (horaires >= 24:00)
+        for shift in (0, SECONDS_PER_DAY):
+            if shift and departure + shift > timetable.max_time:
+                break
+            journey = self._raptor(source_idx, target_idx, departure + shift, max_transfers + 1,
+                                   trip_filter(shift) if trip_filter else None)
+            if journey and (best is None or journey['arrival'] - shift < best['arrival']):
+                best = self._shift(journey, shift)
+        return best
+    
+    @staticmethod
+    def _shift(journey, shift):
+        """Ramène les horaires d'un itinéraire du jour de service précédent à aujourd'hui"""
+        if not shift:
+            return journey
+        journey['departure'] -= shift
+        journey['arrival'] -= shift
+        for leg in journey['legs']:
+            leg['departure'] -= shift
+            leg['arrival'] -= shift
+        return journey
+    
+    def _raptor(self, sources, targets, departure, max_rounds, active_trip):
+        """Algorithme RAPTOR (earliest arrival) sur les patterns du timetable"""
+        tt = self.timetable
+        INF = self.INFINITY
+        n_stops = len(tt.stop_ids)
+        sp_offsets, sp_ids, sp_positions = tt.stop_pattern_offsets, tt.stop_pattern_ids, tt.stop_pattern_positions
+        pattern_stops, pattern_stop_offsets = tt.pattern_stops, tt.pattern_stop_offsets
+        
+        best = array('i', [INF]) * n_stops
+        labels = [array('i', [INF]) * n_stops]
+        parents = [{}]
+        
+        marked = set()
+        for stop, access in sources.items():
+            labels[0][stop] = best[stop] = departure + access
+            parents[0][stop] = ('access', access)
+            marked.add(stop)
+        self._relax_footpaths(labels[0], best, parents[0], marked, INF)
+        
+        # Au moins un trajet en véhicule: pas de cible au tour 0 (marche seule)
+        target_best, target_label = INF, None
+        for k in range(1, max_rounds + 1):
+            previous = labels[k - 1]
+            current = array('i', previous)
+            parent = {}
+            
+            # Patterns à parcourir depuis la première position marquée
+            queue = {}
+            for stop in marked:
+                for i in range(sp_offsets[stop], sp_offsets[stop + 1]):
+                    pattern, position = sp_ids[i], sp_positions[i]
+                    if position < queue.get(pattern, INF):
+                        queue[pattern] = position
+            
+            marked = set()
+            for pattern, first_position in queue.items():
+                stops = pattern_stops[pattern_stop_offsets[pattern]:pattern_stop_offsets[pattern + 1]]
+                trip_start = tt.pattern_trip_offsets[pattern]
+                n_trips = tt.pattern_trip_offsets[pattern + 1] - trip_start
+                base = tt.pattern_time_offsets[pattern]
+                
+                trip, board_position = -1, -1
+                for position in range(first_position, len(stops)):
+                    stop = stops[position]
+                    offset = base + position * n_trips
+                    
+                    if trip >= 0:
+                        arrival = tt.pattern_arrivals[offset + trip]
+                        if arrival < best[stop] and arrival < target_best:
+                            current[stop] = best[stop] = arrival
+                            parent[stop] = ('ride', pattern, trip, board_position, position)
+                            marked.add(stop)
+                    
+                    # Peut-on prendre un trip plus tôt à cet arrêt ?
+                    ready = previous[stop]
+                    if ready < INF and (trip < 0 or ready <= tt.pattern_departures[offset + trip]):
+                        j = bisect_left(tt.pattern_departures, ready, offset, offset + n_trips) - offset
+                        if active_trip is not None:
+                            while j < n_trips and not active_trip(tt.pattern_trip_list[trip_start + j]):
+                                j += 1
+                        if j < n_trips and (trip < 0 or j < trip):
+                            trip, board_position = j, position
+            
+            self._relax_footpaths(current, best, parent, marked, target_best)
+            labels.append(current)
+            parents.append(parent)
+            
+            for stop, egress in targets.items():
+                if stop in parent and current[stop] + egress < target_best:
+                    target_best, target_label = current[stop] + egress, (k, stop)
+            
+            if not marked:
+                break
+        
+        if target_label is None:
+            return None
+        return self._reconstruct(parents, target_label, departure, targets)
+    
+    def _relax_footpaths(self, labels, best, parent, marked, bound):
+        """Correspondances à pied depuis les arrêts améliorés (pas de marche enchaînée)"""
+        for stop in list(marked):
+            if parent.get(stop, ('walk',))[0] == 'walk':
+                continue
+            for i in range(self.foot_offsets[stop], self.foot_offsets[stop + 1]):
+                target = self.foot_targets[i]
+                arrival = labels[stop] + self.foot_seconds[i]
+                if arrival < best[target] and arrival < bound:
+                    labels[target] = best[target] = arrival
+                    parent[target] = ('walk', stop, self.foot_seconds[i])
+                    marked.add(target)
+    
+    def _reconstruct(self, parents, target_label, departure, targets):
+        """Remonte les étiquettes pour construire les étapes de l'itinéraire"""
+        tt = self.timetable
+        k, stop = target_label
+        legs = []
+        access = 0
+        while True:
+            while stop not in parents[k]:
+                k -= 1
+            kind, *info = parents[k][stop]
+            if kind == 'access':
+                access = info[0]
+                break
+            if kind == 'walk':
+                origin, seconds = info
+                legs.append({'type': 'walk', 'from_stop': tt.stop_ids[origin], 'to_stop': tt.stop_ids[stop],
+                             'duration': seconds})
+                stop = origin
+                continue
+            
+            pattern, trip, board_position, alight_position = info
+            stops = tt.patterns[pattern][1]
+            trip_start = tt.pattern_trip_offsets[pattern]
+            n_trips = tt.pattern_trip_offsets[pattern + 1] - trip_start
+            base = tt.pattern_time_offsets[pattern]
+            legs.append({
+                'type': 'transit',
+                'route_id': tt.patterns[pattern][0],
+                'trip_id': tt.trip_ids[tt.pattern_trip_list[trip_start + trip]],
+                'from_stop': tt.stop_ids[stops[board_position]],
+                'to_stop': tt.stop_ids[stops[alight_position]],
+                'stops': [tt.stop_ids[s] for s in stops[board_position:alight_position + 1]],
+                'departure': tt.pattern_departures[base + board_position * n_trips + trip],
+                'arrival': tt.pattern_arrivals[base + alight_position * n_trips + trip]
+            })
+            stop = stops[board_position]
+            k -= 1
+        
+        legs.reverse()
+        
+        # Horaires des étapes à pied et temps d'attente
+        clock = departure + access
+        wait = ride = 0
+        for leg in legs:
+            if leg['type'] == 'walk':
+                leg['departure'] = clock
+                leg['arrival'] = clock = clock + leg['duration']
+            else:
+                wait += leg['departure'] - clock
+                ride += leg['arrival'] - leg['departure']
+                clock = leg['arrival']
+        
+        transit_legs = [leg for leg in legs if leg['type'] == 'transit']
+        return {
+            'start_stop': tt.stop_ids[stop],  # Arrêt atteint par la marche d'accès
+            'board_stop': transit_legs[0]['from_stop'],
+            'end_stop': tt.stop_ids[target_label[1]],
+            'departure': departure,
+            'arrival': clock + targets[target_label[1]],
+            'access': access,
+            'egress': targets[target_label[1]],
+            'wait': wait,
+            'ride': ride,
+            'transfers': max(len(transit_legs) - 1, 0),
+            'legs': legs
+        }
+
+
+class StringTable(Sequence):
+    """
+    Table de chaînes en tableaux (instantané) : octets UTF-8 concaténés, offsets (CSR) et positions
+    triées par valeur. Les chaînes sont décodées à la demande, position() cherche par dichotomie.
+    """
+    
+    def __init__(self, blob, offsets, order):
+        self.blob = blob
+        self.offsets = offsets
+        self.order = order
+    
+    @staticmethod
+    def build(values):
+        """Table construite depuis une liste de chaînes"""
+        values = list(values)
+        encoded = [value.encode('utf-8') for value in values]
+        offsets = array('i', [0])
+        for chunk in encoded:
+            offsets.append(offsets[-1] + len(chunk))
+        order = array('i', sorted(range(len(values)), key=values.__getitem__))
+        return StringTable(array('B', b''.join(encoded)), offsets, order)
+    
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+    
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def position(self, value):
+        """Position d'une chaîne (None si absente)"""
+        i = bisect_left(self.order, value, key=self.__getitem__)
+        if i < len(self.order) and self[self.order[i]] == value:
+            return self.order[i]
+        return None
+
+
+class StringIndex(Mapping):
+    """Index chaîne -> position d'une StringTable : se lit comme le dict construit au parsing"""
+    
+    def __init__(self, table):
+        self.table = table
+    
+    def __getitem__(self, value):
+        position = self.table.position(value) if isinstance(value, str) else None
+        if position is None:
+            raise KeyError(value)
+        return position
+    
+    def __iter__(self):
+        return iter(self.table)
+    
+    def __len__(self):
+        return len(self.table)
+
+
+class CSRMapping(Mapping):
+    """
+    Vue dict clé -> valeur sur un index CSR : offsets[i]:offsets[i + 1] = plage de la clé de position i,
+    valeur lue à la demande par value(début, fin). Les clés sans élément sont absentes.
+    """
+    
+    def __init__(self, ids, index, offsets, value):
+        self.ids = ids
+        self.index = index
+        self.offsets = offsets
+        self.value = value
+    
+    def __getitem__(self, key):
+        i = self.index[key]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        if start == end:
+            raise KeyError(key)
+        return self.value(start, end)
+    
+    def __iter__(self):
+        offsets = self.offsets
+        return (key for i, key in enumerate(self.ids) if offsets[i] < offsets[i + 1])
+    
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class PatternTable(Sequence):
+    """patterns[p] = (route_id, (stop_idx, ...)) lu dans les tableaux pattern_route / pattern_stops"""
+    
+    def __init__(self, route_ids, route_col, stop_offsets, stops):
+        self.route_ids = route_ids
+        self.route_col = route_col
+        self.stop_offsets = stop_offsets
+        self.stops = stops
+    
+    def __getitem__(self, pattern):
+        if not 0 <= pattern < len(self):
+            raise IndexError(pattern)
+        stops = self.stops[self.stop_offsets[pattern]:self.stop_offsets[pattern + 1]]
+        return self.route_ids[self.route_col[pattern]], tuple(stops)
+    
+    def __len__(self):
+        return len(self.route_col)
+
+
+class StopTable(Mapping):
+    """
+    Arrêts stockés en colonnes (instantané) : coordonnées en tableaux float64, noms et codes en tables
+    de chaînes. Se lit comme le dict stop_id -> infos construit au parsing, les dicts étant créés à la demande.
+    """
+    
+    def __init__(self, stop_ids, lat_col, lon_col, name_col, code_col, names, codes):
+        self.stop_ids = stop_ids
+        self.index = StringIndex(stop_ids)
+        self.lat_col = lat_col
+        self.lon_col = lon_col
+        self.name_col = name_col
+        self.code_col = code_col
+        self.names = names
+        self.codes = codes
+    
+    def __getitem__(self, stop_id):
+        i = self.index[stop_id]
+        return {
+            'id': stop_id,
+            'name': self.names[self.name_col[i]],
+            'lat': self.lat_col[i],
+            'lon': self.lon_col[i],
+            'code': self.codes[self.code_col[i]]
+        }
+    
+    def __iter__(self):
+        return iter(self.stop_ids)
+    
+    def __len__(self):
+        return len(self.stop_ids)
+
+
+class RouteTable(Mapping):
+    """
+    Lignes stockées en colonnes (instantané) : une colonne d'index par champ vers ses valeurs distinctes.
+    Se lit comme le dict route_id -> infos construit au parsing.
+    """
+    
+    def __init__(self, route_ids, columns):
+        self.route_ids = route_ids
+        self.index = StringIndex(route_ids)
+        self.columns = columns  # champ -> (valeurs distinctes, colonne d'index)
+    
+    def __getitem__(self, route_id):
+        i = self.index[route_id]
+        return {field: values[column[i]] for field, (values, column) in self.columns.items()}
+    
+    def __iter__(self):
+        return iter(self.route_ids)
+    
+    def __len__(self):
+        return len(self.route_ids)
+
+
+class TripTable(Mapping):
+    """
+    Trips stockés en colonnes (instantané) : se lit comme le dict trip_id -> infos
+    construit au parsing, les dicts étant créés à la demande.
+    """
+    
+    def __init__(self, trip_ids, route_col, service_col, headsign_col, route_ids, service_ids, headsigns):
+        self.trip_ids = trip_ids
+        self.index = StringIndex(trip_ids)
+        self.route_col = route_col
+        self.service_col = service_col
+        self.headsign_col = headsign_col
+        self.route_ids = route_ids
+        self.service_ids = service_ids
+        self.headsigns = headsigns
+    
+    def __getitem__(self, trip_id):
+        i = self.index[trip_id]
+        return {
+            'route_id': self.route_ids[self.route_col[i]],
+            'service_id': self.service_ids[self.service_col[i]],
+            'headsign': self.headsigns[self.headsign_col[i]]
+        }
+    
+    def __iter__(self):
+        return iter(self.trip_ids)
+    
+    def __len__(self):
+        return len(self.trip_ids)
+
+
+class GTFSSnapshot:
+    """
+    Instantané binaire d'un flux GTFS parsé, relu par mmap : les tableaux du timetable et des
+    correspondances sont des vues memoryview sur le fichier, partagées entre workers par le cache
+    de pages du système. Format : MAGIC, longueur (uint32) et en-tête JSON (métadonnées, sections),
+    puis sections alignées sur 8 octets (tableaux typés, tables de chaînes en octets + offsets, JSON
+    pour les petites listes de valeurs distinctes). Arrêts, lignes, trips et index par arrêt sont relus
+    en colonnes (StopTable, RouteTable, TripTable, vues CSR), sans dict reconstruit par worker.
+    """
+    
+    MAGIC = b'GTFSSNP1'
+    VERSION = 3
+    ALIGN = 8
+    
+    TIMETABLE_ARRAYS = (
+        'trip_idx', 'arrival', 'departure', 'sequence', 'trip_pattern',
+        'pattern_trip_offsets', 'pattern_trip_list', 'pattern_time_offsets',
+        'pattern_arrivals', 'pattern_departures', 'stop_row_offsets',
+        'pattern_route', 'pattern_stop_offsets', 'pattern_stops',
+        'stop_pattern_offsets', 'stop_pattern_ids', 'stop_pattern_positions'
+    )
+    CALENDAR_ARRAYS = (
+        'weekdays', 'start_dates', 'end_dates', 'exception_services',
+        'exception_dates', 'exception_types', 'trip_service'
+    )
+    
+    @staticmethod
+    def path_for(key):
+        """Fichier d'instantané pour une clé de flux (URL comprise)"""
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', key).strip('-')[-48:]
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(GTFS_SNAPSHOT_DIR, f"{slug}-{digest}.snapshot")
+    
+    @staticmethod
+    def _strings(values):
+        """Table de chaînes : (liste distincte, colonne d'index int32)"""
+        index = {}
+        column = array('i', (index.setdefault(value, len(index)) for value in values))
+        return list(index), column
+    
+    @staticmethod
+    def _add_string_table(sections, name, values):
+        """Sections d'une StringTable (octets, offsets, ordre trié), reprises telles quelles si déjà mmap"""
+        table = values if isinstance(values, StringTable) else StringTable.build(values)
+        sections[f'{name}_blob'] = table.blob
+        sections[f'{name}_offsets'] = table.offsets
+        sections[f'{name}_order'] = table.order
+    
+    @staticmethod
+    def _string_table(sections, name):
+        """StringTable relue depuis ses sections"""
+        return StringTable(sections[f'{name}_blob'], sections[f'{name}_offsets'], sections[f'{name}_order'])
+    
+    @staticmethod
+    def save(gtfs_data, path, meta=None):
+        """Écrit l'instantané de façon atomique (fichier temporaire puis rename)"""
+        timetable = gtfs_data['timetable']
+        planner = gtfs_data['planner']
+        trips = gtfs_data['trips']
+        
+        trip_keys = list(trips)
+        route_ids, trip_route = GTFSSnapshot._strings(trips[t]['route_id'] for t in trip_keys)
+        service_ids, trip_service = GTFSSnapshot._strings(trips[t]['service_id'] for t in trip_keys)
+        headsigns, trip_headsign = GTFSSnapshot._strings(trips[t]['headsign'] for t in trip_keys)
+        
+        # Arrêts en colonnes : coordonnées float64, noms et codes en tables de chaînes
+        stops = gtfs_data['stops']
+        stop_keys = list(stops)
+        stop_names, stop_name = GTFSSnapshot._strings(stops[s]['name'] for s in stop_keys)
+        stop_codes, stop_code = GTFSSnapshot._strings(stops[s].get('code', '') for s in stop_keys)
+        
+        # Lignes : une colonne d'index par champ (valeurs distinctes en JSON, peu nombreuses)
+        routes = gtfs_data['routes']
+        route_keys = list(routes)
+        route_fields = list(dict.fromkeys(field for route in routes.values() for field in route))
+        route_columns = {
+            field: GTFSSnapshot._strings(routes[r].get(field) for r in route_keys) for field in route_fields
+        }
+        
+        sections = {
+            'strings': {
+                'service_ids': service_ids,
+                'route_ids': route_ids,
+                'headsigns': headsigns,
+                'pattern_routes': timetable.pattern_routes,
+                'route_values': {field: values for field, (values, _) in route_columns.items()}
+            },
+            'stop_lat': array('d', (stops[s]['lat'] for s in stop_keys)),
+            'stop_lon': array('d', (stops[s]['lon'] for s in stop_keys)),
+            'stop_name': stop_name,
+            'stop_code': stop_code,
+            'trip_route': trip_route,
+            'trip_service': trip_service,
+            'trip_headsign': trip_headsign,
+            'foot_offsets': planner.foot_offsets,
+            'foot_targets': planner.foot_targets,
+            'foot_seconds': planner.foot_seconds
+        }
+        for name, values in (('trip_ids', timetable.trip_ids), ('stop_ids', timetable.stop_ids),
+                             ('trip_keys', trip_keys), ('stop_keys', stop_keys), ('route_keys', route_keys),
+                             ('stop_names', stop_names), ('stop_codes', stop_codes)):
+            GTFSSnapshot._add_string_table(sections, name, values)
+        for field, (_, column) in route_columns.items():
+            sections[f'route_{field}'] = column
+        calendar = gtfs_data.get('calendar')
+        if calendar is not None:
+            sections['strings']['calendar_services'] = calendar.service_ids
+            for name in GTFSSnapshot.CALENDAR_ARRAYS:
+                sections[f'calendar_{name}'] = getattr(calendar, name)
+        for name in GTFSSnapshot.TIMETABLE_ARRAYS:
+            sections[name] = getattr(timetable, name)
+        
+        layout = {}
+        blobs = []
+        offset = 0
+        for name, value in sections.items():
+            if isinstance(value, (array, memoryview)):
+                kind, blob = value.format if isinstance(value, memoryview) else value.typecode, value.tobytes()
+            else:
+                kind, blob = 'json', json.dumps(value, separators=(',', ':')).encode('utf-8')
+            layout[name] = [kind, offset, len(blob)]
+            padding = -len(blob) % GTFSSnapshot.ALIGN
+            blobs.append(blob + b'\0' * padding)
+            offset += len(blob) + padding
+        
+        header = json.dumps({
+            'version': GTFSSnapshot.VERSION,
+            'byteorder': sys.byteorder,
+            'created_at': time.time(),
+            'max_time': timetable.max_time,
+            'footpath_radius_km': planner.footpath_radius_km,
+            'walk_speed_kmh': planner.walk_speed_kmh,
+            'meta': meta or {},
+            'sections': layout
+        }).encode('utf-8')
+        prefix = GTFSSnapshot.MAGIC + struct.pack('<I', len(header)) + header
+        prefix += b'\0' * (-len(prefix) % GTFSSnapshot.ALIGN)
+        
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.snapshot_', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(prefix)
+                for blob in blobs:
+                    f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        
+        logger.info(f"💾 Instantané GTFS écrit: {path} ({(len(prefix) + offset) / (1024 * 1024):.1f} Mo)")
+        return path
+    
+    @staticmethod
+    def read_header(path):
+        """En-tête JSON d'un instantané (sans lire les sections)"""
+        with open(path, 'rb') as f:
+            prefix = f.read(len(GTFSSnapshot.MAGIC) + 4)
+            if len(prefix) < len(GTFSSnapshot.MAGIC) + 4 or not prefix.startswith(GTFSSnapshot.MAGIC):
+                raise ValueError(f"Instantané GTFS invalide: {path}")
+            (header_size,) = struct.unpack_from('<I', prefix, len(GTFSSnapshot.MAGIC))
+            return json.loads(f.read(header_size))
+    
+    @staticmethod
+    def load(path):
+        """
+        Ouvre un instantané par mmap et reconstruit la structure gtfs_data.
+        Lève ValueError si le fichier est invalide ou d'une autre version.
+        """
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        view = memoryview(mapped)
+        magic_size = len(GTFSSnapshot.MAGIC)
+        if bytes(view[:magic_size]) != GTFSSnapshot.MAGIC:
+            raise ValueError(f"Instantané GTFS invalide: {path}")
+        (header_size,) = struct.unpack_from('<I', mapped, magic_size)
+        header_end = magic_size + 4 + header_size
+        header = json.loads(bytes(view[magic_size + 4:header_end]))
+        if header['version'] != GTFSSnapshot.VERSION or header['byteorder'] != sys.byteorder:
+            raise ValueError(f"Instantané GTFS incompatible: {path}")
+        data_start = header_end + (-header_end % GTFSSnapshot.ALIGN)
+        
+        sections = {}
+        for name, (kind, offset, length) in header['sections'].items():
+            chunk = view[data_start + offset:data_start + offset + length]
+            sections[name] = json.loads(bytes(chunk)) if kind == 'json' else chunk.cast(kind)
+        
+        strings = sections['strings']
+        
+        timetable = TimetableStore()
+        timetable.trip_ids = GTFSSnapshot._string_table(sections, 'trip_ids')
+        timetable.trip_index = StringIndex(timetable.trip_ids)
+        timetable.stop_ids = GTFSSnapshot._string_table(sections, 'stop_ids')
+        timetable.stop_index = StringIndex(timetable.stop_ids)
+        timetable.max_time = header['max_time']
+        timetable.pattern_routes = strings['pattern_routes']
+        for name in GTFSSnapshot.TIMETABLE_ARRAYS:
+            setattr(timetable, name, sections[name])
+        timetable.build_views()
+        
+        stops = StopTable(
+            GTFSSnapshot._string_table(sections, 'stop_keys'), sections['stop_lat'], sections['stop_lon'],
+            sections['stop_name'], sections['stop_code'],
+            GTFSSnapshot._string_table(sections, 'stop_names'), GTFSSnapshot._string_table(sections, 'stop_codes')
+        )
+        routes = RouteTable(GTFSSnapshot._string_table(sections, 'route_keys'), {
+            field: (values, sections[f'route_{field}']) for field, values in strings['route_values'].items()
+        })
+        trips = TripTable(
+            GTFSSnapshot._string_table(sections, 'trip_keys'), sections['trip_route'], sections['trip_service'],
+            sections['trip_headsign'], strings['route_ids'], strings['service_ids'], strings['headsigns']
+        )
+        
+        # Correspondances réutilisées si les paramètres de marche n'ont pas changé
+        footpaths = None
+        if header['footpath_radius_km'] == FOOTPATH_RADIUS_KM and header['walk_speed_kmh'] == WALK_SPEED_KMH:
+            footpaths = (sections['foot_offsets'], sections['foot_targets'], sections['foot_seconds'])
+        
+        calendar = None
+        if 'calendar_services' in strings:
+            calendar = ServiceCalendar(strings['calendar_services'],
+                                       *(sections[f'calendar_{name}'] for name in GTFSSnapshot.CALENDAR_ARRAYS))
+        
+        return {
+            'stops': stops,
+            'routes': routes,
+            'trips': trips,
+            'timetable': timetable,
+            'stop_index': StopSpatialIndex(stops),
+            'planner': JourneyPlanner(timetable, stops, footpaths=footpaths),
+            'calendar': calendar,
+            'snapshot': {'path': path, 'created_at': header['created_at'], **header['meta']}
+        }
+
+
+class GTFSManager:
+    """Gestionnaire GTFS optimisé avec cache intelligent"""
+    
+    @staticmethod
+    def load_gtfs_for_region(lat, lon):
+        """Charge les données GTFS du flux couvrant une position"""
+        region_key = region_key_for(lat, lon)
+        region_scheduler.record(region_key)
+        
+        # Vérifier si un flux chargé couvre déjà la position
+        feed_key, cache_data = GTFSManager.find_loaded_feed(lat, lon)
+        if cache_data:
+            age = datetime.now() - cache_data['loaded_at']
+            
+            # Cache valide 24h
+            if age < GTFS_CACHE_TTL:
+                logger.info(f"✓ GTFS cache hit pour {region_key} ({feed_key})")
+                return cache_data
+            
+            # Expiré: servi tel quel pendant le rechargement en arrière-plan
+            if age < GTFS_CACHE_TTL + GTFS_STALE_GRACE and region_scheduler.refresh_async(feed_key):
+                logger.info(f"♻️  GTFS expiré servi pour {feed_key}, rechargement en arrière-plan")
+                return cache_data
+        
+        return GTFSManager.refresh_region(lat, lon, current=cache_data)
+    
+    @staticmethod
+    def pending_download(lat, lon):
+        """
+        Téléchargement que ferait load_gtfs_for_region() pour une position, fait en amont par le mode
+        asynchrone : ('gtfs', URL), ('osm', tuiles manquantes), ou None si le flux est servi sans réseau
+        (cache mémoire, artefact, instantané, archive conservée). Cas non prévus : le chargement télécharge.
+        """
+        _, cache_data = GTFSManager.find_loaded_feed(lat, lon)
+        if cache_data and datetime.now() - cache_data['loaded_at'] < GTFS_CACHE_TTL + GTFS_STALE_GRACE:
+            return None
+        if GTFSManager.find_artifact(lat, lon):
+            return None
+        
+        feeds = TransitAPIManager.search_gtfs_feeds(lat, lon)
+        if not feeds:
+            missing = TransitAPIManager.missing_overpass_tiles(lat, lon)
+            return ('osm', missing) if missing else None
+        
+        feed_url = feeds[0].get('url') or feeds[0].get('direct_download_url')
+        newer_than = cache_data['loaded_at'] if cache_data else None
+        with cache_lock:
+            loaded = gtfs_cache.get(feed_url)
+        if loaded is not None and loaded is not cache_data and not loaded.get('partial'):
+            return None
+        if (GTFSManager.snapshot_written_at(feed_url, newer_than)
+                or GTFSManager.snapshot_written_at(f"{feed_url}#{region_key_for(lat, lon)}", newer_than)):
+            return None
+        kept = GTFSManager.open_kept_archive(feed_url, newer_than)
+        if kept:
+            kept.close()
+            return None
+        return 'gtfs', feed_url
+    
+    @staticmethod
+    def find_loaded_feed(lat, lon):
+        """
+        Flux déjà chargé couvrant la position : (clé de flux, données) ou (None, None).
+        Résolution mémorisée par région, sinon index spatial de gtfs_cache (GTFS avant OSM).
+        """
+        region_key = region_key_for(lat, lon)
+        
+        with cache_lock:
+            feed_key = region_feeds.get(region_key)
+            entry = gtfs_cache.get(feed_key)
+            # Un fallback OSM mémorisé cède la place à un flux GTFS chargé depuis
+            if entry is None or entry.get('source') == 'osm':
+                feed_key = gtfs_cache.find(lat, lon)
+                if feed_key is None:
+                    return None, None
+                region_feeds[region_key] = feed_key
+                entry = gtfs_cache[feed_key]
+            entry['used_at'] = time.monotonic()
+            return feed_key, entry
+    
+    @staticmethod
+    def covers(entry, lat, lon):
+        """La position est-elle dans l'emprise du flux (marge GTFS_COVERAGE_MARGIN_KM comprise)"""
+        bbox = entry.get('coverage')
+        if not bbox:
+            return False
+        dlat = GTFS_COVERAGE_MARGIN_KM / StopSpatialIndex.KM_PER_DEGREE
+        dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+        return bbox[0] - dlat <= lat <= bbox[2] + dlat and bbox[1] - dlon <= lon <= bbox[3] + dlon
+    
+    @staticmethod
+    def coverage(gtfs_data):
+        """
+        Emprise [lat_min, lon_min, lat_max, lon_max] des arrêts d'un flux (None si vide).
+        Flux partiel : emprise des seuls arrêts desservis par les stop_times chargés.
+        """
+        stop_index = gtfs_data['stop_index']
+        if not len(stop_index):
+            return None
+        lats, lons = stop_index.lats, stop_index.lons
+        if gtfs_data.get('partial'):
+            served = {stop_id for stop_id, (start, end) in gtfs_data['timetable'].stop_offsets.items() if end > start}
+            mask = np.fromiter((stop_id in served for stop_id in stop_index.stop_ids), dtype=bool,
+                               count=len(stop_index.stop_ids))
+            if not mask.any():
+                return None
+            lats, lons = lats[mask], lons[mask]
+        return [float(lats.min()), float(lons.min()), float(lats.max()), float(lons.max())]
+    
+    @staticmethod
+    def footprint(gtfs_data, sample=256):
+        """
+        Empreinte mémoire estimée d'un flux (octets).
+        arrays: colonnes compactes propres au worker ; shared: colonnes lues dans un instantané mmap
+        (pages partagées entre workers) ; objects: dicts et chaînes Python, estimés par échantillonnage.
+        """
+        timetable = gtfs_data['timetable']
+        trips = gtfs_data['trips']
+        if isinstance(timetable, RouteMembership):
+            objects = sum(sampled_sizeof(mapping, sample) for mapping in
+                          (gtfs_data['stops'], gtfs_data['routes'], timetable.stop_index))
+            arrays = timetable.nbytes + gtfs_data['stop_index'].lats.nbytes + gtfs_data['stop_index'].lons.nbytes
+            return {'arrays': arrays, 'shared': 0, 'objects': objects, 'total': arrays + objects}
+        
+        columns = [getattr(timetable, name) for name in GTFSSnapshot.TIMETABLE_ARRAYS]
+        planner = gtfs_data.get('planner')
+        if planner is not None:
+            columns += [planner.foot_offsets, planner.foot_targets, planner.foot_seconds]
+        if isinstance(trips, TripTable):
+            columns += [trips.route_col, trips.service_col, trips.headsign_col]
+        stops, routes = gtfs_data['stops'], gtfs_data['routes']
+        if isinstance(stops, StopTable):
+            columns += [stops.lat_col, stops.lon_col, stops.name_col, stops.code_col]
+        if isinstance(routes, RouteTable):
+            columns += [column for _, column in routes.columns.values()]
+        calendar = gtfs_data.get('calendar')
+        if calendar is not None:
+            columns += [calendar.weekdays, calendar.start_dates, calendar.end_dates, calendar.exception_services,
+                        calendar.exception_dates, calendar.exception_types, calendar.trip_service]
+        tables = (timetable.trip_ids, timetable.stop_ids, getattr(trips, 'trip_ids', None),
+                  getattr(stops, 'stop_ids', None), getattr(stops, 'names', None), getattr(stops, 'codes', None),
+                  getattr(routes, 'route_ids', None))
+        for table in tables:
+            if isinstance(table, StringTable):
+                columns += [table.blob, table.offsets, table.order]
+        
+        arrays = shared = 0
+        for column in columns:
+            size = column.itemsize * len(column)
+            if isinstance(column, memoryview):
+                shared += size
+            else:
+                arrays += size
+        stop_index = gtfs_data.get('stop_index')
+        if stop_index is not None:
+            size = stop_index.lats.nbytes + stop_index.lons.nbytes
+            if stop_index.lats.flags.owndata:
+                arrays += size
+            else:
+                shared += size
+        
+        # Dicts Python seulement : les tables et vues d'un instantané sont comptées dans les colonnes
+        mappings = (stops, routes, trips, timetable.trip_index, timetable.stop_index)
+        objects = sum(sampled_sizeof(mapping, sample) for mapping in mappings if isinstance(mapping, dict))
+        
+        return {'arrays': arrays, 'shared': shared, 'objects': objects, 'total': arrays + shared + objects}
+    
+    @staticmethod
+    def cache_feed(feed_key, gtfs_data, lat, lon):
+        """Enregistre un flux dans gtfs_cache (emprise, position de chargement) et le lie à la région"""
+        entry = {
+            **gtfs_data,
+            'feed_key': feed_key,
+            'center': (lat, lon),
+            'coverage': GTFSManager.coverage(gtfs_data),
+            'footprint': GTFSManager.footprint(gtfs_data)
+        }
+        entry.setdefault('loaded_at', datetime.now())
+        entry['used_at'] = time.monotonic()
+        footprint = entry['footprint']
+        logger.info(f"💾 Flux {feed_key}: {footprint['total'] / 1e6:.1f} Mo "
+                    f"(tableaux {footprint['arrays'] / 1e6:.1f}, partagés {footprint['shared'] / 1e6:.1f}, "
+                    f"objets {footprint['objects'] / 1e6:.1f})")
+        with cache_lock:
+            gtfs_cache[feed_key] = entry
+            region_feeds[region_key_for(lat, lon)] = feed_key
+            if entry.get('partial'):
+                GTFSManager.evict_partials(feed_key.rpartition('#')[0])
+        return entry
+    
+    @staticmethod
+    def evict_partials(feed_url):
+        """
+        Chargements partiels d'un flux ('url#région') au-delà de GTFS_PARTIAL_MAX_PER_FEED ou, à eux
+        tous, de GTFS_MEMORY_BUDGET_MB : les moins récemment servis sont retirés (cache_lock détenu).
+        """
+        prefix = f"{feed_url}#"
+        partials = sorted(
+            ((entry.get('used_at', 0), key) for key, entry in gtfs_cache.items() if key.startswith(prefix)),
+            reverse=True
+        )
+        budget = GTFS_MEMORY_BUDGET_MB * 1024 * 1024
+        used = 0
+        for rank, (_, key) in enumerate(partials):
+            footprint = gtfs_cache[key].get('footprint') or {}
+            used += footprint.get('arrays', 0) + footprint.get('objects', 0)
+            if rank == 0 or (rank < GTFS_PARTIAL_MAX_PER_FEED and (not budget or used <= budget)):
+                continue
+            del gtfs_cache[key]
+            for region in [r for r, feed in region_feeds.items() if feed == key]:
+                del region_feeds[region]
+            logger.info(f"🗑️  Chargement partiel {key} retiré du cache (moins récemment servi)")
+    
+    @staticmethod
+    def refresh_region(lat, lon, current=None):
+        """
+        (Re)charge le flux couvrant une position et met à jour gtfs_cache.
+        current: entrée existante ; un flux GTFS valide n'est pas remplacé par le fallback OSM.
+        """
+        region_key = region_key_for(lat, lon)
+        
+        # Un seul chargement par région : les requêtes simultanées partagent son résultat
+        return gtfs_loads.do(region_key, GTFSManager._load_region, lat, lon, region_key, current,
+                             timeout=GTFS_LOAD_WAIT_S)
+    
+    @staticmethod
+    def _load_region(lat, lon, region_key, current):
+        """Résolution du flux d'une position (artefact, flux GTFS, puis OSM) et chargement"""
+        newer_than = current['loaded_at'] if current else None
+        
+        # Artefact précompilé couvrant la position
+        artifact = GTFSManager.load_artifact(lat, lon)
+        if artifact:
+            feed_key = artifact['snapshot'].get('source') or artifact['snapshot']['path']
+            return GTFSManager.cache_feed(feed_key, artifact, lat, lon)
+        
+        # Rechercher les flux disponibles
+        logger.info(f"Chargement GTFS pour {region_key}")
+        feeds = TransitAPIManager.search_gtfs_feeds(lat, lon)
+        
+        if feeds:
+            # Charger le premier flux GTFS disponible (une seule fois par flux)
+            feed = feeds[0]
+            feed_url = feed.get('url') or feed.get('direct_download_url')
+            
+            with cache_lock:
+                loaded = gtfs_cache.get(feed_url)
+            if loaded is not None and loaded is not current:
+                # Flux déjà chargé pour une autre région de la même ville
+                with cache_lock:
+                    region_feeds[region_key] = feed_url
+                logger.info(f"✓ GTFS {feed_url} déjà chargé, associé à {region_key}")
+                return loaded
+            
+            gtfs_data = gtfs_loads.do(feed_url, GTFSManager._load_feed, feed_url, lat, lon, newer_than,
+                                      timeout=GTFS_LOAD_WAIT_S)
+            if gtfs_data and gtfs_data.get('partial') and not GTFSManager.covers(gtfs_data, lat, lon):
+                # Chargement partagé limité à une autre zone de la ville : chargement de cette zone,
+                # une fois pour les requêtes simultanées, depuis l'archive conservée par le premier chargement
+                gtfs_data = gtfs_loads.do(f"{feed_url}#{region_key}", GTFSManager._load_feed,
+                                          feed_url, lat, lon, newer_than, timeout=GTFS_LOAD_WAIT_S)
+            if gtfs_data:
+                return gtfs_data
+            
+            if current and current.get('source') == 'gtfs':
+                logger.warning(f"Échec rechargement GTFS {feed_url}, données précédentes conservées")
+                return current
+            
+            # Si échec GTFS, fallback vers OSM
+            logger.warning("Échec chargement GTFS, fallback OSM")
+        else:
+            logger.warning("Pas de flux GTFS, utilisation OSM")
+        
+        osm_data = TransitAPIManager.get_transit_data_overpass(lat, lon)
+        entry = GTFSManager.cache_feed(f"osm:{region_key}", GTFSManager.build_osm_gtfs_data(osm_data), lat, lon)
+        logger.info(f"✓ OSM enrichi: {len(osm_data['stops'])} arrêts, {len(osm_data['routes'])} routes, liens créés")
+        return entry
+    
+    @staticmethod
+    def _load_feed(feed_url, lat, lon, newer_than=None):
+        """
+        Charge un flux complet : instantané partagé s'il existe, sinon téléchargement et parsing.
+        Un flux au-delà du budget mémoire est chargé autour de la position, sous la clé 'url#région'.
+        """
+        partial_key = f"{feed_url}#{region_key_for(lat, lon)}"
+        
+        # Instantané disque déjà écrit par un autre worker (ou avant redémarrage)
+        snapshot_data = GTFSManager.load_snapshot(feed_url, newer_than)
+        if snapshot_data:
+            return GTFSManager.cache_feed(feed_url, snapshot_data, lat, lon)
+        snapshot_data = GTFSManager.load_snapshot(partial_key, newer_than)
+        if snapshot_data:
+            return GTFSManager.cache_feed(partial_key, {**snapshot_data, 'partial': True}, lat, lon)
+        
+        gtfs_data = GTFSManager.download_and_parse_gtfs(feed_url, lat, lon, newer_than)
+        if not gtfs_data:
+            return None
+        
+        feed_key = partial_key if gtfs_data.get('partial') else feed_url
+        GTFSManager.save_snapshot(feed_key, gtfs_data, feed_url)
+        return GTFSManager.cache_feed(feed_key, {**gtfs_data, 'source': 'gtfs', 'loaded_at': datetime.now()}, lat, lon)
+    
+    @staticmethod
+    def load_snapshot(key, newer_than=None):
+        """
+        Données GTFS depuis l'instantané mmap de la clé, s'il existe et a moins de 24h
+        (et s'il est plus récent que newer_than)
+        """
+        written_at = GTFSManager.snapshot_written_at(key, newer_than)
+        if written_at is None:
+            return None
+        
+        path = GTFSSnapshot.path_for(key)
+        try:
+            gtfs_data = GTFSSnapshot.load(path)
+        except Exception as e:
+            logger.warning(f"Instantané GTFS illisible ({path}): {e}")
+            return None
+        
+        logger.info(f"✓ GTFS instantané mmap pour {key}: {len(gtfs_data['stops'])} arrêts")
+        return {**gtfs_data, 'source': 'gtfs', 'loaded_at': written_at}
+    
+    @staticmethod
+    def snapshot_written_at(key, newer_than=None):
+        """Date d'écriture de l'instantané de la clé s'il est utilisable (moins de 24h, plus récent que newer_than)"""
+        if not GTFS_SNAPSHOTS:
+            return None
+        try:
+            written_at = datetime.fromtimestamp(os.path.getmtime(GTFSSnapshot.path_for(key)))
+        except OSError:
+            return None
+        if datetime.now() - written_at >= GTFS_CACHE_TTL:
+            return None
+        if newer_than is not None and written_at <= newer_than:
+            return None
+        return written_at
+    
+    @staticmethod
+    def find_artifact(lat, lon):
+        """Artefact précompilé de GTFS_ARTIFACT_DIR dont l'emprise contient la position"""
+        if not GTFS_ARTIFACT_DIR:
+            return None
+        
+        try:
+            names = sorted(os.listdir(GTFS_ARTIFACT_DIR))
+        except OSError as e:
+            logger.warning(f"Dossier d'artefacts GTFS illisible: {e}")
+            return None
+        
+        best = None
+        for name in names:
+            path = os.path.join(GTFS_ARTIFACT_DIR, name)
+            key = (path, os.path.getmtime(path)) if os.path.isfile(path) else None
+            if key is None:
+                continue
+            
+            header = _artifact_headers.get(key)
+            if header is None:
+                try:
+                    header = _artifact_headers[key] = GTFSSnapshot.read_header(path)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Artefact GTFS ignoré ({path}): {e}")
+                    continue
+            
+            bbox = header.get('meta', {}).get('bbox')
+            if bbox and bbox[0] <= lat <= bbox[2] and bbox[1] <= lon <= bbox[3]:
+                # Emprise la plus petite en cas de chevauchement (réseau urbain plutôt que national)
+                area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+                if best is None or area < best[0]:
+                    best = (area, path)
+        
+        return best[1] if best else None
+    
+    @staticmethod
+    def load_artifact(lat, lon):
+        """Données GTFS depuis un artefact précompilé couvrant la position"""
+        path = GTFSManager.find_artifact(lat, lon)
+        if path is None:
+            return None
+        
+        try:
+            gtfs_data = GTFSSnapshot.load(path)
+        except Exception as e:
+            logger.warning(f"Artefact GTFS illisible ({path}): {e}")
+            return None
+        
+        logger.info(f"✓ GTFS artefact précompilé {os.path.basename(path)}: {len(gtfs_data['stops'])} arrêts")
+        return {**gtfs_data, 'source': 'gtfs', 'loaded_at': datetime.now()}
+    
+    @staticmethod
+    def compile_feed(source, output, memory_budget_mb=0):
+        """
+        Compile un flux GTFS complet (ZIP local ou URL) en artefact instantané :
+        index déjà construits, chargé par mmap en quelques millisecondes
+        """
+        if source.startswith(('http://', 'https://')):
+            archive = GTFSManager.download_gtfs_to_file(source)
+        else:
+            archive = open(source, 'rb')
+        
+        with archive:
+            with GTFSManager.open_gtfs_zip(archive) as zip_file:
+                gtfs_data = GTFSManager.parse_gtfs_zip(zip_file, memory_budget_mb=memory_budget_mb)
+        
+        if not gtfs_data['stops'] or not len(gtfs_data['timetable']):
+            raise ValueError(f"Flux GTFS vide ou invalide: {source}")
+        
+        stop_index = gtfs_data['stop_index']
+        bbox = [float(stop_index.lats.min()), float(stop_index.lons.min()),
+                float(stop_index.lats.max()), float(stop_index.lons.max())]
+        return GTFSSnapshot.save(gtfs_data, output, meta={
+            'kind': 'artifact',
+            'source': source,
+            'bbox': bbox
+        })
+    
+    @staticmethod
+    def save_snapshot(key, gtfs_data, feed_url=None):
+        """Écrit l'instantané d'un flux parsé (échec non bloquant)"""
+        if not GTFS_SNAPSHOTS:
+            return
+        meta = {'key': key, 'url': feed_url, 'partial': bool(gtfs_data.get('partial'))}
+        try:
+            GTFSSnapshot.save(gtfs_data, GTFSSnapshot.path_for(key), meta=meta)
+        except Exception as e:
+            logger.warning(f"Écriture instantané GTFS impossible: {e}")
+    
+    @staticmethod
+    def build_osm_gtfs_data(osm_data):
+        """
+        Construit une structure type GTFS à partir des données OSM : appartenance réelle des
+        arrêts aux lignes (membres des relations), sans trips ni horaires matérialisés
+        """
+        stops_dict = {stop['id']: stop for stop in osm_data['stops']}
+        routes_dict = {
+            route['id']: {key: value for key, value in route.items() if key not in ('stop_ids', 'headsign')}
+            for route in osm_data['routes']
+        }
+        membership = RouteMembership(
+            stops_dict,
+            {route['id']: route.get('stop_ids', ()) for route in osm_data['routes']},
+            {route['id']: route.get('type') for route in osm_data['routes']},
+            {route['id']: route.get('headsign') for route in osm_data['routes']}
+        )
+        
+        return {
+            'stops': stops_dict,
+            'routes': routes_dict,
+            'trips': {},
+            'timetable': membership,
+            'stop_index': StopSpatialIndex(stops_dict),
+            'source': 'osm',
+            'loaded_at': datetime.now()
+        }
     
     @staticmethod
-    def get_transit_data_overpass(lat, lon, radius_m=2000):
+    def download_gtfs_to_file(url, max_bytes=None):
         """
-        Récupère les données de transport en commun via Overpass API (OpenStreetMap)
-        Fallback universel quand GTFS n'est pas disponible
+        Télécharge un flux GTFS en streaming vers un fichier temporaire sur disque
+        (pas de ZIP complet en mémoire). Lève ValueError si la taille dépasse le plafond.
         """
+        if max_bytes is None:
+            max_bytes = GTFS_MAX_DOWNLOAD_MB * 1024 * 1024
+        
+        archive = tempfile.TemporaryFile(prefix='gtfs_', suffix='.zip', dir=GTFS_TMP_DIR)
         try:
-            logger.info(f"Récupération données OSM Overpass ({lat}, {lon})")
-            
-            # Essayer plusieurs serveurs Overpass (fallback en cas de timeout)
-            overpass_servers = [
-                "https://overpass.kumi.systems/api/interpreter",  # Serveur alternatif
-                "https://overpass-api.de/api/interpreter",  # Serveur principal
-                "https://overpass.openstreetmap.ru/cgi/interpreter",  # Serveur russe
-            ]
-            
-            osm_data = None
-            for overpass_url in overpass_servers:
-                try:
-                    logger.info(f"Tentative Overpass: {overpass_url}")
-                    
-                    query = f"""
-                    [out:json][timeout:15];
-                    (
-                      node["public_transport"="stop_position"](around:2000,{lat},{lon});
-                      node["highway"="bus_stop"](around:2000,{lat},{lon});
-                      node["railway"="tram_stop"](around:2000,{lat},{lon});
-                      node["railway"="station"](around:2000,{lat},{lon});
-                      node["railway"="halt"](around:2000,{lat},{lon});
-                    );
-                    out body;
-                    >;
-                    out skel qt;
-                    
-                    relation["route"~"bus|tram|subway|train"](around:3000,{lat},{lon});
-                    out body;
-                    """
-                    
-                    r = requests.post(overpass_url, data={'data': query}, timeout=20)
-                    r.raise_for_status()
-                    data = r.json()
-                    
-                    # Parser les données
-                    stops = []
-                    routes = []
-                    
-                    for element in data.get('elements', []):
-                        if element['type'] == 'node':
-                            tags = element.get('tags', {})
-                            if any(k in tags for k in ['public_transport', 'highway', 'railway']):
-                                stops.append({
-                                    'id': f"osm_{element['id']}",
-                                    'name': tags.get('name', 'Arrêt sans nom'),
-                                    'lat': element['lat'],
-                                    'lon': element['lon']
-                                })
-                        elif element['type'] == 'relation':
-                            tags = element.get('tags', {})
-                            if 'route' in tags:
-                                routes.append({
-                                    'id': f"osm_route_{element['id']}",
-                                    'short_name': tags.get('ref', tags.get('name', 'N/A')),
-                                    'long_name': tags.get('name', ''),
-                                    'type': tags['route'].capitalize(),
-                                    'color': tags.get('colour', '#0066CC')
-                                })
-                    
-                    osm_data = {'stops': stops, 'routes': routes}
-                    logger.info(f"✓ OSM: {len(stops)} arrêts, {len(routes)} lignes via {overpass_url}")
-                    break  # Succès, arrêter la boucle
+            with http_session('gtfs').get(url, timeout=60, stream=True) as response:
+                response.raise_for_status()
+                
+                declared = int(response.headers.get('Content-Length') or 0)
+                if declared > max_bytes:
+                    raise ValueError(f"Flux GTFS trop volumineux: {declared // (1024 * 1024)} Mo annoncés")
+                
+                written = 0
+                log_step = GTFS_DOWNLOAD_LOG_STEP_MB * 1024 * 1024
+                next_log = log_step
+                for chunk in response.iter_content(chunk_size=GTFS_DOWNLOAD_CHUNK_SIZE):
+                    if not chunk:
+                        continue
+                    written += len(chunk)
+                    if written > max_bytes:
+                        raise ValueError(f"Flux GTFS trop volumineux (> {max_bytes // (1024 * 1024)} Mo)")
+                    archive.write(chunk)
                     
-                except Exception as e:
-                    logger.warning(f"Overpass {overpass_url} échoué: {e}")
-                    continue  # Essayer le serveur suivant
+                    if written >= next_log:
+                        logger.info(f"⬇️  GTFS: {written // (1024 * 1024)} Mo téléchargés")
+                        next_log += log_step
             
-            if not osm_data:
-                logger.error("Tous les serveurs Overpass ont échoué")
-                return {'stops': [], 'routes': []}
-            
-            # Query Overpass pour les arrêts et lignes de transport
-            query = f"""
-            [out:json][timeout:25];
-            (
-              node["highway"="bus_stop"](around:{radius_m},{lat},{lon});
-              node["railway"="tram_stop"](around:{radius_m},{lat},{lon});
-              node["railway"="station"](around:{radius_m},{lat},{lon});
-              node["railway"="subway_entrance"](around:{radius_m},{lat},{lon});
-              node["amenity"="bus_station"](around:{radius_m},{lat},{lon});
-              relation["type"="route"]["route"~"bus|tram|subway|train|light_rail"](around:{radius_m},{lat},{lon});
-            );
-            out body;
-            >;
-            out skel qt;
-            """
-            
-            response = requests.post(overpass_url, data={'data': query}, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Parser les arrêts
-            stops = []
-            routes = []
+            archive.flush()
+            archive.seek(0)
+            logger.info(f"✓ Téléchargement GTFS terminé: {written / (1024 * 1024):.1f} Mo")
+            return archive
+        except Exception:
+            archive.close()
+            raise
+    
+    @staticmethod
+    @contextmanager
+    def open_gtfs_zip(archive):
+        """Ouvre le ZIP GTFS depuis le disque, via mmap si possible"""
+        try:
+            mapped = mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError, io.UnsupportedOperation):
+            mapped = None  # Fichier vide ou non mappable: lecture classique
+        
+        try:
+            with zipfile.ZipFile(MappedFile(mapped) if mapped is not None else archive) as zip_file:
+                yield zip_file
+        finally:
+            if mapped is not None:
+                mapped.close()
+    
+    @staticmethod
+    def archive_path(url):
+        """Archive conservée d'un flux hors budget (à côté de ses instantanés)"""
+        return os.path.splitext(GTFSSnapshot.path_for(url))[0] + '.zip'
+    
+    @staticmethod
+    def keep_archive(url, archive):
+        """Copie l'archive téléchargée (fichier temporaire) pour les chargements par zone suivants"""
+        if not GTFS_SNAPSHOTS:
+            return
+        path = GTFSManager.archive_path(url)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix='.archive_', suffix='.zip', dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as f:
+                archive.seek(0)
+                shutil.copyfileobj(archive, f, GTFS_DOWNLOAD_CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Conservation de l'archive GTFS impossible: {e}")
+            if tmp_path:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+    
+    @staticmethod
+    def open_kept_archive(url, newer_than=None):
+        """Archive conservée de moins de 24h (et plus récente que newer_than), ouverte ; None sinon"""
+        if not GTFS_SNAPSHOTS:
+            return None
+        path = GTFSManager.archive_path(url)
+        try:
+            written_at = datetime.fromtimestamp(os.path.getmtime(path))
+            if datetime.now() - written_at >= GTFS_CACHE_TTL:
+                return None
+            if newer_than is not None and written_at <= newer_than:
+                return None
+            return open(path, 'rb')
+        except OSError:
+            return None
+    
+    @staticmethod
+    def download_and_parse_gtfs(url, center_lat=None, center_lon=None, newer_than=None):
+        """
+        Télécharge et parse un flux GTFS complet.
+        Si le flux dépasse GTFS_MEMORY_BUDGET_MB et qu'un centre est donné, seuls les stop_times
+        à 5km du centre sont chargés (données marquées 'partial'). L'archive d'un tel flux est conservée :
+        les zones suivantes sont parsées directement autour de leur centre, sans nouveau téléchargement.
+        """
+        try:
+            if center_lat is not None and center_lon is not None:
+                kept = GTFSManager.open_kept_archive(url, newer_than)
+                if kept:
+                    logger.info(f"✓ Archive GTFS conservée pour {url} (hors budget), chargement limité à 5km")
+                    with kept, GTFSManager.open_gtfs_zip(kept) as zip_file:
+                        gtfs_data = GTFSManager.parse_gtfs_zip(zip_file, center_lat, center_lon)
+                        return {**gtfs_data, 'partial': True}
             
-            for element in data.get('elements', []):
-                if element['type'] == 'node':
-                    tags = element.get('tags', {})
-                    if 'name' in tags:
-                        stops.append({
-                            'id': f"osm_{element['id']}",
-                            'name': tags.get('name', 'Unknown'),
-                            'lat': element['lat'],
-                            'lon': element['lon'],
-                            'type': tags.get('highway') or tags.get('railway') or tags.get('amenity', 'stop'),
-                            'source': 'osm'
-                        })
-                
-                elif element['type'] == 'relation':
-                    tags = element.get('tags', {})
-                    if 'ref' in tags or 'name' in tags:
-                        routes.append({
-                            'id': f"osm_route_{element['id']}",
-                            'short_name': tags.get('ref', ''),
-                            'long_name': tags.get('name', ''),
-                            'type': tags.get('route', 'bus'),
-                            'color': '#' + tags.get('colour', '0066CC').replace('#', ''),
-                            'source': 'osm'
-                        })
+            # Archive déjà téléchargée par le mode asynchrone (ou son échec), sinon téléchargement ici
+            archive = prefetched_archives.pop(url, None)
+            if isinstance(archive, Exception):
+                raise archive
+            if archive is None:
+                logger.info(f"Téléchargement GTFS: {url}")
+                archive = GTFSManager.download_gtfs_to_file(url)
             
-            logger.info(f"✓ OSM: {len(stops)} arrêts, {len(routes)} lignes")
-            return {'stops': stops, 'routes': routes}
+            with archive:
+                with GTFSManager.open_gtfs_zip(archive) as zip_file:
+                    try:
+                        return GTFSManager.parse_gtfs_zip(zip_file)
+                    except GTFSBudgetExceeded as e:
+                        if center_lat is None or center_lon is None:
+                            raise
+                        logger.warning(f"⚠️  Flux GTFS {url} trop volumineux ({e}), chargement limité à 5km")
+                        GTFSManager.keep_archive(url, archive)
+                        gtfs_data = GTFSManager.parse_gtfs_zip(zip_file, center_lat, center_lon)
+                        return {**gtfs_data, 'partial': True}
             
         except Exception as e:
-            logger.error(f"Erreur Overpass API: {e}")
-            return {'stops': [], 'routes': []}
-
-
-class GTFSManager:
-    """Gestionnaire GTFS optimisé avec cache intelligent"""
+            logger.error(f"Erreur téléchargement GTFS: {e}")
+            return None
     
     @staticmethod
-    def load_gtfs_for_region(lat, lon):
-        """Charge les données GTFS pour une région donnée"""
-        region_key = f"{round(lat, 2)}_{round(lon, 2)}"
-        
-        with cache_lock:
-            # Vérifier si déjà en cache
-            if region_key in gtfs_cache:
-                cache_data = gtfs_cache[region_key]
-                age = datetime.now() - cache_data['loaded_at']
-                
-                # Cache valide 24h
-                if age < timedelta(hours=24):
-                    logger.info(f"✓ GTFS cache hit pour {region_key}")
-                    return cache_data
-        
-        # Charger de nouvelles données
-        logger.info(f"Chargement GTFS pour {region_key}")
-        
-        # Rechercher les flux disponibles
-        feeds = TransitAPIManager.search_gtfs_feeds(lat, lon)
+    def parse_gtfs_zip(zip_file, center_lat=None, center_lon=None, memory_budget_mb=None):
+        """
+        Parse les fichiers essentiels d'un ZIP GTFS ouvert.
+        Sans centre, tous les stop_times sont chargés (flux complet). Lève GTFSBudgetExceeded si
+        le timetable dépasse memory_budget_mb (défaut GTFS_MEMORY_BUDGET_MB, 0 = sans limite).
+        """
+        if memory_budget_mb is None:
+            memory_budget_mb = GTFS_MEMORY_BUDGET_MB
+        max_rows = int(memory_budget_mb * 1024 * 1024 // TimetableStore.ROW_BYTES) if memory_budget_mb else None
         
-        if not feeds:
-            logger.warning("Pas de flux GTFS, utilisation OSM")
-            osm_data = TransitAPIManager.get_transit_data_overpass(lat, lon)
-            
-            # Créer des associations stop_times basiques pour OSM
-            stop_times_dict = defaultdict(list)
-            stops_dict = {stop['id']: stop for stop in osm_data['stops']}
-            routes_dict = {route['id']: route for route in osm_data['routes']}
-            
-            # Pour chaque arrêt, créer des fake stop_times liés aux routes proches
-            for stop_id, stop in stops_dict.items():
-                # Associer chaque route à chaque arrêt (approximation)
-                for route_id, route in routes_dict.items():
-                    # Créer un fake trip
-                    trip_id = f"{route_id}_trip"
-                    stop_times_dict[stop_id].append({
-                        'trip_id': trip_id,
-                        'departure_time': '08:00:00',  # Horaire factice
-                        'arrival_time': '08:00:00'
-                    })
-            
-            # Créer des trips qui lient routes et stop_times
-            trips_dict = {}
-            for route_id in routes_dict.keys():
-                trip_id = f"{route_id}_trip"
-                trips_dict[trip_id] = {
-                    'trip_id': trip_id,
-                    'route_id': route_id,
-                    'headsign': 'Direction Centre'
-                }
-            
-            with cache_lock:
-                gtfs_cache[region_key] = {
-                    'stops': stops_dict,
-                    'routes': routes_dict,
-                    'trips': trips_dict,
-                    'stop_times': stop_times_dict,
-                    'source': 'osm',
-                    'loaded_at': datetime.now()
-                }
-            
-            logger.info(f"✓ OSM enrichi: {len(stops_dict)} arrêts, {len(routes_dict)} routes, liens créés")
-            return gtfs_cache[region_key]
-        
-        # Charger le premier flux GTFS disponible
-        feed = feeds[0]
-        gtfs_data = GTFSManager.download_and_parse_gtfs(
-            feed.get('url') or feed.get('direct_download_url'),
-            lat, 
-            lon
-        )
+        # Parser les fichiers essentiels
+        stops = {}
+        routes = {}
+        trips = {}
+        timetable = TimetableStore()
         
-        if gtfs_data:
-            with cache_lock:
-                gtfs_cache[region_key] = {
-                    **gtfs_data,
-                    'source': 'gtfs',
-                    'loaded_at': datetime.now()
-                }
-            return gtfs_cache[region_key]
+        # stops.txt
+        try:
+            with zip_file.open('stops.txt') as f:
+                reader = csv.DictReader(io.TextIOWrapper(f, 'utf-8-sig'))
+                for row in reader:
+                    stops[row['stop_id']] = {
+                        'id': row['stop_id'],
+                        'name': row['stop_name'],
+                        'lat': float(row['stop_lat']),
+                        'lon': float(row['stop_lon']),
+                        'code': row.get('stop_code', '')
+                    }
+        except Exception as e:
+            logger.error(f"Erreur parsing stops.txt: {e}")
         
-        # Si échec GTFS, fallback vers OSM
-        logger.warning("Échec chargement GTFS, fallback OSM")
-        osm_data = TransitAPIManager.get_transit_data_overpass(lat, lon)
+        # routes.txt
+        try:
+            with zip_file.open('routes.txt') as f:
+                reader = csv.DictReader(io.TextIOWrapper(f, 'utf-8-sig'))
+                for row in reader:
+                    routes[row['route_id']] = {
+                        'id': row['route_id'],
+                        'short_name': row.get('route_short_name', ''),
+                        'long_name': row.get('route_long_name', ''),
+                        'type': GTFSManager.get_route_type_name(row.get('route_type', '3')),
+                        'color': '#' + row.get('route_color', '0066CC')
+                    }
+        except Exception as e:
+            logger.error(f"Erreur parsing routes.txt: {e}")
         
-        # Créer des associations stop_times basiques pour OSM
-        stop_times_dict = defaultdict(list)
-        stops_dict = {stop['id']: stop for stop in osm_data['stops']}
-        routes_dict = {route['id']: route for route in osm_data['routes']}
-        
-        # Pour chaque arrêt, créer des fake stop_times liés aux routes proches
-        for stop_id, stop in stops_dict.items():
-            # Associer chaque route à chaque arrêt (approximation)
-            for route_id, route in routes_dict.items():
-                # Créer un fake trip
-                trip_id = f"{route_id}_trip"
-                stop_times_dict[stop_id].append({
-                    'trip_id': trip_id,
-                    'departure_time': '08:00:00',  # Horaire factice
-                    'arrival_time': '08:00:00'
-                })
+        # trips.txt
+        try:
+            with zip_file.open('trips.txt') as f:
+                reader = csv.DictReader(io.TextIOWrapper(f, 'utf-8-sig'))
+                for row in reader:
+                    trips[row['trip_id']] = {
+                        'route_id': row['route_id'],
+                        'service_id': row['service_id'],
+                        'headsign': row.get('trip_headsign', '')
+                    }
+        except Exception as e:
+            logger.error(f"Erreur parsing trips.txt: {e}")
         
-        # Créer des trips qui lient routes et stop_times
-        trips_dict = {}
-        for route_id in routes_dict.keys():
-            trip_id = f"{route_id}_trip"
-            trips_dict[trip_id] = {
-                'trip_id': trip_id,
-                'route_id': route_id,
-                'headsign': 'Direction Centre'
-            }
+        # calendar.txt / calendar_dates.txt (facultatifs : sans calendrier, tous les trips sont actifs)
+        rules, exceptions = [], []
+        day_columns = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+        try:
+            if 'calendar.txt' in zip_file.namelist():
+                with zip_file.open('calendar.txt') as f:
+                    for row in csv.DictReader(io.TextIOWrapper(f, 'utf-8-sig')):
+                        mask = sum(1 << i for i, column in enumerate(day_columns) if row.get(column, '').strip() == '1')
+                        rules.append((row['service_id'], mask,
+                                      parse_gtfs_date(row['start_date']), parse_gtfs_date(row['end_date'])))
+            if 'calendar_dates.txt' in zip_file.namelist():
+                with zip_file.open('calendar_dates.txt') as f:
+                    for row in csv.DictReader(io.TextIOWrapper(f, 'utf-8-sig')):
+                        exceptions.append((row['service_id'], parse_gtfs_date(row['date']), int(row['exception_type'])))
+        except Exception as e:
+            logger.error(f"Erreur parsing calendrier: {e}")
+            rules, exceptions = [], []
         
-        with cache_lock:
-            gtfs_cache[region_key] = {
-                'stops': stops_dict,
-                'routes': routes_dict,
-                'trips': trips_dict,
-                'stop_times': stop_times_dict,
-                'source': 'osm',
-                'loaded_at': datetime.now()
-            }
+        # Index spatial des arrêts (réutilisé pour les recherches de proximité)
+        stop_index = StopSpatialIndex(stops)
         
-        logger.info(f"✓ OSM enrichi (fallback): {len(stops_dict)} arrêts, {len(routes_dict)} routes")
-        return gtfs_cache[region_key]
-    
-    @staticmethod
-    def download_and_parse_gtfs(url, center_lat, center_lon):
-        """Télécharge et parse un flux GTFS avec filtrage géographique"""
+        # stop_times.txt (flux complet, ou arrêts à 5km du centre), lecture en flux par blocs
         try:
-            logger.info(f"Téléchargement GTFS: {url}")
-            response = requests.get(url, timeout=60, stream=True)
-            response.raise_for_status()
-            
-            # Charger le ZIP
-            zip_file = zipfile.ZipFile(io.BytesIO(response.content))
-            
-            # Parser les fichiers essentiels
-            stops = {}
-            routes = {}
-            trips = {}
-            stop_times = defaultdict(list)
-            
-            # stops.txt
-            try:
-                with zip_file.open('stops.txt') as f:
-                    reader = csv.DictReader(io.TextIOWrapper(f, 'utf-8-sig'))
-                    for row in reader:
-                        stops[row['stop_id']] = {
-                            'id': row['stop_id'],
-                            'name': row['stop_name'],
-                            'lat': float(row['stop_lat']),
-                            'lon': float(row['stop_lon']),
-                            'code': row.get('stop_code', '')
-                        }
-            except Exception as e:
-                logger.error(f"Erreur parsing stops.txt: {e}")
-            
-            # routes.txt
-            try:
-                with zip_file.open('routes.txt') as f:
-                    reader = csv.DictReader(io.TextIOWrapper(f, 'utf-8-sig'))
-                    for row in reader:
-                        routes[row['route_id']] = {
-                            'id': row['route_id'],
-                            'short_name': row.get('route_short_name', ''),
-                            'long_name': row.get('route_long_name', ''),
-                            'type': GTFSManager.get_route_type_name(row.get('route_type', '3')),
-                            'color': '#' + row.get('route_color', '0066CC')
-                        }
-            except Exception as e:
-                logger.error(f"Erreur parsing routes.txt: {e}")
-            
-            # trips.txt
-            try:
-                with zip_file.open('trips.txt') as f:
-                    reader = csv.DictReader(io.TextIOWrapper(f, 'utf-8-sig'))
-                    for row in reader:
-                        trips[row['trip_id']] = {
-                            'route_id': row['route_id'],
-                            'service_id': row['service_id'],
-                            'headsign': row.get('trip_headsign', '')
-                        }
-            except Exception as e:
-                logger.error(f"Erreur parsing trips.txt: {e}")
-            
-            # stop_times.txt (CHARGEMENT INTELLIGENT par zone géographique)
-            try:
-                # Identifier arrêts dans la zone (rayon 5km)
-                relevant_stops = set()
-                for stop_id, stop in stops.items():
-                    dist = haversine_distance(center_lat, center_lon, stop['lat'], stop['lon'])
-                    if dist <= 5.0:  # 5km radius
-                        relevant_stops.add(stop_id)
-                
+            # Identifier arrêts dans la zone (rayon 5km), ou tout le flux sans centre
+            if center_lat is None or center_lon is None:
+                relevant_stops = stops
+                logger.info(f"📍 Flux complet: {len(stops)} arrêts")
+            else:
+                relevant_stops = {stop_id for stop_id, _ in stop_index.within(center_lat, center_lon, 5.0, sort=False)}
                 logger.info(f"📍 Arrêts pertinents (rayon 5km): {len(relevant_stops)}/{len(stops)}")
+            
+            with zip_file.open('stop_times.txt') as f:
+                text = io.TextIOWrapper(io.BufferedReader(f, GTFS_PARSE_BUFFER_SIZE), 'utf-8-sig')
+                reader = csv.reader(text)
+                header = next(reader, [])
+                trip_col, stop_col, arrival_col, departure_col, sequence_col = (
+                    header.index(name) for name in
+                    ('trip_id', 'stop_id', 'arrival_time', 'departure_time', 'stop_sequence')
+                )
                 
-                # Charger SEULEMENT stop_times pour arrêts pertinents
-                with zip_file.open('stop_times.txt') as f:
-                    reader = csv.DictReader(io.TextIOWrapper(f, 'utf-8-sig'))
-                    count = 0
-                    loaded = 0
-                    for row in reader:
-                        count += 1
-                        stop_id = row['stop_id']
-                        
-                        # Filtrer par arrêts pertinents
-                        if stop_id in relevant_stops:
-                            stop_times[stop_id].append({
-                                'trip_id': row['trip_id'],
-                                'arrival_time': row['arrival_time'],
-                                'departure_time': row['departure_time'],
-                                'stop_sequence': int(row['stop_sequence'])
-                            })
-                            loaded += 1
+                # Horaires très répétés: conversion mémorisée
+                times = {}
+                append = timetable.append
+                count = 0
+                loaded = 0
+                for row in reader:
+                    count += 1
+                    stop_id = row[stop_col]
+                    
+                    # Filtrer par arrêts pertinents
+                    if stop_id in relevant_stops:
+                        arrival, departure = row[arrival_col], row[departure_col]
+                        arrival_secs = times.get(arrival)
+                        if arrival_secs is None:
+                            arrival_secs = times[arrival] = parse_gtfs_time(arrival)
+                        departure_secs = times.get(departure)
+                        if departure_secs is None:
+                            departure_secs = times[departure] = parse_gtfs_time(departure)
+                        append(row[trip_col], stop_id, arrival_secs, departure_secs, int(row[sequence_col]))
+                        loaded += 1
                         
-                        # Sécurité: limite absolue
-                        if count > 2000000:
-                            logger.warning(f"⚠️ Limite 2M lignes atteinte")
-                            break
+                        # Budget mémoire du timetable (au lieu d'une limite fixe de lignes)
+                        if max_rows is not None and loaded > max_rows:
+                            raise GTFSBudgetExceeded(
+                                f"stop_times au-delà du budget de {memory_budget_mb:g} Mo "
+                                f"({loaded} lignes après {count} parcourues)"
+                            )
                     
-                    logger.info(f"📊 Stop_times: {loaded} chargés (sur {count} parcourus)")
-            except Exception as e:
-                logger.error(f"Erreur parsing stop_times.txt: {e}")
-            
-            logger.info(f"✓ GTFS: {len(stops)} arrêts, {len(routes)} lignes, {len(trips)} trajets")
-            
-            return {
-                'stops': stops,
-                'routes': routes,
-                'trips': trips,
-                'stop_times': stop_times
-            }
-            
+                    if count % GTFS_PARSE_LOG_STEP == 0:
+                        logger.info(f"📊 Stop_times: {count} lignes parcourues, {loaded} chargées")
+                
+                logger.info(f"📊 Stop_times: {loaded} chargés (sur {count} parcourus)")
+        except GTFSBudgetExceeded:
+            raise
         except Exception as e:
-            logger.error(f"Erreur téléchargement GTFS: {e}")
-            return None
+            logger.error(f"Erreur parsing stop_times.txt: {e}")
+        
+        logger.info(f"✓ GTFS: {len(stops)} arrêts, {len(routes)} lignes, {len(trips)} trajets")
+        
+        timetable.finalize(trips)
+        
+        calendar = None
+        if rules or exceptions:
+            calendar = ServiceCalendar.build(rules, exceptions).bind(timetable.trip_ids, trips)
+            calendar.precompute(datetime.now().date() - timedelta(days=1))
+            logger.info(f"📅 Calendrier: {len(calendar.service_ids)} services, {len(exceptions)} exceptions")
+        
+        return {
+            'stops': stops,
+            'routes': routes,
+            'trips': trips,
+            'timetable': timetable,
+            'stop_index': stop_index,
+            'planner': JourneyPlanner(timetable, stops),
+            'calendar': calendar
+        }
     
     @staticmethod
     def get_route_type_name(route_type):
@@ -578,75 +3356,123 @@ class GTFSManager:
         return types.get(str(route_type), 'Bus')
     
     @staticmethod
-    def find_nearby_stops(gtfs_data, lat, lon, radius_km=0.5):
-        """Trouve les arrêts à proximité"""
+    def nearby_stop_pairs(gtfs_data, start_lat, start_lon, end_lat, end_lon, limit):
+        """Arrêts candidats (2km, `limit` plus proches) au départ et à l'arrivée"""
+        return (GTFSManager.find_nearby_stops(gtfs_data, start_lat, start_lon, 2.0, limit=limit),
+                GTFSManager.find_nearby_stops(gtfs_data, end_lat, end_lon, 2.0, limit=limit))
+    
+    @staticmethod
+    def find_nearby_stops(gtfs_data, lat, lon, radius_km=0.5, limit=None):
+        """Trouve les arrêts à proximité (via l'index spatial du flux)"""
         if not gtfs_data or 'stops' not in gtfs_data:
             return []
         
+        stop_index = gtfs_data.get('stop_index') or StopSpatialIndex(gtfs_data['stops'])
+        if limit:
+            candidates = stop_index.nearest(lat, lon, limit, max_radius_km=radius_km)
+        else:
+            candidates = stop_index.within(lat, lon, radius_km, sort=False)
+        
         nearby = []
-        for stop_id, stop in gtfs_data['stops'].items():
-            distance = haversine_distance(lat, lon, stop['lat'], stop['lon'])
-            if distance <= radius_km:
-                nearby.append({
-                    **stop,
-                    'distance': round(distance * 1000, 0)  # en mètres
-                })
+        for stop_id, distance in candidates:
+            nearby.append({
+                **gtfs_data['stops'][stop_id],
+                'distance': round(distance * 1000, 0)  # en mètres
+            })
         
         nearby.sort(key=lambda x: x['distance'])
         return nearby
     
+    @staticmethod
+    def describe_route(gtfs_data, route_id):
+        """Copie d'une route avec tous les champs nécessaires à l'affichage, None si inconnue"""
+        if route_id not in gtfs_data.get('routes', {}):
+            return None
+        
+        route = gtfs_data['routes'][route_id].copy()
+        # S'assurer que tous les champs sont présents
+        if 'color' not in route or not route['color']:
+            route['color'] = '#0066CC'
+        if 'type' not in route or not route['type']:
+            route['type'] = 'Bus'
+        if 'short_name' not in route:
+            route['short_name'] = route.get('long_name', 'N/A')
+        route['id'] = route_id  # Important pour le filtrage
+        return route
+    
+    @staticmethod
+    def plan_journey(gtfs_data, start_lat, start_lon, end_lat, end_lon, departure_time=None, max_transfers=None,
+                     walking=None):
+        """
+        Itinéraire sur les horaires réels (RAPTOR): marche d'accès vers les arrêts proches,
+        trajets en véhicule avec correspondances, marche finale. None si aucun itinéraire.
+        walking: (arrêts de départ, arrêts d'arrivée, marches d'accès, marches finales) déjà calculés
+        (mode asynchrone), sinon arrêts cherchés ici et marches demandées à ORS.
+        """
+        planner = gtfs_data.get('planner') if gtfs_data else None
+        if not planner:
+            return None
+        
+        if walking is None:
+            start_stops, end_stops = GTFSManager.nearby_stop_pairs(gtfs_data, start_lat, start_lon, end_lat, end_lon,
+                                                                   PLANNER_ACCESS_STOPS)
+            if not start_stops or not end_stops:
+                return None
+            
+            # Marches d'accès/finales vers tous les arrêts candidats (matrice ORS, sinon ligne droite)
+            access_legs, egress_legs = get_walking_legs(
+                start_lat, start_lon, start_stops, end_stops, end_lat, end_lon, fallback='estimate'
+            )
+        else:
+            start_stops, end_stops, access_legs, egress_legs = walking
+            if not start_stops or not end_stops:
+                return None
+        sources = {stop['id']: int(leg[1] * 60) for stop, leg in zip(start_stops, access_legs)}
+        targets = {stop['id']: int(leg[1] * 60) for stop, leg in zip(end_stops, egress_legs)}
+        
+        departure_time = departure_time or datetime.now()
+        departure = departure_time.hour * 3600 + departure_time.minute * 60 + departure_time.second
+        
+        # Trips en service le jour de départ (ou la veille pour les horaires >= 24:00)
+        calendar = gtfs_data.get('calendar')
+        trip_filter = (lambda shift: calendar.trip_filter(departure_time.date() - timedelta(seconds=shift))) \
+            if calendar else None
+        journey = planner.plan(sources, targets, departure, max_transfers, trip_filter)
+        if not journey:
+            return None
+        
+        # Marches réelles pour les arrêts retenus
+        access_by_stop = dict(zip((stop['id'] for stop in start_stops), access_legs))
+        egress_by_stop = dict(zip((stop['id'] for stop in end_stops), egress_legs))
+        journey['walk_start'] = access_by_stop[journey['start_stop']]
+        journey['walk_end'] = egress_by_stop[journey['end_stop']]
+        
+        stops_by_id = {stop['id']: stop for stop in start_stops + end_stops}
+        journey['start_stop'] = stops_by_id.get(journey['start_stop']) or gtfs_data['stops'][journey['start_stop']]
+        journey['end_stop'] = stops_by_id.get(journey['end_stop']) or gtfs_data['stops'][journey['end_stop']]
+        return journey
+    
     @staticmethod
     def find_connecting_routes(gtfs_data, start_stop_id, end_stop_id, limit=5):
         """Trouve les lignes qui connectent deux arrêts via analyse des trips"""
-        if not gtfs_data or 'stop_times' not in gtfs_data or 'trips' not in gtfs_data:
+        if not gtfs_data or 'timetable' not in gtfs_data or 'trips' not in gtfs_data:
             return []
         
-        connecting_routes = set()
+        timetable = gtfs_data['timetable']
         
-        # Méthode 1: Analyser les trips qui passent par les deux arrêts dans le bon ordre
-        if start_stop_id in gtfs_data['stop_times'] and end_stop_id in gtfs_data['stop_times']:
-            # Trips passant par le départ
-            start_trips = {}
-            for st in gtfs_data['stop_times'][start_stop_id]:
-                trip_id = st['trip_id']
-                start_trips[trip_id] = st.get('stop_sequence', 0)
-            
-            # Vérifier si ces trips passent aussi par l'arrivée (après le départ)
-            for st in gtfs_data['stop_times'][end_stop_id]:
-                trip_id = st['trip_id']
-                end_sequence = st.get('stop_sequence', 0)
-                
-                # Si le trip passe par départ ET arrivée dans le bon ordre
-                if trip_id in start_trips:
-                    start_sequence = start_trips[trip_id]
-                    if start_sequence < end_sequence:  # Bon ordre
-                        if trip_id in gtfs_data['trips']:
-                            route_id = gtfs_data['trips'][trip_id]['route_id']
-                            connecting_routes.add(route_id)
+        # Méthode 1: routes dont un pattern passe par les deux arrêts dans le bon ordre
+        connecting_routes = timetable.routes_between(start_stop_id, end_stop_id)
         
         # Méthode 2 (fallback): Si pas de routes directes, prendre routes du départ
         if not connecting_routes:
             logger.info("🔄 Aucune route directe, utilisation des routes de départ")
-            if start_stop_id in gtfs_data['stop_times']:
-                for st in gtfs_data['stop_times'][start_stop_id]:
-                    trip_id = st['trip_id']
-                    if trip_id in gtfs_data['trips']:
-                        route_id = gtfs_data['trips'][trip_id]['route_id']
-                        connecting_routes.add(route_id)
+            connecting_routes = timetable.routes_at(start_stop_id)
         
         # Construire la liste de routes
         routes = []
         for rid in connecting_routes:
-            if rid in gtfs_data.get('routes', {}):
-                route = gtfs_data['routes'][rid].copy()
-                # S'assurer que tous les champs sont présents
-                if 'color' not in route or not route['color']:
-                    route['color'] = '#0066CC'
-                if 'type' not in route or not route['type']:
-                    route['type'] = 'Bus'
-                if 'short_name' not in route:
-                    route['short_name'] = route.get('long_name', 'N/A')
-                route['id'] = rid  # Important pour le filtrage
+            route = GTFSManager.describe_route(gtfs_data, rid)
+            if route:
                 routes.append(route)
         
         # Trier : Tram/Métro d'abord, puis par nom
@@ -663,30 +3489,19 @@ class GTFSManager:
     @staticmethod
     def get_routes_at_stop(gtfs_data, stop_id, limit=5):
         """Obtient les lignes desservant un arrêt (limitées aux plus pertinentes)"""
-        if not gtfs_data or 'stop_times' not in gtfs_data:
+        if not gtfs_data or 'timetable' not in gtfs_data:
             return []
         
-        if stop_id not in gtfs_data['stop_times']:
+        timetable = gtfs_data['timetable']
+        if not timetable.has_stop(stop_id):
             return []
         
-        route_ids = set()
-        for st in gtfs_data['stop_times'][stop_id]:
-            trip_id = st['trip_id']
-            if trip_id in gtfs_data.get('trips', {}):
-                route_ids.add(gtfs_data['trips'][trip_id]['route_id'])
+        route_ids = timetable.routes_at(stop_id)
         
         routes = []
         for rid in route_ids:
-            if rid in gtfs_data.get('routes', {}):
-                route = gtfs_data['routes'][rid].copy()
-                # S'assurer que tous les champs nécessaires sont présents
-                if 'color' not in route or not route['color']:
-                    route['color'] = '#0066CC'  # Couleur par défaut
-                if 'type' not in route or not route['type']:
-                    route['type'] = 'Bus'
-                if 'short_name' not in route:
-                    route['short_name'] = route.get('long_name', 'N/A')
-                route['id'] = rid  # Important pour le filtrage
+            route = GTFSManager.describe_route(gtfs_data, rid)
+            if route:
                 routes.append(route)
         
         # Limiter au nombre de routes demandé (prioriser tram/métro > bus)
@@ -698,73 +3513,299 @@ class GTFSManager:
         return routes[:limit]
     
     @staticmethod
-    def get_next_departures(gtfs_data, stop_id, limit=5, route_filter=None):
-        """Obtient les prochains départs (filtrés par routes pertinentes)"""
-        if not gtfs_data or 'stop_times' not in gtfs_data:
+    def get_next_departures(gtfs_data, stop_id, limit=5, route_filter=None, at=None):
+        """
+        Obtient les prochains départs (filtrés par routes pertinentes).
+        Recherche dichotomique dans l'index trié des départs à partir de `at` (défaut: maintenant).
+        """
+        if not gtfs_data or 'timetable' not in gtfs_data:
             return []
         
-        if stop_id not in gtfs_data['stop_times']:
+        timetable = gtfs_data['timetable']
+        if not timetable.has_stop(stop_id):
             return []
         
-        now = datetime.now()
-        current_time = now.strftime('%H:%M:%S')
+        now = at or datetime.now()
+        trips = gtfs_data.get('trips', {})
+        routes = gtfs_data.get('routes', {})
         
+        # Pour OSM, horaires estimés générés à la demande pour les lignes de l'arrêt
+        if gtfs_data.get('source') == 'osm':
+            current_seconds = now.hour * 3600 + now.minute * 60 + now.second
+            stops = gtfs_data['stops']
+            departures = []
+            for departure, route_id in itertools.islice(
+                timetable.departures_after(stop_id, current_seconds, route_filter), limit
+            ):
+                route = routes.get(route_id, {})
+                # Direction de la relation complète ; à défaut, dernier arrêt dans la zone chargée
+                headsign = timetable.headsign(route_id) or stops.get(timetable.terminus(route_id), {}).get('name')
+                departures.append({
+                    'time': format_gtfs_time(departure),
+                    'route': route.get('short_name') or route.get('long_name', 'N/A'),
+                    'headsign': headsign or 'Direction Centre',
+                    'type': route.get('type', 'Bus'),
+                    'color': route.get('color', '#0066CC'),
+                    'estimated': True  # Marquer comme estimé
+                })
+            return departures
+        
+        # GTFS réel: parcours chronologique depuis l'heure courante, arrêt dès `limit` départs
+        # Trips hors service (calendrier) du jour ou de la veille écartés en O(1)
+        current_seconds = now.hour * 3600 + now.minute * 60 + now.second
+        calendar = gtfs_data.get('calendar')
+        if calendar:
+            active = {0: calendar.trip_filter(now.date()),
+                      -1: calendar.trip_filter(now.date() - timedelta(days=1))}
         departures = []
-        for st in gtfs_data['stop_times'][stop_id]:
-            dep_time = st['departure_time']
+        for departure, trip_idx, service_day in timetable.departures_after(stop_id, current_seconds):
+            if calendar and not active[service_day](trip_idx):
+                continue
+            trip = trips.get(timetable.trip_ids[trip_idx])
+            if not trip:
+                continue
+            route_id = trip['route_id']
             
-            # Gérer heures > 24
-            parts = dep_time.split(':')
-            hours = int(parts[0])
-            if hours >= 24:
-                dep_time = f"{hours-24:02d}:{parts[1]}:{parts[2]}"
+            # Filtrer par routes pertinentes si fourni
+            if route_filter and route_id not in route_filter:
+                continue
             
-            # Filtrer par heure actuelle ou générer horaires factices
-            if dep_time >= current_time or gtfs_data.get('source') == 'osm':
-                trip_id = st['trip_id']
-                if trip_id in gtfs_data.get('trips', {}):
-                    trip = gtfs_data['trips'][trip_id]
-                    route_id = trip['route_id']
-                    
-                    # Filtrer par routes pertinentes si fourni
-                    if route_filter and route_id not in route_filter:
-                        continue
-                    
-                    if route_id in gtfs_data.get('routes', {}):
-                        route = gtfs_data['routes'][route_id]
-                        
-                        # Pour OSM, générer horaires réalistes
-                        if gtfs_data.get('source') == 'osm':
-                            # Générer 3 horaires dans les 30 prochaines minutes
-                            base_minutes = (now.hour * 60 + now.minute)
-                            for offset in [5, 15, 25]:
-                                future_minutes = base_minutes + offset
-                                future_hour = future_minutes // 60
-                                future_min = future_minutes % 60
-                                fake_time = f"{future_hour:02d}:{future_min:02d}:00"
-                                
-                                departures.append({
-                                    'time': fake_time,
-                                    'route': route.get('short_name') or route.get('long_name', 'N/A'),
-                                    'headsign': trip.get('headsign', 'Direction Centre'),
-                                    'type': route.get('type', 'Bus'),
-                                    'color': route.get('color', '#0066CC'),
-                                    'estimated': True  # Marquer comme estimé
-                                })
-                            break  # Une seule fois pour OSM
-                        else:
-                            # GTFS réel
-                            departures.append({
-                                'time': dep_time,
-                                'route': route.get('short_name') or route.get('long_name', 'N/A'),
-                                'headsign': trip.get('headsign', ''),
-                                'type': route.get('type', 'Bus'),
-                                'color': route.get('color', '#0066CC'),
-                                'estimated': False  # Horaire réel
-                            })
-        
-        departures.sort(key=lambda x: x['time'])
-        return departures[:limit]
+            if route_id in routes:
+                route = routes[route_id]
+                departures.append({
+                    'time': format_gtfs_time(departure),
+                    'route': route.get('short_name') or route.get('long_name', 'N/A'),
+                    'headsign': trip.get('headsign', ''),
+                    'type': route.get('type', 'Bus'),
+                    'color': route.get('color', '#0066CC'),
+                    'estimated': False  # Horaire réel
+                })
+                if len(departures) >= limit:
+                    break
+        
+        return departures
+
+
+def sampled_sizeof(mapping, sample=256):
+    """
+    Taille mémoire estimée d'un dict (octets) : conteneur + taille moyenne d'un échantillon
+    de clés/valeurs (un niveau de profondeur) multipliée par le nombre d'entrées
+    """
+    size = sys.getsizeof(mapping)
+    if not mapping:
+        return size
+    
+    def shallow(value):
+        total = sys.getsizeof(value)
+        if isinstance(value, dict):
+            total += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+        elif isinstance(value, (list, tuple)):
+            total += sum(sys.getsizeof(v) for v in value)
+        return total
+    
+    keys = list(itertools.islice(mapping, sample))
+    per_entry = sum(sys.getsizeof(key) + shallow(mapping[key]) for key in keys) / len(keys)
+    return size + int(per_entry * len(mapping))
+
+
+def gtfs_memory_usage():
+    """Empreinte mémoire des flux en cache (octets), par flux et totale"""
+    with cache_lock:
+        feeds = {key: entry['footprint'] for key, entry in gtfs_cache.items() if entry.get('footprint')}
+    return {
+        'feeds': feeds,
+        'total': sum(footprint['total'] for footprint in feeds.values()),
+        'budget_mb': GTFS_MEMORY_BUDGET_MB
+    }
+
+
+def region_key_for(lat, lon):
+    """Clé de région (coordonnées arrondies à 0.01°)"""
+    return f"{round(lat, 2)}_{round(lon, 2)}"
+
+
+def parse_regions(value):
+    """Liste "lat,lon;lat,lon" -> [(lat, lon)] (entrées invalides ignorées)"""
+    regions = []
+    for item in (value or '').split(';'):
+        if not item.strip():
+            continue
+        try:
+            lat, lon = (float(part) for part in item.split(','))
+            regions.append((lat, lon))
+        except ValueError:
+            logger.warning(f"Région de préchargement invalide ignorée: {item!r}")
+    return regions
+
+
+class RegionScheduler:
+    """
+    Préchargement et rafraîchissement en arrière-plan de gtfs_cache.
+    Les flux des régions configurées et les plus demandées sont rechargés avant expiration ;
+    une entrée expirée reste servie pendant son rechargement (stale-while-revalidate).
+    Démarré au lancement de chaque processus (hook gunicorn post_worker_init, lifespan ASGI, python app.py),
+    sinon à sa première requête ; un processus forké redémarre le sien (vérification du pid).
+    """
+    
+    def __init__(self, warmup_regions, hot_limit, hot_file):
+        self.warmup_regions = warmup_regions
+        self.hot_limit = hot_limit
+        self.hot_file = hot_file
+        self.lock = threading.Lock()
+        self.pid = None
+        self.executor = None
+        self.refreshing = set()
+        self.requests = {}  # region_key -> [nombre de demandes, dernière demande (timestamp)]
+        self.warmup = {'state': 'idle', 'regions': 0, 'loaded': 0, 'failed': 0,
+                       'started_at': None, 'finished_at': None}
+    
+    def ensure_started(self):
+        """Démarre le préchargement et la boucle de rafraîchissement (une fois par processus)"""
+        pid = os.getpid()
+        if self.pid == pid:
+            return
+        with self.lock:
+            if self.pid == pid:
+                return
+            self.pid = pid
+            self.refreshing = set()
+            self.executor = ThreadPoolExecutor(max_workers=GTFS_REFRESH_WORKERS, thread_name_prefix='gtfs-refresh')
+            self.warmup['state'] = 'running'
+        threading.Thread(target=self._run, name='gtfs-scheduler', daemon=True).start()
+    
+    def record(self, region_key):
+        """Compte une demande pour apprendre les régions chaudes"""
+        with self.lock:
+            entry = self.requests.setdefault(region_key, [0, 0.0])
+            entry[0] += 1
+            entry[1] = time.time()
+    
+    def hot_regions(self):
+        """Régions les plus demandées sur la dernière période de validité du cache"""
+        since = time.time() - GTFS_CACHE_TTL.total_seconds()
+        with self.lock:
+            recent = [(count, key) for key, (count, last) in self.requests.items() if last >= since]
+        return [key for _, key in sorted(recent, reverse=True)[:self.hot_limit]]
+    
+    def refresh_async(self, feed_key):
+        """Planifie le rechargement d'un flux en cache ; False si le planificateur n'est pas démarré"""
+        with self.lock:
+            if self.executor is None or self.pid != os.getpid():
+                return False
+            if feed_key in self.refreshing:
+                return True
+            self.refreshing.add(feed_key)
+        self.executor.submit(self._refresh, feed_key)
+        return True
+    
+    def _refresh(self, feed_key):
+        """Recharge un flux en cache depuis la position qui l'a chargé"""
+        try:
+            with cache_lock:
+                current = gtfs_cache.get(feed_key)
+            if current is None:
+                return False
+            GTFSManager.refresh_region(*current['center'], current=current)
+            logger.info(f"♻️  Flux {feed_key} rechargé")
+            return True
+        except Exception as e:
+            logger.error(f"Erreur rechargement flux {feed_key}: {e}")
+            return False
+        finally:
+            with self.lock:
+                self.refreshing.discard(feed_key)
+    
+    def _load_region(self, region_key):
+        """Charge (si besoin) le flux couvrant une région de préchargement"""
+        try:
+            lat, lon = (float(part) for part in region_key.split('_'))
+            _, current = GTFSManager.find_loaded_feed(lat, lon)
+            if current is None or datetime.now() - current['loaded_at'] >= GTFS_CACHE_TTL:
+                GTFSManager.refresh_region(lat, lon, current=current)
+            return True
+        except Exception as e:
+            logger.error(f"Erreur préchargement région {region_key}: {e}")
+            return False
+    
+    def _run(self):
+        self._warmup()
+        while True:
+            time.sleep(GTFS_SCHEDULER_INTERVAL_S)
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Erreur planificateur GTFS: {e}")
+    
+    def _warmup(self):
+        """Charge les régions configurées et les régions chaudes des exécutions précédentes"""
+        keys = [region_key_for(lat, lon) for lat, lon in self.warmup_regions]
+        for key in self._load_hot_file():
+            if key not in keys:
+                keys.append(key)
+        
+        self.warmup.update(state='running', regions=len(keys), started_at=datetime.now().isoformat())
+        if keys:
+            logger.info(f"🔥 Préchargement GTFS: {len(keys)} région(s)")
+        
+        for key in keys:
+            self.warmup['loaded' if self._load_region(key) else 'failed'] += 1
+        
+        self.warmup.update(state='done', finished_at=datetime.now().isoformat())
+    
+    def tick(self):
+        """Recharge avant expiration les flux des régions suivies, libère les flux expirés abandonnés"""
+        now = datetime.now()
+        hot = self.hot_regions()
+        tracked_regions = {region_key_for(lat, lon) for lat, lon in self.warmup_regions} | set(hot)
+        
+        with cache_lock:
+            tracked = {region_feeds[key] for key in tracked_regions if key in region_feeds}
+            entries = list(gtfs_cache.items())
+        for key, entry in entries:
+            age = now - entry['loaded_at']
+            if key in tracked and age >= GTFS_CACHE_TTL - GTFS_REFRESH_AHEAD:
+                self.refresh_async(key)
+            elif key not in tracked and age >= GTFS_CACHE_TTL + GTFS_STALE_GRACE:
+                with cache_lock:
+                    if gtfs_cache.get(key) is entry:
+                        del gtfs_cache[key]
+                        for region in [r for r, feed in region_feeds.items() if feed == key]:
+                            del region_feeds[region]
+                logger.info(f"🗑️  Flux {key} expiré retiré du cache")
+        
+        self._save_hot_file(hot)
+    
+    def _load_hot_file(self):
+        try:
+            with open(self.hot_file) as f:
+                return [key for key in json.load(f) if isinstance(key, str)][:self.hot_limit]
+        except (OSError, ValueError):
+            return []
+    
+    def _save_hot_file(self, keys):
+        if not keys:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.hot_file) or '.', exist_ok=True)
+            tmp_path = f"{self.hot_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(keys, f)
+            os.replace(tmp_path, self.hot_file)
+        except OSError as e:
+            logger.warning(f"Écriture des régions chaudes impossible: {e}")
+    
+    def status(self):
+        """État du préchargement et des rechargements en cours"""
+        with self.lock:
+            refreshing = sorted(self.refreshing)
+        return {**self.warmup, 'refreshing': refreshing, 'hot_regions': self.hot_regions()}
+
+
+region_scheduler = RegionScheduler(
+    parse_regions(GTFS_WARMUP_REGIONS),
+    hot_limit=GTFS_HOT_REGIONS,
+    hot_file=os.path.join(CACHE_DIR, 'hot_regions.json')
+)
 
 
 def haversine_distance(lat1, lon1, lat2, lon2):
@@ -781,75 +3822,206 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     return R * c
 
 
-def geocode(address):
-    """Géocode une adresse avec Photon (+ fallback Nominatim) OU utilise coordonnées directes"""
+def haversine_batch(lat, lon, lats, lons):
+    """Distances haversine (km) d'un point vers un tableau de points (NumPy)"""
+    R = 6371  # Rayon Terre en km
+    
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    lon2 = np.radians(np.asarray(lons, dtype=np.float64))
+    
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * R * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_matrix(lats1, lons1, lats2, lons2):
+    """Matrice N×M des distances haversine (km) entre deux ensembles de points"""
+    R = 6371  # Rayon Terre en km
+    
+    lat1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, None]
+    lon1 = np.radians(np.asarray(lons1, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=np.float64))[None, :]
+    lon2 = np.radians(np.asarray(lons2, dtype=np.float64))[None, :]
+    
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * R * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def parse_gtfs_date(value):
+    """Date GTFS 'YYYYMMDD' -> ordinal (date.toordinal)"""
+    value = value.strip()
+    return datetime(int(value[:4]), int(value[4:6]), int(value[6:8])).toordinal()
+
+
+def parse_gtfs_time(value):
+    """Convertit un horaire GTFS 'HH:MM:SS' (heures >= 24 possibles) en secondes, -1 si vide"""
     try:
-        # Vérifier si c'est déjà des coordonnées (format: "lat,lon")
-        if isinstance(address, str) and ',' in address:
-            parts = address.split(',')
-            if len(parts) == 2:
-                try:
-                    lat = float(parts[0].strip())
-                    lon = float(parts[1].strip())
-                    # Vérifier que c'est dans des plages valides
-                    if -90 <= lat <= 90 and -180 <= lon <= 180:
-                        logger.info(f"✓ Coordonnées directes: {lat}, {lon}")
-                        return lat, lon, f"Point ({lat:.4f}, {lon:.4f})"
-                except ValueError:
-                    pass  # Pas des coordonnées valides, continuer avec géocodage
-        
-        # Essayer d'abord Photon (avec User-Agent)
-        logger.info(f"Géocodage: {address}")
+        hours, minutes, seconds = value.split(':')
+        return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+    except (AttributeError, ValueError):
+        return -1
+
+
+def format_gtfs_time(seconds):
+    """Formate des secondes en 'HH:MM:SS' ramené sur 24h"""
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours % 24:02d}:{rest // 60:02d}:{rest % 60:02d}"
+
+
+def run_parallel(tasks, timeouts=None, defaults=None):
+    """
+    Exécute des appels indépendants en parallèle sur le pool amont borné.
+    tasks: {nom: (fonction, *args)}. Chaque tâche a son délai (timeouts[nom], défaut UPSTREAM_TASK_TIMEOUT).
+    En cas d'erreur ou de délai dépassé, la valeur defaults[nom] est utilisée si fournie, sinon l'erreur est levée.
+    """
+    timeouts = timeouts or {}
+    defaults = defaults or {}
+    started = time.monotonic()
+    futures = {name: upstream_executor.submit(func, *args) for name, (func, *args) in tasks.items()}
+    
+    results = {}
+    for name, future in futures.items():
+        remaining = started + timeouts.get(name, UPSTREAM_TASK_TIMEOUT) - time.monotonic()
         try:
-            url = f"https://photon.komoot.io/api/?q={address}&limit=1"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-            }
-            r = requests.get(url, headers=headers, timeout=10)
-            r.raise_for_status()
-            data = r.json()
-            
-            if "features" in data and len(data["features"]) > 0:
-                lon, lat = data["features"][0]["geometry"]["coordinates"]
-                props = data["features"][0]["properties"]
-                place_name = props.get("name", address)
-                
-                logger.info(f"✓ Géocodage Photon: {lat}, {lon}")
-                return lat, lon, place_name
+            results[name] = future.result(timeout=max(remaining, 0))
+        except FutureTimeoutError:
+            future.cancel()
+            logger.warning(f"⏱️  Tâche {name}: délai dépassé")
+            if name not in defaults:
+                raise Exception(f"Délai dépassé: {name}")
+            results[name] = defaults[name]
         except Exception as e:
-            logger.warning(f"Photon échoué ({e}), essai Nominatim...")
-            
-            # Fallback vers Nominatim (OpenStreetMap)
-            url = "https://nominatim.openstreetmap.org/search"
-            params = {
-                'q': address,
-                'format': 'json',
-                'limit': 1,
-                'addressdetails': 1
-            }
-            headers = {
-                'User-Agent': 'TransportOptimization/1.0 (contact@example.com)'
-            }
-            
-            r = requests.get(url, params=params, headers=headers, timeout=10)
-            r.raise_for_status()
-            data = r.json()
-            
-            if data and len(data) > 0:
-                result = data[0]
-                lat = float(result['lat'])
-                lon = float(result['lon'])
-                place_name = result.get('display_name', address)
-                
-                logger.info(f"✓ Géocodage Nominatim: {lat}, {lon}")
-                return lat, lon, place_name
+            if name not in defaults:
+                raise
+            logger.warning(f"Tâche {name} échouée: {e}")
+            results[name] = defaults[name]
+    
+    return results
+
+
+def parse_departure_time(value):
+    """Heure de départ demandée: 'HH:MM' (aujourd'hui) ou ISO 8601, None si absente"""
+    if not value:
+        return None
+    
+    value = str(value).strip()
+    try:
+        parsed = datetime.strptime(value, '%H:%M')
+        return datetime.now().replace(hour=parsed.hour, minute=parsed.minute, second=0, microsecond=0)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+def normalize_address(address):
+    """Clé de cache d'une adresse : Unicode normalisé, minuscules, espaces compactés"""
+    address = unicodedata.normalize('NFKC', str(address))
+    return ' '.join(address.casefold().replace(',', ' , ').split())
+
+
+def parse_coordinates(address):
+    """Coordonnées directes "lat,lon" -> (lat, lon, nom), None si l'adresse n'en est pas"""
+    if isinstance(address, str) and ',' in address:
+        parts = address.split(',')
+        if len(parts) == 2:
+            try:
+                lat = float(parts[0].strip())
+                lon = float(parts[1].strip())
+                # Vérifier que c'est dans des plages valides
+                if -90 <= lat <= 90 and -180 <= lon <= 180:
+                    logger.info(f"✓ Coordonnées directes: {lat}, {lon}")
+                    return lat, lon, f"Point ({lat:.4f}, {lon:.4f})"
+            except ValueError:
+                pass  # Pas des coordonnées valides, continuer avec géocodage
+    return None
+
+
+def geocode(address):
+    """Géocode une adresse avec Photon (+ fallback Nominatim) OU utilise coordonnées directes"""
+    try:
+        coordinates = parse_coordinates(address)
+        if coordinates:
+            return coordinates
+        
+        # Cache persistant (y compris les adresses introuvables)
+        key = normalize_address(address)
+        found, cached = geocode_cache.lookup(key)
+        if found:
+            if cached is None:
+                raise Exception(f"Impossible de géocoder: {address}")
+            logger.info(f"✓ Géocodage (cache): {address}")
+            return tuple(cached)
         
-        raise Exception(f"Impossible de géocoder: {address}")
+        result = geocode_remote(address)
+        if result is None:
+            geocode_cache.set(key, None, ttl_seconds=GEOCODE_CACHE_NEGATIVE_TTL_MINUTES * 60)
+            raise Exception(f"Impossible de géocoder: {address}")
+        
+        geocode_cache.set(key, list(result))
+        return result
     except Exception as e:
         logger.error(f"Erreur géocodage: {e}")
         raise
 
 
+def geocode_remote(address):
+    """
+    Géocode une adresse avec Photon (+ fallback Nominatim).
+    Retourne None si aucun service ne trouve l'adresse ; les erreurs réseau sont levées.
+    """
+    # Essayer d'abord Photon (avec User-Agent)
+    logger.info(f"Géocodage: {address}")
+    try:
+        url = f"{PHOTON_URL}/api/?q={address}&limit=1"
+        r = http_session('photon').get(url, headers=PHOTON_HEADERS, timeout=10)
+        r.raise_for_status()
+        return parse_photon_geocode(r.json(), address)
+    except Exception as e:
+        logger.warning(f"Photon échoué ({e}), essai Nominatim...")
+        
+        # Fallback vers Nominatim (OpenStreetMap)
+        r = http_session('nominatim').get(
+            NOMINATIM_URL, params=nominatim_params(address), headers=NOMINATIM_HEADERS, timeout=10
+        )
+        r.raise_for_status()
+        return parse_nominatim_geocode(r.json(), address)
+
+
+def parse_photon_geocode(data, address):
+    """Premier résultat Photon -> (lat, lon, nom), None si aucun"""
+    if "features" in data and len(data["features"]) > 0:
+        lon, lat = data["features"][0]["geometry"]["coordinates"]
+        props = data["features"][0]["properties"]
+        place_name = props.get("name", address)
+        
+        logger.info(f"✓ Géocodage Photon: {lat}, {lon}")
+        return lat, lon, place_name
+    return None
+
+
+def nominatim_params(address):
+    """Paramètres de recherche Nominatim d'une adresse"""
+    return {
+        'q': address,
+        'format': 'json',
+        'limit': 1,
+        'addressdetails': 1
+    }
+
+
+def parse_nominatim_geocode(data, address):
+    """Premier résultat Nominatim -> (lat, lon, nom), None si aucun"""
+    if data and len(data) > 0:
+        result = data[0]
+        lat = float(result['lat'])
+        lon = float(result['lon'])
+        place_name = result.get('display_name', address)
+        
+        logger.info(f"✓ Géocodage Nominatim: {lat}, {lon}")
+        return lat, lon, place_name
+    return None
+
+
 def decode_polyline(encoded):
     """Décode une polyline"""
     try:
@@ -860,39 +4032,259 @@ def decode_polyline(encoded):
 
 
 def get_route(lat1, lon1, lat2, lon2, profile='driving-car'):
-    """Calcule un itinéraire avec OpenRouteService"""
+    """Calcule un itinéraire avec OpenRouteService (servi par route_cache si déjà connu)"""
+    key = route_cache.key(profile, lat1, lon1, lat2, lon2)
+    cached = route_cache.get(key)
+    if cached is not None:
+        logger.info(f"✓ Route {profile} (cache): {cached[1]:.2f}km, {cached[2]:.2f}min")
+        return cached
+    
     try:
         logger.info(f"Route {profile}: ({lat1},{lon1}) → ({lat2},{lon2})")
-        url = f"https://api.openrouteservice.org/v2/directions/{profile}"
-        headers = {
-            "Authorization": ORS_API_KEY,
-            "Content-Type": "application/json"
-        }
+        url = f"{ORS_BASE_URL}/v2/directions/{profile}"
         payload = {
             "coordinates": [[lon1, lat1], [lon2, lat2]]
         }
         
-        r = requests.post(url, json=payload, headers=headers, timeout=15)
+        r = http_session('ors').post(url, json=payload, headers=ors_headers(), timeout=15)
         r.raise_for_status()
-        data = r.json()
+        return parse_ors_route(r.json(), key)
         
-        if "routes" not in data or len(data["routes"]) == 0:
-            return [], 0, 0
+    except Exception as e:
+        logger.error(f"Erreur calcul route: {e}")
+        return [], 0, 0
+
+
+def ors_headers():
+    """En-têtes des appels OpenRouteService"""
+    return {
+        "Authorization": ORS_API_KEY,
+        "Content-Type": "application/json"
+    }
+
+
+def parse_ors_route(data, key):
+    """Réponse ORS directions -> (coords, km, min), mise en cache sous key si un itinéraire existe"""
+    if "routes" not in data or len(data["routes"]) == 0:
+        return [], 0, 0
+    
+    route = data["routes"][0]
+    coords = decode_polyline(route["geometry"])
+    distance = route["summary"].get("distance", 0) / 1000  # km
+    duration = route["summary"].get("duration", 0) / 60    # min
+    
+    logger.info(f"✓ {distance:.2f}km, {duration:.2f}min")
+    route_cache.put(key, (coords, distance, duration))
+    return coords, distance, duration
+
+
+def estimated_planned_walks(journey, start_lat, start_lon, end_lat, end_lon):
+    """Marches estimées (matrice ORS indisponible) d'un itinéraire RAPTOR : [(clé, (lat1, lon1, lat2, lon2))]"""
+    start_stop, end_stop = journey['start_stop'], journey['end_stop']
+    pairs = {
+        'walk_start': (start_lat, start_lon, start_stop['lat'], start_stop['lon']),
+        'walk_end': (end_stop['lat'], end_stop['lon'], end_lat, end_lon)
+    }
+    return [(key, pair) for key, pair in pairs.items() if journey[key][2]]
+
+
+def apply_planned_walk(journey, key, route):
+    """Remplace une marche estimée par l'itinéraire piéton ORS (s'il a été trouvé)"""
+    _, distance, duration = route
+    if duration:
+        journey[key] = (distance, duration, False)
+
+
+def refine_planned_walks(journey, start_lat, start_lon, end_lat, end_lon):
+    """Matrice ORS indisponible: itinéraire piéton détaillé pour les deux arrêts retenus seulement"""
+    for key, pair in estimated_planned_walks(journey, start_lat, start_lon, end_lat, end_lon):
+        apply_planned_walk(journey, key, get_route(*pair, 'foot-walking'))
+
+
+def build_planned_option(gtfs_data, journey, start_lat, start_lon, end_lat, end_lon, departure_time):
+    """Convertit un itinéraire RAPTOR (marches affinées par refine_planned_walks) en option multimodale"""
+    start_stop, end_stop = journey['start_stop'], journey['end_stop']
+    walk_start_dist, walk_start_time, _ = journey['walk_start']
+    walk_end_dist, walk_end_time, _ = journey['walk_end']
+    
+    stops = gtfs_data['stops']
+    legs = []
+    routes = []
+    transit_dist = 0
+    for leg in journey['legs']:
+        leg_stops = leg.get('stops') or [leg['from_stop'], leg['to_stop']]
+        distance = sum(
+            haversine_distance(stops[a]['lat'], stops[a]['lon'], stops[b]['lat'], stops[b]['lon'])
+            for a, b in zip(leg_stops, leg_stops[1:])
+        )
+        transit_dist += distance
         
-        route = data["routes"][0]
-        coords = decode_polyline(route["geometry"])
-        distance = route["summary"].get("distance", 0) / 1000  # km
-        duration = route["summary"].get("duration", 0) / 60    # min
+        if leg['type'] == 'walk':
+            legs.append({
+                'type': 'walk',
+                'from': stops[leg['from_stop']]['name'],
+                'to': stops[leg['to_stop']]['name'],
+                'distance': round(distance, 2),
+                'duration': round(leg['duration'] / 60, 1)
+            })
+            continue
         
-        logger.info(f"✓ {distance:.2f}km, {duration:.2f}min")
-        return coords, distance, duration
+        route = GTFSManager.describe_route(gtfs_data, leg['route_id']) or {'id': leg['route_id']}
+        if route['id'] not in {r['id'] for r in routes}:
+            routes.append(route)
+        legs.append({
+            'type': 'transit',
+            'route': route.get('short_name') or route.get('long_name', 'N/A'),
+            'route_type': route.get('type', 'Bus'),
+            'color': route.get('color', '#0066CC'),
+            'from': stops[leg['from_stop']]['name'],
+            'to': stops[leg['to_stop']]['name'],
+            'departure': format_gtfs_time(leg['departure']),
+            'arrival': format_gtfs_time(leg['arrival']),
+            'stops': len(leg_stops) - 1,
+            'distance': round(distance, 2)
+        })
+    
+    # Départs de la première ligne à l'arrêt de montée
+    at_stop = (departure_time or datetime.now()) + timedelta(seconds=journey['access'])
+    first_routes = {routes[0]['id']} if routes else None
+    departures = GTFSManager.get_next_departures(
+        gtfs_data, journey['board_stop'], limit=5, route_filter=first_routes, at=at_stop
+    )
+    
+    # Attente + trajets + correspondances (entre montée et descente)
+    transit_time = (journey['arrival'] - journey['egress'] - journey['departure'] - journey['access']) / 60
+    total_time = walk_start_time + transit_time + walk_end_time
+    
+    logger.info(f"🧭 Itinéraire horaire: {len(routes)} ligne(s), {journey['transfers']} correspondance(s), "
+                f"arrivée {format_gtfs_time(journey['arrival'])}")
+    
+    return {
+        'start_stop': start_stop,
+        'end_stop': end_stop,
+        'routes': routes,
+        'departures': departures,
+        'legs': legs,
+        'walk_start': {
+            'distance': walk_start_dist,
+            'duration': walk_start_time
+        },
+        'transit': {
+            'distance': transit_dist,
+            'duration': transit_time,
+            'wait': journey['wait'] / 60,
+            'ride': journey['ride'] / 60,
+            'transfers': journey['transfers']
+        },
+        'walk_end': {
+            'distance': walk_end_dist,
+            'duration': walk_end_time
+        },
+        'total_time': total_time,
+        'total_distance': walk_start_dist + transit_dist + walk_end_dist,
+        'source': gtfs_data.get('source', 'unknown')
+    }
+
+
+def get_route_matrix(origins, destinations, profile='foot-walking'):
+    """
+    Distances (km) et durées (min) origines × destinations en un seul appel
+    à l'endpoint matrix OpenRouteService. origins/destinations: [(lat, lon), ...].
+    Retourne (distances, durations) en listes N×M (None si non routable), ou None si échec.
+    """
+    try:
+        logger.info(f"Matrice {profile}: {len(origins)} × {len(destinations)}")
+        r = http_session('ors').post(f"{ORS_BASE_URL}/v2/matrix/{profile}", json=ors_matrix_payload(origins, destinations),
+                                     headers=ors_headers(), timeout=15)
+        r.raise_for_status()
+        return parse_ors_matrix(r.json())
         
     except Exception as e:
-        logger.error(f"Erreur calcul route: {e}")
-        return [], 0, 0
+        logger.error(f"Erreur matrice route: {e}")
+        return None
+
+
+def ors_matrix_payload(origins, destinations):
+    """Corps de la requête matrix ORS (coordonnées en lon, lat)"""
+    locations = [[lon, lat] for lat, lon in origins] + [[lon, lat] for lat, lon in destinations]
+    return {
+        "locations": locations,
+        "sources": list(range(len(origins))),
+        "destinations": list(range(len(origins), len(locations))),
+        "metrics": ["distance", "duration"]
+    }
+
 
+def parse_ors_matrix(data):
+    """Réponse matrix ORS -> (distances km, durées min)"""
+    distances = [[None if d is None else d / 1000 for d in row] for row in data["distances"]]  # km
+    durations = [[None if d is None else d / 60 for d in row] for row in data["durations"]]    # min
+    return distances, durations
 
-def calculate_multimodal_route(start_lat, start_lon, end_lat, end_lon):
+
+def estimate_walk(lat1, lon1, lat2, lon2):
+    """Marche estimée en ligne droite à vitesse de marche : (distance_km, durée_min, estimée)"""
+    distance = haversine_distance(lat1, lon1, lat2, lon2)
+    return distance, distance / WALK_SPEED_KMH * 60, True
+
+
+def walking_leg_pairs(start_lat, start_lon, start_stops, end_stops, end_lat, end_lon):
+    """
+    Marches d'accès (départ → arrêt) et finales (arrêt → arrivée) en (lat1, lon1, lat2, lon2),
+    et points de leur matrice ORS : (access_pairs, egress_pairs, origins, destinations)
+    """
+    access_pairs = [(start_lat, start_lon, stop['lat'], stop['lon']) for stop in start_stops]
+    egress_pairs = [(stop['lat'], stop['lon'], end_lat, end_lon) for stop in end_stops]
+    origins = [(start_lat, start_lon)] + [(stop['lat'], stop['lon']) for stop in end_stops]
+    destinations = [(stop['lat'], stop['lon']) for stop in start_stops] + [(end_lat, end_lon)]
+    return access_pairs, egress_pairs, origins, destinations
+
+
+def walking_legs(matrix, access_pairs, egress_pairs, fallback='directions'):
+    """
+    (access, egress) depuis la matrice ORS, ligne droite pour les paires non routables. Sans matrice :
+    estimations en ligne droite si fallback == 'estimate', sinon None (appels directions à faire).
+    """
+    if matrix:
+        distances, durations = matrix
+        
+        def leg(row, col, pair):
+            if distances[row][col] is None or durations[row][col] is None:
+                return estimate_walk(*pair)  # Non routable: ligne droite
+            return distances[row][col], durations[row][col], False
+        
+        access = [leg(0, j, pair) for j, pair in enumerate(access_pairs)]
+        egress = [leg(1 + i, len(access_pairs), pair) for i, pair in enumerate(egress_pairs)]
+        return access, egress
+    
+    if fallback == 'estimate':
+        return [estimate_walk(*pair) for pair in access_pairs], [estimate_walk(*pair) for pair in egress_pairs]
+    return None
+
+
+def get_walking_legs(start_lat, start_lon, start_stops, end_stops, end_lat, end_lon, fallback='directions'):
+    """
+    Marches d'accès (départ → chaque arrêt de départ) et finales (chaque arrêt d'arrivée → arrivée),
+    calculées une seule fois par arrêt: un appel matrix ORS, sinon selon `fallback`
+    ('directions': appels ORS en parallèle, 'estimate': ligne droite à vitesse de marche).
+    Retourne (access, egress): listes de (distance_km, durée_min, estimée) alignées sur les arrêts.
+    """
+    access_pairs, egress_pairs, origins, destinations = walking_leg_pairs(
+        start_lat, start_lon, start_stops, end_stops, end_lat, end_lon
+    )
+    legs = walking_legs(get_route_matrix(origins, destinations, 'foot-walking'), access_pairs, egress_pairs, fallback)
+    if legs:
+        return legs
+    
+    # Repli: un appel directions par marche distincte, en parallèle
+    pairs = access_pairs + egress_pairs
+    with ThreadPoolExecutor(max_workers=min(len(pairs), 8) or 1) as pool:
+        results = list(pool.map(lambda pair: get_route(*pair, 'foot-walking'), pairs))
+    legs = [(distance, duration, False) for _, distance, duration in results]
+    return legs[:len(access_pairs)], legs[len(access_pairs):]
+
+
+def calculate_multimodal_route(start_lat, start_lon, end_lat, end_lon, departure_time=None):
     """Calcule un itinéraire multimodal optimal"""
     try:
         # Charger GTFS pour la région de départ
@@ -902,41 +4294,69 @@ def calculate_multimodal_route(start_lat, start_lon, end_lat, end_lon):
             logger.warning("Pas de données transport disponibles")
             return None
         
-        # Trouver arrêts proches départ (augmenté à 2km pour grandes villes)
-        start_stops = GTFSManager.find_nearby_stops(gtfs_data, start_lat, start_lon, 2.0)
+        return multimodal_route_on_feed(gtfs_data, start_lat, start_lon, end_lat, end_lon, departure_time)
+        
+    except Exception as e:
+        logger.error(f"Erreur calcul multimodal: {e}")
+        return None
+
+
+def multimodal_route_on_feed(gtfs_data, start_lat, start_lon, end_lat, end_lon, departure_time=None):
+    """Calcule un itinéraire multimodal optimal sur des données de transport déjà chargées"""
+    try:
+        # Horaires GTFS: calcul sur les horaires réels (correspondances incluses)
+        journey = GTFSManager.plan_journey(gtfs_data, start_lat, start_lon, end_lat, end_lon, departure_time)
+        if journey:
+            refine_planned_walks(journey, start_lat, start_lon, end_lat, end_lon)
+            return build_planned_option(gtfs_data, journey, start_lat, start_lon, end_lat, end_lon, departure_time)
+        
+        # Sinon (OSM ou aucun trajet trouvé): estimation à vitesse moyenne
+        return estimated_multimodal_option(gtfs_data, start_lat, start_lon, end_lat, end_lon)
         
-        # Trouver arrêts proches arrivée (augmenté à 2km pour grandes villes)
-        end_stops = GTFSManager.find_nearby_stops(gtfs_data, end_lat, end_lon, 2.0)
+    except Exception as e:
+        logger.error(f"Erreur calcul multimodal: {e}")
+        return None
+
+
+def estimated_multimodal_option(gtfs_data, start_lat, start_lon, end_lat, end_lon, walking=None):
+    """
+    Option estimée à vitesse moyenne entre les 3 arrêts les plus proches (2km) du départ et de l'arrivée.
+    walking: (arrêts de départ, arrêts d'arrivée, marches d'accès, marches finales) déjà calculés
+    (mode asynchrone), sinon arrêts cherchés ici et marches demandées à ORS.
+    """
+    try:
+        if walking is None:
+            start_stops, end_stops = GTFSManager.nearby_stop_pairs(gtfs_data, start_lat, start_lon, end_lat, end_lon, 3)
+            access_legs = egress_legs = None
+        else:
+            start_stops, end_stops, access_legs, egress_legs = walking
         
         if not start_stops or not end_stops:
             logger.warning("Pas d'arrêts à proximité")
             return None
         
+        # Distances transit départ × arrivée (un seul calcul matriciel)
+        transit_distances = haversine_matrix(
+            [stop['lat'] for stop in start_stops], [stop['lon'] for stop in start_stops],
+            [stop['lat'] for stop in end_stops], [stop['lon'] for stop in end_stops]
+        ).tolist()
+        
+        # Marches d'accès et finales: une fois par arrêt (matrice ORS)
+        if walking is None:
+            access_legs, egress_legs = get_walking_legs(start_lat, start_lon, start_stops, end_stops, end_lat, end_lon)
+        
         # Calculer la meilleure option
         best_option = None
         min_time = float('inf')
         
-        for start_stop in start_stops[:3]:
-            for end_stop in end_stops[:3]:
-                # Marche jusqu'à départ
-                _, walk_start_dist, walk_start_time = get_route(
-                    start_lat, start_lon,
-                    start_stop['lat'], start_stop['lon'],
-                    'foot-walking'
-                )
-                
-                # Marche depuis arrivée
-                _, walk_end_dist, walk_end_time = get_route(
-                    end_stop['lat'], end_stop['lon'],
-                    end_lat, end_lon,
-                    'foot-walking'
-                )
+        for i, start_stop in enumerate(start_stops):
+            for j, end_stop in enumerate(end_stops):
+                # Marche jusqu'à départ / depuis arrivée
+                walk_start_dist, walk_start_time, _ = access_legs[i]
+                walk_end_dist, walk_end_time, _ = egress_legs[j]
                 
                 # Distance transit
-                transit_dist = haversine_distance(
-                    start_stop['lat'], start_stop['lon'],
-                    end_stop['lat'], end_stop['lon']
-                )
+                transit_dist = transit_distances[i][j]
                 
                 # Temps transit (vitesse moyenne 25 km/h)
                 transit_time = (transit_dist / 25) * 60
@@ -1002,182 +4422,593 @@ def calculate_multimodal_route(start_lat, start_lon, end_lat, end_lon):
         return None
 
 
-@app.route('/api/itineraire', methods=['POST'])
-def itineraire():
+@app.before_request
+def start_background_tasks():
     """
-    Endpoint principal - Calcul d'itinéraire optimisé mondial
+    Démarre le rafraîchissement du catalogue et, si GTFS_SCHEDULER, le planificateur GTFS
+    dans le processus courant (idempotent).
+    Appelé au lancement de chaque worker (gunicorn.conf.py, asgi.py, main) ; la première requête reste un filet de sécurité.
+    """
+    feed_catalog.ensure_started()
+    if GTFS_SCHEDULER:
+        region_scheduler.ensure_started()
+
+
+ITINERARY_TIMEOUTS = {'transport': TRANSIT_TASK_TIMEOUT}
+ITINERARY_DEFAULTS = {
+    'location': UNKNOWN_LOCATION,
+    'transport': None,
+    'voiture': NO_ROUTE,
+    'velo': NO_ROUTE,
+    'pieton': NO_ROUTE
+}
+
+
+def parse_itinerary_request(data):
     """
+    Valide le corps d'une demande d'itinéraire -> (depart, destination, mode, heure de départ).
+    Lève ValueError (message destiné au client) si la demande est invalide.
+    """
+    depart = data.get("depart")
+    destination = data.get("destination")
+    mode = data.get("mode", "optimal")
+    
+    logger.info(f"=== REQUÊTE: {depart} → {destination} [{mode}] ===")
+    
+    if not depart or not destination:
+        raise ValueError("Départ et destination requis")
+    
     try:
-        data = request.json
-        depart = data.get("depart")
-        destination = data.get("destination")
-        mode = data.get("mode", "optimal")
-        
-        logger.info(f"=== REQUÊTE: {depart} → {destination} [{mode}] ===")
-        
-        if not depart or not destination:
-            return jsonify({"error": "Départ et destination requis"}), 400
+        departure_time = parse_departure_time(data.get("heure_depart"))
+    except ValueError:
+        raise ValueError("heure_depart invalide (HH:MM ou ISO 8601)")
+    
+    return depart, destination, mode, departure_time
+
+
+def itinerary_tasks(geocoded, mode, departure_time):
+    """Calculs indépendants d'une demande géocodée: {nom: (fonction, *args)} (cf. run_parallel)"""
+    start_lat, start_lon, _ = geocoded['depart']
+    end_lat, end_lon, _ = geocoded['destination']
+    direct_distance = haversine_distance(start_lat, start_lon, end_lat, end_lon)
+    
+    tasks = {'location': (TransitAPIManager.detect_country_city, start_lat, start_lon)}
+    if mode in ['optimal', 'transport']:
+        tasks['transport'] = (calculate_multimodal_route, start_lat, start_lon, end_lat, end_lon, departure_time)
+    if mode in ['optimal', 'voiture']:
+        tasks['voiture'] = (get_route, start_lat, start_lon, end_lat, end_lon, 'driving-car')
+    if mode in ['optimal', 'velo']:
+        tasks['velo'] = (get_route, start_lat, start_lon, end_lat, end_lon, 'cycling-regular')
+    if mode in ['optimal', 'pieton'] or direct_distance < 2:
+        tasks['pieton'] = (get_route, start_lat, start_lon, end_lat, end_lon, 'foot-walking')
+    return tasks
+
+
+def has_route(route):
+    """Itinéraire routier trouvé : géométrie ORS, ou distance/durée seules (matrice ORS, géométrie à None)"""
+    coords, _, duration = route
+    return bool(coords) or (coords is None and duration > 0)
+
+
+def build_itinerary_response(depart, destination, mode, geocoded, results):
+    """Réponse de /api/itineraire à partir des points géocodés et des résultats de itinerary_tasks"""
+    start_lat, start_lon, start_name = geocoded['depart']
+    end_lat, end_lon, end_name = geocoded['destination']
+    
+    # Distance directe
+    direct_distance = haversine_distance(start_lat, start_lon, end_lat, end_lon)
+    
+    location_info = results['location']
+    logger.info(f"📍 {location_info['city']}, {location_info['country']}")
+    
+    options = []
+    
+    # === TRANSPORT EN COMMUN ===
+    if mode in ['optimal', 'transport']:
+        multimodal = results['transport']
         
-        # Géocodage
-        start_lat, start_lon, start_name = geocode(depart)
-        end_lat, end_lon, end_name = geocode(destination)
+        if multimodal:
+            transit_segment = {
+                'type': 'transit',
+                'icon': '🚌',
+                'from': multimodal['start_stop']['name'],
+                'to': multimodal['end_stop']['name'],
+                'distance': round(multimodal['transit']['distance'], 2),
+                'duration': round(multimodal['transit']['duration'], 1),
+                'routes': multimodal['routes'],
+                'departures': multimodal['departures']
+            }
+            # Itinéraire sur horaires réels: détail des étapes et correspondances
+            if 'legs' in multimodal:
+                transit_segment.update({
+                    'legs': multimodal['legs'],
+                    'transfers': multimodal['transit']['transfers'],
+                    'wait_time': round(multimodal['transit']['wait'], 1),
+                    'ride_time': round(multimodal['transit']['ride'], 1)
+                })
+            
+            options.append({
+                'mode': 'transport',
+                'label': 'Transports en commun',
+                'icon': '🚌',
+                'total_time': round(multimodal['total_time'], 1),
+                'total_distance': round(multimodal['total_distance'], 2),
+                'co2_emissions': round(multimodal['total_distance'] * 0.05, 2),
+                'cost_estimate': 1.50,  # Estimation
+                'segments': [
+                    {
+                        'type': 'walk',
+                        'icon': '🚶',
+                        'from': start_name,
+                        'to': multimodal['start_stop']['name'],
+                        'distance': round(multimodal['walk_start']['distance'], 2),
+                        'duration': round(multimodal['walk_start']['duration'], 1)
+                    },
+                    transit_segment,
+                    {
+                        'type': 'walk',
+                        'icon': '🚶',
+                        'from': multimodal['end_stop']['name'],
+                        'to': end_name,
+                        'distance': round(multimodal['walk_end']['distance'], 2),
+                        'duration': round(multimodal['walk_end']['duration'], 1)
+                    }
+                ],
+                'data_source': multimodal['source']
+            })
+    
+    # === VOITURE ===
+    if mode in ['optimal', 'voiture']:
+        car_coords, car_dist, car_time = results['voiture']
+        if has_route(results['voiture']):
+            options.append({
+                'mode': 'voiture',
+                'label': 'Voiture',
+                'icon': '🚗',
+                'total_time': round(car_time, 1),
+                'total_distance': round(car_dist, 2),
+                'co2_emissions': round(car_dist * 0.12, 2),
+                'cost_estimate': round(car_dist * 0.15, 2),
+                'route_coords': car_coords
+            })
+    
+    # === VÉLO ===
+    if mode in ['optimal', 'velo']:
+        bike_coords, bike_dist, bike_time = results['velo']
+        if has_route(results['velo']):
+            options.append({
+                'mode': 'velo',
+                'label': 'Vélo',
+                'icon': '🚴',
+                'total_time': round(bike_time, 1),
+                'total_distance': round(bike_dist, 2),
+                'co2_emissions': 0,
+                'cost_estimate': 0,
+                'route_coords': bike_coords
+            })
+    
+    # === À PIED ===
+    if mode in ['optimal', 'pieton'] or direct_distance < 2:
+        walk_coords, walk_dist, walk_time = results['pieton']
+        if has_route(results['pieton']):
+            options.append({
+                'mode': 'pieton',
+                'label': 'À pied',
+                'icon': '🚶',
+                'total_time': round(walk_time, 1),
+                'total_distance': round(walk_dist, 2),
+                'co2_emissions': 0,
+                'cost_estimate': 0,
+                'route_coords': walk_coords
+            })
+    
+    # Tri par temps si optimal
+    if mode == 'optimal' and options:
+        options.sort(key=lambda x: x['total_time'])
+    
+    # Recommandations intelligentes
+    recommendations = []
+    if direct_distance < 1.5:
+        recommendations.append("🚶 Courte distance - Marche recommandée!")
+    elif direct_distance < 5:
+        recommendations.append("🚴 Distance idéale pour le vélo")
+    
+    if options:
+        eco_option = min(options, key=lambda x: x['co2_emissions'])
+        if eco_option['co2_emissions'] == 0:
+            recommendations.append(f"🌱 {eco_option['label']} - Zéro émission!")
         
-        # Détection pays/ville
-        location_info = TransitAPIManager.detect_country_city(start_lat, start_lon)
-        logger.info(f"📍 {location_info['city']}, {location_info['country']}")
+        fastest = min(options, key=lambda x: x['total_time'])
+        cheapest = min(options, key=lambda x: x['cost_estimate'])
+        recommendations.append(f"⚡ Plus rapide: {fastest['label']} ({fastest['total_time']}min)")
+        recommendations.append(f"💰 Moins cher: {cheapest['label']} ({cheapest['cost_estimate']}€)")
+    
+    response = {
+        "success": True,
+        "location": {
+            "city": location_info['city'],
+            "country": location_info['country'],
+            "country_code": location_info['country_code']
+        },
+        "depart": {
+            "address": depart,
+            "name": start_name,
+            "lat": start_lat,
+            "lon": start_lon
+        },
+        "destination": {
+            "address": destination,
+            "name": end_name,
+            "lat": end_lat,
+            "lon": end_lon
+        },
+        "direct_distance": round(direct_distance, 2),
+        "options": options,
+        "recommended": options[0] if options else None,
+        "recommendations": recommendations,
+        "timestamp": datetime.now().isoformat()
+    }
+    
+    logger.info(f"✓ {len(options)} options calculées")
+    return response
+
+
+class BatchRun:
+    """
+    Lot en cours : événements (nom, {index: valeur}) attendus par calculate_itinerary_batch, tâches
+    soumises à batch_executor et échéance (BATCH_DEADLINE_S). cancel() (délai dépassé, client parti)
+    annule les tâches pas encore démarrées ; les tâches en cours consultent cancelled avant leurs appels amont.
+    """
+    
+    def __init__(self, deadline_s=None):
+        self.events = queue.Queue()
+        self.deadline = time.monotonic() + (BATCH_DEADLINE_S if deadline_s is None else deadline_s)
+        self.cancelled = False
+        self.futures = set()
+        self.lock = threading.Lock()
+    
+    def put(self, name, values):
+        self.events.put((name, values))
+    
+    def submit(self, func, *args):
+        """Tâche du lot dans batch_executor ; future déjà annulé si le lot l'est"""
+        with self.lock:
+            if self.cancelled:
+                future = Future()
+                future.cancel()
+                return future
+            future = batch_executor.submit(func, *args)
+            self.futures.add(future)
+        future.add_done_callback(self._forget)
+        return future
+    
+    def _forget(self, future):
+        with self.lock:
+            self.futures.discard(future)
+    
+    def cancel(self):
+        """Annule les tâches en attente ; les suivantes ne sont plus soumises"""
+        with self.lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            futures = list(self.futures)
+        cancelled = sum(future.cancel() for future in futures)
+        if cancelled:
+            logger.info(f"🛑 Lot interrompu: {cancelled} tâches annulées")
+    
+    def wait_timeout(self):
+        """Attente max du prochain événement : TRANSIT_TASK_TIMEOUT, bornée par l'échéance du lot"""
+        return max(min(TRANSIT_TASK_TIMEOUT, self.deadline - time.monotonic()), 0)
+
+
+def calculate_itinerary_batch(pairs, mode='optimal', heure_depart=None):
+    """
+    Itinéraires de plusieurs couples origine-destination, produits au fil des calculs : (index, réponse).
+    Chaque couple {depart, destination[, mode, heure_depart]} donne la réponse de /api/itineraire,
+    ou {"success": False, "error": ...}. Géocodage dédoublonné, chaque couple lancé dès ses deux
+    adresses géocodées, une détection de lieu par zone (~1 km), itinéraires routiers par appels
+    matrix ORS (sans géométrie : route_coords à None), transports en commun groupés par flux GTFS.
+    Le lot est borné par BATCH_DEADLINE_S ; ses tâches en attente sont annulées quand le générateur
+    se termine ou est fermé (client déconnecté).
+    """
+    run = BatchRun()
+    try:
+        yield from batch_responses(run, pairs, mode, heure_depart)
+    finally:
+        run.cancel()
+
+
+def batch_responses(run, pairs, mode, heure_depart):
+    """Corps de calculate_itinerary_batch : tâches soumises via run, réponses au fil des événements"""
+    requests_by_index = {}
+    for index, pair in enumerate(pairs):
+        try:
+            requests_by_index[index] = parse_itinerary_request({'mode': mode, 'heure_depart': heure_depart, **pair})
+        except (TypeError, ValueError) as e:
+            yield index, {"success": False, "error": str(e)}
+    
+    # Géocodage: une fois par adresse normalisée, en parallèle ; chaque adresse géocodée produit
+    # un événement ('geocode', {index: adresse}) pour les couples qui l'attendent
+    addresses = {}
+    geocoding = {}
+    pairs_by_address = defaultdict(list)
+    for index, (depart, destination, _, _) in requests_by_index.items():
+        geocoding[index] = {normalize_address(depart), normalize_address(destination)}
+        addresses.setdefault(normalize_address(depart), depart)
+        addresses.setdefault(normalize_address(destination), destination)
+        for key in geocoding[index]:
+            pairs_by_address[key].append(index)
+    futures = {}
+    for key, address in addresses.items():
+        futures[key] = run.submit(geocode, address)
+        futures[key].add_done_callback(
+            lambda _, key=key: run.put('geocode', dict.fromkeys(pairs_by_address[key], key))
+        )
+    logger.info(f"📦 Lot: {len(requests_by_index)} couples, {len(futures)} adresses à géocoder")
+    
+    context = {}
+    waiting = {}
+    zones = {}
+    while geocoding or waiting:
+        try:
+            received = [run.events.get(timeout=run.wait_timeout())]
+        except queue.Empty:
+            logger.warning(f"⏱️  Lot: délai dépassé, {len(geocoding) + len(waiting)} couples complétés par défaut")
+            run.cancel()
+            received = [(None, dict.fromkeys([*geocoding, *waiting]))]
         
-        # Distance directe
-        direct_distance = haversine_distance(start_lat, start_lon, end_lat, end_lon)
+        # Géocodages arrivés ensemble lancés ensemble : leurs couples partagent appels matrix et chargements GTFS
+        deadline = time.monotonic() + (BATCH_GEOCODE_WINDOW if geocoding else 0)
+        while True:
+            try:
+                received.append(run.events.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
         
-        options = []
+        geocoded_pairs = []
+        for name, values in received:
+            for index, value in values.items():
+                if name == 'geocode':
+                    if index in geocoding:
+                        geocoding[index].discard(value)
+                        if not geocoding[index]:
+                            del geocoding[index]
+                            geocoded_pairs.append(index)
+                    continue
+                if index in geocoding:
+                    del geocoding[index]
+                    yield index, {"success": False, "error": "Géocodage: délai dépassé"}
+                    continue
+                if index not in waiting:
+                    continue  # Couple déjà complété par défaut (délai dépassé)
+                
+                if name is not None:
+                    context[index][4][name] = value
+                    waiting[index].discard(name)
+                    if waiting[index]:
+                        continue
+                else:
+                    for missing in waiting[index]:
+                        context[index][4][missing] = ITINERARY_DEFAULTS[missing]
+                del waiting[index]
+                
+                depart, destination, pair_mode, geocoded, results = context.pop(index)
+                try:
+                    yield index, build_itinerary_response(depart, destination, pair_mode, geocoded, results)
+                except Exception as e:
+                    logger.error(f"❌ Erreur lot [{index}]: {e}")
+                    yield index, {"success": False, "error": str(e)}
         
-        # === TRANSPORT EN COMMUN ===
-        if mode in ['optimal', 'transport']:
-            multimodal = calculate_multimodal_route(start_lat, start_lon, end_lat, end_lon)
+        dispatched = []
+        for index in geocoded_pairs:
+            depart, destination, pair_mode, departure_time = requests_by_index[index]
+            try:
+                geocoded = {
+                    'depart': futures[normalize_address(depart)].result(),
+                    'destination': futures[normalize_address(destination)].result()
+                }
+            except Exception as e:
+                yield index, {"success": False, "error": str(e)}
+                continue
             
-            if multimodal:
-                options.append({
-                    'mode': 'transport',
-                    'label': 'Transports en commun',
-                    'icon': '🚌',
-                    'total_time': round(multimodal['total_time'], 1),
-                    'total_distance': round(multimodal['total_distance'], 2),
-                    'co2_emissions': round(multimodal['total_distance'] * 0.05, 2),
-                    'cost_estimate': 1.50,  # Estimation
-                    'segments': [
-                        {
-                            'type': 'walk',
-                            'icon': '🚶',
-                            'from': start_name,
-                            'to': multimodal['start_stop']['name'],
-                            'distance': round(multimodal['walk_start']['distance'], 2),
-                            'duration': round(multimodal['walk_start']['duration'], 1)
-                        },
-                        {
-                            'type': 'transit',
-                            'icon': '🚌',
-                            'from': multimodal['start_stop']['name'],
-                            'to': multimodal['end_stop']['name'],
-                            'distance': round(multimodal['transit']['distance'], 2),
-                            'duration': round(multimodal['transit']['duration'], 1),
-                            'routes': multimodal['routes'],
-                            'departures': multimodal['departures']
-                        },
-                        {
-                            'type': 'walk',
-                            'icon': '🚶',
-                            'from': multimodal['end_stop']['name'],
-                            'to': end_name,
-                            'distance': round(multimodal['walk_end']['distance'], 2),
-                            'duration': round(multimodal['walk_end']['duration'], 1)
-                        }
-                    ],
-                    'data_source': multimodal['source']
-                })
+            tasks = itinerary_tasks(geocoded, pair_mode, departure_time)
+            context[index] = (depart, destination, pair_mode, geocoded, {})
+            waiting[index] = set(tasks)
+            dispatched.append((index, tasks))
+        if dispatched:
+            batch_dispatch(dispatched, zones, run)
+
+
+def batch_dispatch(items, zones, run):
+    """
+    Lance les tâches de couples géocodés ; items: [(index, tâches de itinerary_tasks)].
+    Détection de lieu partagée par zone (~1 km) sur tout le lot (zones: zone -> future),
+    itinéraires routiers et transports en commun groupés entre les couples lancés ensemble.
+    """
+    locations = defaultdict(list)
+    roads = defaultdict(list)
+    transit = []
+    for index, tasks in items:
+        for name, (_, *args) in tasks.items():
+            if name == 'location':
+                locations[(round(args[0], 2), round(args[1], 2))].append(index)
+            elif name == 'transport':
+                transit.append((index, args))
+            else:
+                roads[args[-1]].append((index, name, *args[:4]))
+    
+    for zone, indexes in locations.items():
+        if zone not in zones:
+            zones[zone] = run.submit(TransitAPIManager.detect_country_city, *zone)
+        zones[zone].add_done_callback(
+            lambda f, indexes=indexes: run.put('location', dict.fromkeys(indexes, batch_result(f, 'location')))
+        )
+    for profile, road_items in roads.items():
+        batch_road_routes(profile, road_items, run)
+    if transit:
+        batch_transit(transit, run)
+
+
+def batch_result(future, name):
+    """Résultat d'une tâche de lot, ou sa valeur par défaut (ITINERARY_DEFAULTS) en cas d'erreur"""
+    try:
+        return future.result()
+    except Exception as e:
+        logger.warning(f"Tâche {name} échouée: {e}")
+        return ITINERARY_DEFAULTS[name]
+
+
+def batch_road_routes(profile, items, run):
+    """
+    Itinéraires routiers d'un lot sur un profil ORS ; items: [(index, nom de tâche, lat1, lon1, lat2, lon2)].
+    Les itinéraires déjà en cache sont servis tels quels, les autres par appels matrix
+    (origines et destinations dédoublonnées, BATCH_MATRIX_MAX_LOCATIONS points par appel).
+    Chaque appel produit un événement (nom, {index: (coords, km, min)}).
+    """
+    name = items[0][1]
+    cached = {}
+    pending = []
+    for index, _, lat1, lon1, lat2, lon2 in items:
+        route = route_cache.get(route_cache.key(profile, lat1, lon1, lat2, lon2))
+        if route is not None:
+            cached[index] = route
+        else:
+            pending.append((index, (lat1, lon1), (lat2, lon2)))
+    if cached:
+        run.put(name, cached)
+    
+    # Groupes compacts: couples triés par origine, coupés dès que la limite de points est atteinte
+    chunk, origins, destinations = [], set(), set()
+    for item in sorted(pending, key=lambda item: item[1:]):
+        _, origin, destination = item
+        if chunk and len(origins | {origin}) + len(destinations | {destination}) > BATCH_MATRIX_MAX_LOCATIONS:
+            run.submit(batch_route_matrix, profile, name, chunk, run)
+            chunk, origins, destinations = [], set(), set()
+        chunk.append(item)
+        origins.add(origin)
+        destinations.add(destination)
+    if chunk:
+        run.submit(batch_route_matrix, profile, name, chunk, run)
+
+
+def batch_route_matrix(profile, name, chunk, run):
+    """Un appel matrix ORS pour un groupe de couples (itinéraires détaillés si la matrice échoue)"""
+    routes = {}
+    try:
+        if run.cancelled:
+            return
+        origins = list(dict.fromkeys(origin for _, origin, _ in chunk))
+        destinations = list(dict.fromkeys(destination for _, _, destination in chunk))
+        matrix = get_route_matrix(origins, destinations, profile)
         
-        # === VOITURE ===
-        if mode in ['optimal', 'voiture']:
-            car_coords, car_dist, car_time = get_route(
-                start_lat, start_lon, end_lat, end_lon, 'driving-car'
-            )
-            if car_coords:
-                options.append({
-                    'mode': 'voiture',
-                    'label': 'Voiture',
-                    'icon': '🚗',
-                    'total_time': round(car_time, 1),
-                    'total_distance': round(car_dist, 2),
-                    'co2_emissions': round(car_dist * 0.12, 2),
-                    'cost_estimate': round(car_dist * 0.15, 2),
-                    'route_coords': car_coords
-                })
+        for index, origin, destination in chunk:
+            if matrix is None:
+                if run.cancelled:
+                    break
+                routes[index] = get_route(*origin, *destination, profile)
+                continue
+            distance = matrix[0][origins.index(origin)][destinations.index(destination)]
+            duration = matrix[1][origins.index(origin)][destinations.index(destination)]
+            routes[index] = NO_ROUTE if distance is None or duration is None else (None, distance, duration)
+    except Exception as e:
+        logger.error(f"Erreur matrice lot {profile}: {e}")
+    finally:
+        run.put(name, {index: routes.get(index, NO_ROUTE) for index, _, _ in chunk})
+
+
+def batch_transit(items, run):
+    """
+    Transports en commun d'un lot ; items: [(index, (lat1, lon1, lat2, lon2, heure de départ))].
+    Un chargement par région de départ ; dès qu'une région est chargée, ses couples sont répartis
+    sur le pool du lot, sur les données de son flux (partagées entre régions d'un même flux).
+    Chaque couple produit un événement ('transport', {index: option}).
+    """
+    regions = defaultdict(list)
+    for index, args in items:
+        regions[region_key_for(args[0], args[1])].append((index, args))
+    logger.info(f"🚌 Lot: {len(items)} trajets sur {len(regions)} régions")
+    
+    for region_key, group in regions.items():
+        future = run.submit(GTFSManager.load_gtfs_for_region, *group[0][1][:2])
+        future.add_done_callback(
+            lambda f, region_key=region_key, group=group: batch_transit_region(f, region_key, group, run)
+        )
+
+
+def batch_transit_region(future, region_key, group, run):
+    """Couples d'une région dont le chargement vient de se terminer, soumis au pool du lot"""
+    gtfs_data = batch_result(future, 'transport')
+    feed_key = gtfs_data.get('feed_key') if gtfs_data else None
+    logger.info(f"🚌 Lot: région {region_key} chargée ({feed_key or 'aucun flux'}), {len(group)} trajets")
+    for index, args in group:
+        run.submit(batch_transit_pair, gtfs_data, index, args, run)
+
+
+def batch_transit_pair(gtfs_data, index, args, run):
+    """Itinéraire en transports en commun d'un couple sur les données de son flux"""
+    option = None
+    try:
+        if gtfs_data and not run.cancelled:
+            option = multimodal_route_on_feed(gtfs_data, *args)
+    except Exception as e:
+        logger.error(f"❌ Erreur lot transports [{index}]: {e}")
+    finally:
+        run.put('transport', {index: option})
+
+
+@app.route('/api/itineraire', methods=['POST'])
+def itineraire():
+    """
+    Endpoint principal - Calcul d'itinéraire optimisé mondial
+    """
+    try:
+        try:
+            depart, destination, mode, departure_time = parse_itinerary_request(request.json)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # === VÉLO ===
-        if mode in ['optimal', 'velo']:
-            bike_coords, bike_dist, bike_time = get_route(
-                start_lat, start_lon, end_lat, end_lon, 'cycling-regular'
-            )
-            if bike_coords:
-                options.append({
-                    'mode': 'velo',
-                    'label': 'Vélo',
-                    'icon': '🚴',
-                    'total_time': round(bike_time, 1),
-                    'total_distance': round(bike_dist, 2),
-                    'co2_emissions': 0,
-                    'cost_estimate': 0,
-                    'route_coords': bike_coords
-                })
+        # Géocodage (départ et destination en parallèle)
+        geocoded = run_parallel({
+            'depart': (geocode, depart),
+            'destination': (geocode, destination)
+        })
         
-        # === À PIED ===
-        if mode in ['optimal', 'pieton'] or direct_distance < 2:
-            walk_coords, walk_dist, walk_time = get_route(
-                start_lat, start_lon, end_lat, end_lon, 'foot-walking'
-            )
-            if walk_coords:
-                options.append({
-                    'mode': 'pieton',
-                    'label': 'À pied',
-                    'icon': '🚶',
-                    'total_time': round(walk_time, 1),
-                    'total_distance': round(walk_dist, 2),
-                    'co2_emissions': 0,
-                    'cost_estimate': 0,
-                    'route_coords': walk_coords
-                })
+        # Détection pays/ville et calcul des modes en parallèle
+        tasks = itinerary_tasks(geocoded, mode, departure_time)
+        results = run_parallel(tasks, timeouts=ITINERARY_TIMEOUTS, defaults=ITINERARY_DEFAULTS)
         
-        # Tri par temps si optimal
-        if mode == 'optimal' and options:
-            options.sort(key=lambda x: x['total_time'])
-        
-        # Recommandations intelligentes
-        recommendations = []
-        if direct_distance < 1.5:
-            recommendations.append("🚶 Courte distance - Marche recommandée!")
-        elif direct_distance < 5:
-            recommendations.append("🚴 Distance idéale pour le vélo")
-        
-        if options:
-            eco_option = min(options, key=lambda x: x['co2_emissions'])
-            if eco_option['co2_emissions'] == 0:
-                recommendations.append(f"🌱 {eco_option['label']} - Zéro émission!")
-            
-            fastest = min(options, key=lambda x: x['total_time'])
-            cheapest = min(options, key=lambda x: x['cost_estimate'])
-            recommendations.append(f"⚡ Plus rapide: {fastest['label']} ({fastest['total_time']}min)")
-            recommendations.append(f"💰 Moins cher: {cheapest['label']} ({cheapest['cost_estimate']}€)")
+        return jsonify(build_itinerary_response(depart, destination, mode, geocoded, results))
         
-        response = {
-            "success": True,
-            "location": {
-                "city": location_info['city'],
-                "country": location_info['country'],
-                "country_code": location_info['country_code']
-            },
-            "depart": {
-                "address": depart,
-                "name": start_name,
-                "lat": start_lat,
-                "lon": start_lon
-            },
-            "destination": {
-                "address": destination,
-                "name": end_name,
-                "lat": end_lat,
-                "lon": end_lon
-            },
-            "direct_distance": round(direct_distance, 2),
-            "options": options,
-            "recommended": options[0] if options else None,
-            "recommendations": recommendations,
-            "timestamp": datetime.now().isoformat()
-        }
+    except Exception as e:
+        logger.error(f"❌ Erreur: {str(e)}", exc_info=True)
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route('/api/itineraire/batch', methods=['POST'])
+def itineraire_batch():
+    """
+    Itinéraires de plusieurs couples origine-destination, en NDJSON au fil des calculs :
+    une ligne {"index": i, ...réponse de /api/itineraire} par couple, dans l'ordre d'achèvement
+    """
+    try:
+        data = request.json
+        pairs = data.get("pairs") if isinstance(data, dict) else None
+        
+        if not isinstance(pairs, list) or not pairs:
+            return jsonify({"error": "pairs requis (liste de {depart, destination})"}), 400
+        if len(pairs) > BATCH_MAX_PAIRS:
+            return jsonify({"error": f"Lot limité à {BATCH_MAX_PAIRS} couples"}), 400
         
-        logger.info(f"✓ {len(options)} options calculées")
-        return jsonify(response)
+        results = calculate_itinerary_batch(pairs, data.get("mode", "optimal"), data.get("heure_depart"))
+        lines = (f"{app.json.dumps({'index': index, **result})}\n" for index, result in results)
+        return Response(stream_with_context(lines), mimetype='application/x-ndjson')
         
     except Exception as e:
-        logger.error(f"❌ Erreur: {str(e)}", exc_info=True)
+        logger.error(f"❌ Erreur lot: {str(e)}", exc_info=True)
         return jsonify({
             "success": False,
             "error": str(e)
@@ -1241,22 +5072,35 @@ def health():
     return jsonify({
         "status": "healthy",
         "service": "worldwide-transport-api",
-        "cache_regions": len(gtfs_cache),
+        "cache_regions": len(region_feeds),
+        "cache_feeds": len(gtfs_cache),
+        "geocode_cache": geocode_cache.stats(),
+        "route_cache": route_cache.stats(),
+        "gtfs_scheduler": region_scheduler.status(),
+        "gtfs_loads": gtfs_loads.stats(),
+        "gtfs_memory": gtfs_memory_usage(),
+        "overpass_mirrors": overpass_mirrors.stats(),
+        "overpass_tiles": overpass_tile_cache.stats(),
+        "gtfs_catalog": feed_catalog.status(),
         "timestamp": datetime.now().isoformat()
     }), 200 
 
 
 @app.route('/ready', methods=['GET'])
 def ready():
-    """Ready check"""
+    """Ready check (attend la fin du préchargement GTFS si configuré)"""
+    warmup = region_scheduler.status()
+    if GTFS_READY_REQUIRES_WARMUP and warmup['state'] == 'running':
+        return jsonify({"status": "warming up", "warmup": warmup}), 503
+    
     try:
-        response = requests.get("https://photon.komoot.io/api/", timeout=5)
+        response = http_session('photon').get("https://photon.komoot.io/api/", timeout=5)
         if response.status_code == 200:
-            return jsonify({"status": "ready"}), 200
+            return jsonify({"status": "ready", "warmup": warmup}), 200
         else:
-            return jsonify({"status": "not ready"}), 503
+            return jsonify({"status": "not ready", "warmup": warmup}), 503
     except:
-        return jsonify({"status": "not ready"}), 503
+        return jsonify({"status": "not ready", "warmup": warmup}), 503
 
 
 @app.route('/')
@@ -1276,7 +5120,32 @@ def internal_error(error):
     return jsonify({"error": "Erreur interne du serveur"}), 500
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """Point d'entrée en ligne de commande : serveur (par défaut) ou compile-feed"""
+    parser = argparse.ArgumentParser(description="API Transport Mondial")
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('serve', help="Démarre le serveur Flask (par défaut)")
+    compile_parser = commands.add_parser('compile-feed', help="Précompile un flux GTFS en artefact mmap")
+    compile_parser.add_argument('source', help="ZIP GTFS local ou URL")
+    compile_parser.add_argument('output', help="Fichier artefact à écrire (ex. feeds/bordeaux.snapshot)")
+    compile_parser.add_argument('--memory-budget-mb', type=float, default=0,
+                                help="Budget mémoire du timetable en Mo (0 = sans limite)")
+    args = parser.parse_args(argv)
+    
+    if args.command == 'compile-feed':
+        start = time.perf_counter()
+        path = GTFSManager.compile_feed(args.source, args.output, args.memory_budget_mb)
+        logger.info(f"✓ Artefact compilé en {time.perf_counter() - start:.1f}s: {path}")
+        return 0
+    
     logger.info(f"🚀 Démarrage API Transport Mondial sur le port {PORT}")
     logger.info(f"🌍 Support: GTFS mondial + OpenStreetMap fallback")
-    app.run(host='0.0.0.0', port=PORT, debug=(FLASK_ENV == 'development'))
\ No newline at end of file
+    # Avec le rechargeur du mode debug, seul le processus enfant sert les requêtes
+    if FLASK_ENV != 'development' or os.environ.get('WERKZEUG_RUN_MAIN'):
+        start_background_tasks()
+    app.run(host='0.0.0.0', port=PORT, debug=(FLASK_ENV == 'development'))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
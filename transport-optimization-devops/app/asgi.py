@@ -0,0 +1,501 @@
+"""
+Mode de service asynchrone (ASGI) - uvicorn asgi:application
+
+/api/itineraire est servi sur la boucle asyncio : géocodage, détection du lieu, itinéraires et
+marches ORS, téléchargement des flux GTFS et requêtes Overpass passent par un client HTTP non
+bloquant (httpx). Seuls le travail CPU du calcul en transports en commun (recherche d'arrêts,
+parsing GTFS, RAPTOR) et les accès aux caches SQLite s'exécutent dans des pools de threads
+dédiés. Un processus garde ainsi des centaines d'itinéraires en cours sans un thread par requête. Les autres routes restent servies
+par l'application Flask (pont WSGI), avec les mêmes réponses.
+"""
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from a2wsgi import WSGIMiddleware
+
+import app as transport
+
+logger = logging.getLogger(__name__)
+
+# Connexions HTTP amont simultanées (tous fournisseurs confondus)
+ASGI_HTTP_MAX_CONNECTIONS = int(os.getenv('ASGI_HTTP_MAX_CONNECTIONS', 200))
+# Threads du calcul en transports en commun et des routes Flask servies par le pont WSGI
+ASGI_GTFS_WORKERS = int(os.getenv('ASGI_GTFS_WORKERS', 16))
+ASGI_WSGI_WORKERS = int(os.getenv('ASGI_WSGI_WORKERS', 16))
+# Threads des lectures/écritures SQLite (cache de géocodage, niveau disque de route_cache)
+ASGI_CACHE_WORKERS = int(os.getenv('ASGI_CACHE_WORKERS', 8))
+
+gtfs_executor = ThreadPoolExecutor(max_workers=ASGI_GTFS_WORKERS, thread_name_prefix='gtfs-async')
+cache_executor = ThreadPoolExecutor(max_workers=ASGI_CACHE_WORKERS, thread_name_prefix='cache-async')
+wsgi_app = WSGIMiddleware(transport.app, workers=ASGI_WSGI_WORKERS)
+
+_clients = {}
+_prefetches = {}  # (boucle, 'gtfs' ou 'osm', URL ou tuiles) -> asyncio.Task du téléchargement
+
+
+def create_upstream_client():
+    """Client httpx mutualisé : keep-alive, connexions bornées, tentatives de connexion"""
+    limits = httpx.Limits(max_connections=ASGI_HTTP_MAX_CONNECTIONS,
+                          max_keepalive_connections=transport.HTTP_POOL_MAXSIZE * 4)
+    return httpx.AsyncClient(
+        limits=limits,
+        transport=httpx.AsyncHTTPTransport(retries=transport.HTTP_RETRIES, limits=limits),
+        timeout=transport.UPSTREAM_TASK_TIMEOUT
+    )
+
+
+def upstream_client():
+    """Client httpx de la boucle courante (créé au premier appel)"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = create_upstream_client()
+    return client
+
+
+async def close_upstream_client():
+    """Ferme le client httpx de la boucle courante"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def geocode_async(address):
+    """Équivalent non bloquant de geocode() (même cache persistant)"""
+    try:
+        coordinates = transport.parse_coordinates(address)
+        if coordinates:
+            return coordinates
+
+        key = transport.normalize_address(address)
+        found, cached = await in_cache_executor(transport.geocode_cache.lookup, key)
+        if found:
+            if cached is None:
+                raise Exception(f"Impossible de géocoder: {address}")
+            logger.info(f"✓ Géocodage (cache): {address}")
+            return tuple(cached)
+
+        result = await geocode_remote_async(address)
+        if result is None:
+            await in_cache_executor(transport.geocode_cache.set, key, None,
+                                    transport.GEOCODE_CACHE_NEGATIVE_TTL_MINUTES * 60)
+            raise Exception(f"Impossible de géocoder: {address}")
+
+        await in_cache_executor(transport.geocode_cache.set, key, list(result))
+        return result
+    except Exception as e:
+        logger.error(f"Erreur géocodage: {e}")
+        raise
+
+
+async def geocode_remote_async(address):
+    """Équivalent non bloquant de geocode_remote() : Photon, puis Nominatim si Photon échoue"""
+    logger.info(f"Géocodage: {address}")
+    client = upstream_client()
+    try:
+        r = await client.get(f"{transport.PHOTON_URL}/api/", params={'q': address, 'limit': 1},
+                             headers=transport.PHOTON_HEADERS, timeout=10)
+        r.raise_for_status()
+        return transport.parse_photon_geocode(r.json(), address)
+    except Exception as e:
+        logger.warning(f"Photon échoué ({e}), essai Nominatim...")
+
+        r = await client.get(transport.NOMINATIM_URL, params=transport.nominatim_params(address),
+                             headers=transport.NOMINATIM_HEADERS, timeout=10)
+        r.raise_for_status()
+        return transport.parse_nominatim_geocode(r.json(), address)
+
+
+async def get_route_async(lat1, lon1, lat2, lon2, profile='driving-car'):
+    """Équivalent non bloquant de get_route() (même route_cache)"""
+    key = transport.route_cache.key(profile, lat1, lon1, lat2, lon2)
+    cached = await in_cache_executor(transport.route_cache.get, key)
+    if cached is not None:
+        logger.info(f"✓ Route {profile} (cache): {cached[1]:.2f}km, {cached[2]:.2f}min")
+        return cached
+
+    try:
+        logger.info(f"Route {profile}: ({lat1},{lon1}) → ({lat2},{lon2})")
+        r = await upstream_client().post(
+            f"{transport.ORS_BASE_URL}/v2/directions/{profile}",
+            json={"coordinates": [[lon1, lat1], [lon2, lat2]]},
+            headers=transport.ors_headers(), timeout=15
+        )
+        r.raise_for_status()
+        return await in_cache_executor(transport.parse_ors_route, r.json(), key)
+    except Exception as e:
+        logger.error(f"Erreur calcul route: {e}")
+        return [], 0, 0
+
+
+async def detect_country_city_async(lat, lon):
+    """Équivalent non bloquant de TransitAPIManager.detect_country_city()"""
+    try:
+        r = await upstream_client().get(f"{transport.PHOTON_URL}/reverse",
+                                        params={'lon': lon, 'lat': lat}, timeout=5)
+        r.raise_for_status()
+        location = transport.TransitAPIManager.parse_photon_location(r.json())
+        if location:
+            return location
+    except Exception as e:
+        logger.warning(f"Erreur détection localisation: {e}")
+
+    return dict(transport.UNKNOWN_LOCATION)
+
+
+async def in_executor(func, *args):
+    """Travail CPU (GTFS, RAPTOR) dans gtfs_executor"""
+    return await asyncio.get_running_loop().run_in_executor(gtfs_executor, func, *args)
+
+
+async def in_cache_executor(func, *args):
+    """Accès aux caches SQLite (verrous, fsync) dans cache_executor, hors de la boucle"""
+    return await asyncio.get_running_loop().run_in_executor(cache_executor, func, *args)
+
+
+async def get_route_matrix_async(origins, destinations, profile='foot-walking'):
+    """Équivalent non bloquant de get_route_matrix()"""
+    try:
+        logger.info(f"Matrice {profile}: {len(origins)} × {len(destinations)}")
+        r = await upstream_client().post(f"{transport.ORS_BASE_URL}/v2/matrix/{profile}",
+                                         json=transport.ors_matrix_payload(origins, destinations),
+                                         headers=transport.ors_headers(), timeout=15)
+        r.raise_for_status()
+        return transport.parse_ors_matrix(r.json())
+    except Exception as e:
+        logger.error(f"Erreur matrice route: {e}")
+        return None
+
+
+async def get_walking_legs_async(start_lat, start_lon, start_stops, end_stops, end_lat, end_lon,
+                                 fallback='directions'):
+    """Équivalent non bloquant de get_walking_legs() (repli directions en appels simultanés)"""
+    access_pairs, egress_pairs, origins, destinations = transport.walking_leg_pairs(
+        start_lat, start_lon, start_stops, end_stops, end_lat, end_lon
+    )
+    matrix = await get_route_matrix_async(origins, destinations, 'foot-walking')
+    legs = transport.walking_legs(matrix, access_pairs, egress_pairs, fallback)
+    if legs:
+        return legs
+    
+    results = await asyncio.gather(*(get_route_async(*pair, 'foot-walking') for pair in access_pairs + egress_pairs))
+    legs = [(distance, duration, False) for _, distance, duration in results]
+    return legs[:len(access_pairs)], legs[len(access_pairs):]
+
+
+async def download_gtfs_async(url):
+    """Équivalent non bloquant de GTFSManager.download_gtfs_to_file() (même plafond de taille)"""
+    max_bytes = transport.GTFS_MAX_DOWNLOAD_MB * 1024 * 1024
+    archive = tempfile.TemporaryFile(prefix='gtfs_', suffix='.zip', dir=transport.GTFS_TMP_DIR)
+    try:
+        logger.info(f"Téléchargement GTFS: {url}")
+        async with upstream_client().stream('GET', url, timeout=60, follow_redirects=True) as response:
+            response.raise_for_status()
+            
+            declared = int(response.headers.get('Content-Length') or 0)
+            if declared > max_bytes:
+                raise ValueError(f"Flux GTFS trop volumineux: {declared // (1024 * 1024)} Mo annoncés")
+            
+            written = 0
+            async for chunk in response.aiter_bytes(transport.GTFS_DOWNLOAD_CHUNK_SIZE):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise ValueError(f"Flux GTFS trop volumineux (> {max_bytes // (1024 * 1024)} Mo)")
+                archive.write(chunk)
+        
+        archive.flush()
+        archive.seek(0)
+        logger.info(f"✓ Téléchargement GTFS terminé: {written / (1024 * 1024):.1f} Mo")
+        return archive
+    except Exception:
+        archive.close()
+        raise
+
+
+async def mirror_request_async(pool, send):
+    """Équivalent asyncio de MirrorPool.request() : même ordre des miroirs, relance décalée et statistiques"""
+    async def attempt(url):
+        start = time.time()
+        try:
+            result = await send(url)
+        except Exception as e:
+            pool.record(url, time.time() - start, e)
+            raise
+        pool.record(url, time.time() - start)
+        return result
+    
+    remaining = pool.ordered()
+    pending = {}
+    last_error = None
+    try:
+        while remaining or pending:
+            if remaining:
+                url = remaining.pop(0)
+                logger.info(f"Tentative {url}")
+                pending[asyncio.ensure_future(attempt(url))] = url
+            
+            done, _ = await asyncio.wait(pending, timeout=pool.hedge_delay_s if remaining else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                url = pending.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    logger.warning(f"{url} échoué: {e}")
+                    last_error = e
+                    continue
+                pool.record_win(url)
+                return url, result
+    finally:
+        for task in pending:
+            task.cancel()
+    
+    raise last_error or RuntimeError("Aucun miroir configuré")
+
+
+async def fetch_overpass_tiles_async(tiles):
+    """Équivalent non bloquant de TransitAPIManager.fetch_overpass_tiles() (mêmes miroirs, même cache)"""
+    rows, cols, query = transport.TransitAPIManager.overpass_request(tiles)
+    
+    async def send(overpass_url):
+        response = await upstream_client().post(overpass_url, data={'data': query},
+                                                timeout=transport.OVERPASS_TIMEOUT_S)
+        response.raise_for_status()
+        return transport.TransitAPIManager.check_overpass_response(response.json())
+    
+    try:
+        overpass_url, data = await mirror_request_async(transport.overpass_mirrors, send)
+    except Exception as e:
+        logger.error(f"Tous les serveurs Overpass ont échoué: {e}")
+        return None
+    
+    return await in_executor(transport.TransitAPIManager.store_overpass_tiles, rows, cols, data, overpass_url)
+
+
+async def prefetch(download, lat, lon):
+    """
+    Téléchargement annoncé par GTFSManager.pending_download() : archive GTFS remise au chargement
+    (prefetched_archives, erreur comprise), tuiles Overpass mises en cache ; tuiles OSM aussi si
+    l'archive n'a pas pu être téléchargée (repli du chargement)
+    """
+    kind, value = download
+    if kind == 'gtfs':
+        try:
+            transport.prefetched_archives[value] = await download_gtfs_async(value)
+            return
+        except Exception as e:
+            transport.prefetched_archives[value] = e
+        value = await in_executor(transport.TransitAPIManager.missing_overpass_tiles, lat, lon)
+    if value:
+        await fetch_overpass_tiles_async(value)
+
+
+async def load_gtfs_for_region_async(lat, lon):
+    """
+    Équivalent de GTFSManager.load_gtfs_for_region() : téléchargements faits en amont sur le client
+    non bloquant (un seul par flux pour les requêtes simultanées), puis chargement (instantanés,
+    parsing) dans gtfs_executor sans accès réseau
+    """
+    download = await in_executor(transport.GTFSManager.pending_download, lat, lon)
+    if download is not None:
+        loop = asyncio.get_running_loop()
+        key = (loop, download[0], str(download[1]))
+        task = _prefetches.get(key)
+        if task is None:
+            task = _prefetches[key] = asyncio.ensure_future(prefetch(download, lat, lon))
+            # Gardé le temps du chargement : les requêtes dont la prévision le précède ne retéléchargent pas
+            task.add_done_callback(
+                lambda _: loop.call_later(transport.GTFS_LOAD_WAIT_S, _prefetches.pop, key, None)
+            )
+        await asyncio.shield(task)
+    
+    try:
+        return await in_executor(transport.GTFSManager.load_gtfs_for_region, lat, lon)
+    finally:
+        if download is not None and download[0] == 'gtfs':
+            # Archive non reprise (flux chargé entre-temps par un autre chemin)
+            leftover = transport.prefetched_archives.pop(download[1], None)
+            if hasattr(leftover, 'close'):
+                leftover.close()
+
+
+async def calculate_multimodal_route_async(start_lat, start_lon, end_lat, end_lon, departure_time=None):
+    """
+    Équivalent de calculate_multimodal_route() : flux et marches ORS sur le client non bloquant,
+    recherche d'arrêts, RAPTOR et assemblage de l'option dans gtfs_executor
+    """
+    try:
+        gtfs_data = await load_gtfs_for_region_async(start_lat, start_lon)
+        if not gtfs_data:
+            logger.warning("Pas de données transport disponibles")
+            return None
+        
+        # Horaires GTFS: calcul sur les horaires réels (correspondances incluses)
+        if gtfs_data.get('planner'):
+            start_stops, end_stops = await in_executor(transport.GTFSManager.nearby_stop_pairs, gtfs_data,
+                                                       start_lat, start_lon, end_lat, end_lon,
+                                                       transport.PLANNER_ACCESS_STOPS)
+            if start_stops and end_stops:
+                legs = await get_walking_legs_async(start_lat, start_lon, start_stops, end_stops, end_lat, end_lon,
+                                                    fallback='estimate')
+                journey = await in_executor(transport.GTFSManager.plan_journey, gtfs_data, start_lat, start_lon,
+                                            end_lat, end_lon, departure_time, None, (start_stops, end_stops, *legs))
+                if journey:
+                    estimated = transport.estimated_planned_walks(journey, start_lat, start_lon, end_lat, end_lon)
+                    routes = await asyncio.gather(*(get_route_async(*pair, 'foot-walking') for _, pair in estimated))
+                    for (key, _), route in zip(estimated, routes):
+                        transport.apply_planned_walk(journey, key, route)
+                    return await in_executor(transport.build_planned_option, gtfs_data, journey,
+                                             start_lat, start_lon, end_lat, end_lon, departure_time)
+        
+        # Sinon (OSM ou aucun trajet trouvé): estimation à vitesse moyenne
+        start_stops, end_stops = await in_executor(transport.GTFSManager.nearby_stop_pairs, gtfs_data,
+                                                   start_lat, start_lon, end_lat, end_lon, 3)
+        if not start_stops or not end_stops:
+            logger.warning("Pas d'arrêts à proximité")
+            return None
+        legs = await get_walking_legs_async(start_lat, start_lon, start_stops, end_stops, end_lat, end_lon)
+        return await in_executor(transport.estimated_multimodal_option, gtfs_data, start_lat, start_lon,
+                                 end_lat, end_lon, (start_stops, end_stops, *legs))
+    
+    except Exception as e:
+        logger.error(f"Erreur calcul multimodal: {e}")
+        return None
+
+
+# Tâches de itinerary_tasks() et leurs équivalents non bloquants
+ASYNC_TASKS = {
+    'depart': geocode_async,
+    'destination': geocode_async,
+    'location': detect_country_city_async,
+    'transport': calculate_multimodal_route_async,
+    'voiture': get_route_async,
+    'velo': get_route_async,
+    'pieton': get_route_async
+}
+
+
+async def run_task(name, func, *args):
+    """Exécute une tâche de itinerary_tasks() sans bloquer la boucle (équivalent non bloquant, sinon pool)"""
+    handler = ASYNC_TASKS.get(name)
+    if handler is not None:
+        return await handler(*args)
+    return await in_executor(func, *args)
+
+
+async def run_parallel_async(tasks, timeouts=None, defaults=None):
+    """Équivalent asyncio de run_parallel() : mêmes délais par tâche et mêmes valeurs par défaut"""
+    timeouts = timeouts or {}
+    defaults = defaults or {}
+    names = list(tasks)
+    outcomes = await asyncio.gather(*(
+        asyncio.wait_for(run_task(name, *tasks[name]), timeouts.get(name, transport.UPSTREAM_TASK_TIMEOUT))
+        for name in names
+    ), return_exceptions=True)
+
+    results = {}
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            logger.warning(f"⏱️  Tâche {name}: délai dépassé")
+            if name not in defaults:
+                raise Exception(f"Délai dépassé: {name}")
+            results[name] = defaults[name]
+        elif isinstance(outcome, Exception):
+            if name not in defaults:
+                raise outcome
+            logger.warning(f"Tâche {name} échouée: {outcome}")
+            results[name] = defaults[name]
+        else:
+            results[name] = outcome
+
+    return results
+
+
+async def itineraire(scope, receive, send):
+    """POST /api/itineraire (mêmes validations, calculs et réponse que la route Flask)"""
+    try:
+        data = json.loads(await read_body(receive))
+        try:
+            depart, destination, mode, departure_time = transport.parse_itinerary_request(data)
+        except ValueError as e:
+            await send_json(scope, send, 400, {"error": str(e)})
+            return
+
+        geocoded = await run_parallel_async({
+            'depart': (transport.geocode, depart),
+            'destination': (transport.geocode, destination)
+        })
+
+        tasks = transport.itinerary_tasks(geocoded, mode, departure_time)
+        results = await run_parallel_async(tasks, timeouts=transport.ITINERARY_TIMEOUTS,
+                                           defaults=transport.ITINERARY_DEFAULTS)
+
+        payload = transport.build_itinerary_response(depart, destination, mode, geocoded, results)
+        await send_json(scope, send, 200, payload)
+
+    except Exception as e:
+        logger.error(f"❌ Erreur: {str(e)}", exc_info=True)
+        await send_json(scope, send, 500, {
+            "success": False,
+            "error": str(e)
+        })
+
+
+async def read_body(receive):
+    """Corps complet d'une requête HTTP ASGI"""
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def send_json(scope, send, status, payload):
+    """Réponse JSON sérialisée comme jsonify() (mêmes octets, en-têtes CORS de flask-cors)"""
+    body = f"{transport.app.json.dumps(payload)}\n".encode()
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    origin = dict(scope.get('headers') or []).get(b'origin')
+    if origin:
+        headers += [(b'access-control-allow-origin', origin), (b'vary', b'Origin')]
+    else:
+        headers.append((b'access-control-allow-origin', b'*'))
+
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive, send):
+    """Démarrage : tâches de fond GTFS ; arrêt : fermeture du client httpx"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            transport.start_background_tasks()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_upstream_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """Application ASGI : /api/itineraire en asyncio, le reste via l'application Flask"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/api/itineraire' and scope['method'] == 'POST':
+        await itineraire(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    logger.info(f"🚀 Démarrage ASGI sur port {transport.PORT}")
+    uvicorn.run(application, host='0.0.0.0', port=transport.PORT)
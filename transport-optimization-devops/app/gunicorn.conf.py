@@ -0,0 +1,21 @@
+"""
+Configuration gunicorn (lue automatiquement depuis le dossier de l'application).
+Chaque worker démarre le préchargement GTFS et le catalogue dès son lancement, sans attendre
+sa première requête : /ready reflète ainsi l'état de tous les workers.
+
+Workers gthread : le thread principal du worker continue de signaler sa présence à l'arbitre
+pendant qu'une requête tourne, si bien qu'une réponse longue (flux NDJSON de
+/api/itineraire/batch) n'est pas tuée au bout de `timeout`. Avec des workers sync, le délai
+s'applique à la requête entière.
+"""
+import os
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+
+
+def post_worker_init(worker):
+    """Après le chargement de l'application dans le worker (processus forké)"""
+    from app import start_background_tasks
+    start_background_tasks()
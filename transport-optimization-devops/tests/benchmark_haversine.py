@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark: haversine scalaire (boucle Python) vs calcul vectorisé NumPy
+sur un flux synthétique de 50 000 arrêts
+"""
+
+import os
+import sys
+import random
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+import numpy as np
+from app import haversine_distance, haversine_batch, StopSpatialIndex
+
+N_STOPS = 50000
+REPEAT = 20
+CENTER = (44.8378, -0.5792)  # Bordeaux
+
+
+def build_stops(n):
+    """Arrêts aléatoires dans un carré de ~40 km autour du centre"""
+    random.seed(42)
+    return {
+        f"S{i}": {
+            'lat': CENTER[0] + random.uniform(-0.2, 0.2),
+            'lon': CENTER[1] + random.uniform(-0.3, 0.3)
+        }
+        for i in range(n)
+    }
+
+
+def timed(func):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        result = func()
+    return (time.perf_counter() - start) / REPEAT * 1000, result
+
+
+def main():
+    print(f"🚀 Benchmark haversine - {N_STOPS} arrêts, {REPEAT} répétitions")
+    print("=" * 60)
+
+    stops = build_stops(N_STOPS)
+    lats = np.array([s['lat'] for s in stops.values()])
+    lons = np.array([s['lon'] for s in stops.values()])
+    index = StopSpatialIndex(stops)
+
+    scalar_ms, scalar = timed(lambda: [haversine_distance(CENTER[0], CENTER[1], s['lat'], s['lon'])
+                                       for s in stops.values()])
+    batch_ms, batch = timed(lambda: haversine_batch(CENTER[0], CENTER[1], lats, lons))
+    assert np.allclose(scalar, batch)
+
+    print(f"Toutes les distances (scalaire): {scalar_ms:8.2f} ms")
+    print(f"Toutes les distances (NumPy):    {batch_ms:8.2f} ms  (x{scalar_ms / batch_ms:.0f})")
+
+    def scan_radius():
+        return [sid for sid, s in stops.items()
+                if haversine_distance(CENTER[0], CENTER[1], s['lat'], s['lon']) <= 2.0]
+
+    scan_ms, expected = timed(scan_radius)
+    index_ms, found = timed(lambda: index.within(CENTER[0], CENTER[1], 2.0, sort=False))
+    assert [sid for sid, _ in found] == expected
+
+    print(f"Arrêts à 2 km (parcours complet): {scan_ms:7.2f} ms")
+    print(f"Arrêts à 2 km (index + NumPy):    {index_ms:7.2f} ms  (x{scan_ms / index_ms:.0f})")
+
+
+if __name__ == "__main__":
+    main()
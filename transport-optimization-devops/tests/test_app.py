@@ -1,6 +1,7 @@
 import pytest
 import sys
 import os
+from types import SimpleNamespace
 
 # Add parent directory to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
@@ -65,6 +66,625 @@ def test_itineraire_valid_request(client):
         data = response.get_json()
         assert 'distance' in data or 'success' in data
 
+def test_itineraire_upstream_calls_run_concurrently(client, monkeypatch):
+    """Test geocoding and routing calls are fanned out instead of chained"""
+    import time
+    import app as app_module
+
+    delay = 0.3
+
+    def slow_geocode(address):
+        time.sleep(delay)
+        return (44.84, -0.58, address) if address == 'A' else (44.85, -0.57, address)
+
+    def slow_route(lat1, lon1, lat2, lon2, profile):
+        time.sleep(delay)
+        return [[lat1, lon1], [lat2, lon2]], 2.0, {'driving-car': 5, 'cycling-regular': 8}.get(profile, 25)
+
+    def slow_detect(lat, lon):
+        time.sleep(delay)
+        return {'country': 'France', 'country_code': 'fr', 'city': 'Bordeaux', 'state': ''}
+
+    def slow_multimodal(*args):
+        time.sleep(delay)
+        return None
+
+    monkeypatch.setattr(app_module, 'geocode', slow_geocode)
+    monkeypatch.setattr(app_module, 'get_route', slow_route)
+    monkeypatch.setattr(app_module.TransitAPIManager, 'detect_country_city', staticmethod(slow_detect))
+    monkeypatch.setattr(app_module, 'calculate_multimodal_route', slow_multimodal)
+
+    start_time = time.time()
+    response = client.post('/api/itineraire', json={'depart': 'A', 'destination': 'B'})
+    elapsed = time.time() - start_time
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [o['mode'] for o in data['options']] == ['voiture', 'velo', 'pieton']
+    assert data['location']['city'] == 'Bordeaux'
+    # 7 appels de 0.3 s en série (2.1 s) contre 2 étapes parallèles (~0.6 s)
+    assert elapsed < 5 * delay
+
+def test_itineraire_geocoding_failure_propagates(client, monkeypatch):
+    """Test a failed geocode still returns a 500 with its message"""
+    import app as app_module
+
+    def failing_geocode(address):
+        raise Exception(f"Adresse introuvable: {address}")
+
+    monkeypatch.setattr(app_module, 'geocode', failing_geocode)
+    response = client.post('/api/itineraire', json={'depart': 'A', 'destination': 'B'})
+    assert response.status_code == 500
+    assert 'Adresse introuvable' in response.get_json()['error']
+
+def test_geocode_cache_persists_and_normalizes(tmp_path, monkeypatch):
+    """Test geocoding results are cached on disk under a normalized key"""
+    import app as app_module
+
+    calls = []
+
+    def fake_remote(address):
+        calls.append(address)
+        return None if address == 'Nulle Part' else (44.8259, -0.5564, 'Gare Saint-Jean')
+
+    path = str(tmp_path / 'geocode.sqlite3')
+    monkeypatch.setattr(app_module, 'geocode_remote', fake_remote)
+    monkeypatch.setattr(app_module, 'geocode_cache', app_module.PersistentCache(path, 3600, 100, table='geocode'))
+
+    assert app_module.geocode('Gare Saint-Jean, Bordeaux') == (44.8259, -0.5564, 'Gare Saint-Jean')
+    assert app_module.geocode('  gare saint-jean ,BORDEAUX ') == (44.8259, -0.5564, 'Gare Saint-Jean')
+    assert len(calls) == 1
+
+    # Échec mis en cache négatif
+    for _ in range(2):
+        with pytest.raises(Exception, match='Impossible de géocoder'):
+            app_module.geocode('Nulle Part')
+    assert calls == ['Gare Saint-Jean, Bordeaux', 'Nulle Part']
+
+    # Un autre worker (nouvelle instance, même fichier) profite du cache
+    other = app_module.PersistentCache(path, 3600, 100, table='geocode')
+    assert other.lookup('gare saint-jean , bordeaux') == (True, [44.8259, -0.5564, 'Gare Saint-Jean'])
+
+    stats = app_module.geocode_cache.stats()
+    assert (stats['hits'], stats['negative_hits'], stats['misses']) == (1, 1, 2)
+
+def test_persistent_cache_ttl_and_lru(tmp_path):
+    """Test expired entries are dropped and the least recently used are evicted"""
+    import app as app_module
+
+    cache = app_module.PersistentCache(str(tmp_path / 'c.sqlite3'), 3600, max_entries=2)
+    cache.set('expired', 1, ttl_seconds=-1)
+    assert cache.lookup('expired') == (False, None)
+
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache._connection().execute("UPDATE cache SET accessed = 0 WHERE key = 'a'")
+    cache.set('c', 3)
+    assert cache.lookup('a') == (False, None)
+    assert cache.lookup('b') == (True, 2)
+    assert cache.lookup('c') == (True, 3)
+
+def test_persistent_cache_counts_only_when_full(tmp_path):
+    """Test writes below max_entries do not count the whole table"""
+    import app as app_module
+
+    cache = app_module.PersistentCache(str(tmp_path / 'c.sqlite3'), 3600, max_entries=10)
+    statements = []
+    cache._connection().set_trace_callback(statements.append)
+    for i in range(12):
+        cache.set(f'k{i}', i)
+
+    counts = [sql for sql in statements if 'COUNT(*)' in sql]
+    # Premier comptage puis un seul au-delà de la limite
+    assert len(counts) == 2
+    assert cache.stats()['entries'] == 10
+
+def test_gunicorn_workers_start_background_tasks_at_boot(monkeypatch):
+    """Test each gunicorn worker starts GTFS warmup when it boots, not on its first request"""
+    import importlib.util
+    import app as app_module
+
+    started = []
+    monkeypatch.setattr(app_module, 'GTFS_SCHEDULER', True)
+    monkeypatch.setattr(app_module.region_scheduler, 'ensure_started', lambda: started.append('scheduler'))
+    monkeypatch.setattr(app_module.feed_catalog, 'ensure_started', lambda: started.append('catalog'))
+
+    path = os.path.join(os.path.dirname(__file__), '../app/gunicorn.conf.py')
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', path)
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    config.post_worker_init(SimpleNamespace())
+
+    assert sorted(started) == ['catalog', 'scheduler']
+
+def test_health_reports_geocode_cache(client):
+    """Test /health exposes geocoding cache counters"""
+    data = client.get('/health').get_json()
+    assert {'hits', 'misses', 'entries'} <= set(data['geocode_cache'])
+
+def test_get_route_cached_on_snapped_coordinates(monkeypatch):
+    """Test ORS is called once for nearby coordinates on the same profile"""
+    import app as app_module
+
+    calls = []
+
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {'routes': [{'geometry': '_p~iF~ps|U_ulLnnqC_mqNvxq`@',
+                                'summary': {'distance': 1500, 'duration': 1200}}]}
+
+    def fake_post(url, **kwargs):
+        calls.append(url)
+        return FakeResponse()
+
+    monkeypatch.setattr(app_module, 'http_session', lambda provider: SimpleNamespace(post=fake_post))
+    monkeypatch.setattr(app_module, 'route_cache', app_module.RouteCache(3600, 1024 * 1024, precision=4))
+
+    first = app_module.get_route(44.83781, -0.57921, 44.8259, -0.5564, 'foot-walking')
+    again = app_module.get_route(44.83779, -0.57919, 44.8259, -0.5564, 'foot-walking')
+    assert again == first
+    assert first[1:] == (1.5, 20.0)
+    assert len(calls) == 1
+
+    app_module.get_route(44.83781, -0.57921, 44.8259, -0.5564, 'driving-car')
+    assert len(calls) == 2
+    assert app_module.route_cache.stats()['hits'] == 1
+
+def test_route_cache_memory_bound_and_disk_tier(tmp_path):
+    """Test the memory tier evicts LRU entries and the disk tier refills it"""
+    import app as app_module
+
+    disk = app_module.PersistentCache(str(tmp_path / 'routes.sqlite3'), 3600, 100, table='routes')
+    size = app_module.RouteCache.ENTRY_BYTES + app_module.RouteCache.POINT_BYTES * 2
+    cache = app_module.RouteCache(3600, max_bytes=2 * size, disk=disk)
+    route = ([[-0.57, 44.83], [-0.55, 44.82]], 2.0, 25.0)
+
+    for i in range(3):
+        cache.put(f'k{i}', route)
+    assert list(cache.entries) == ['k1', 'k2']
+    assert cache.nbytes == 2 * size
+
+    assert cache.get('k0') == route
+    assert cache.stats()['disk_hits'] == 1
+    assert list(cache.entries) == ['k2', 'k0']
+
+    # Même itinéraire pour un autre processus (mémoire vide, disque partagé)
+    fresh = app_module.RouteCache(3600, max_bytes=2 * size, disk=disk)
+    assert fresh.get('k1') == route
+
+def test_http_sessions_pooled_per_provider(monkeypatch):
+    """Test sessions are reused per provider and rebuilt in a forked worker"""
+    import app as app_module
+
+    ors = app_module.http_session('ors')
+    assert app_module.http_session('ors') is ors
+    assert app_module.http_session('photon') is not ors
+
+    adapter = ors.get_adapter('https://api.openrouteservice.org')
+    assert adapter._pool_maxsize == app_module.HTTP_POOL_MAXSIZE
+    assert adapter.max_retries.total == app_module.HTTP_RETRIES
+    assert app_module.http_session('overpass').get_adapter('https://overpass-api.de').max_retries.total == 0
+
+    monkeypatch.setattr(app_module.os, 'getpid', lambda: -1)
+    assert app_module.http_session('ors') is not ors
+
+def test_overpass_mirrors_hedged(monkeypatch):
+    """Test a slow mirror is raced by the next one and a failure hands over immediately"""
+    import time
+    import threading
+    import app as app_module
+    from concurrent.futures import ThreadPoolExecutor
+
+    release = threading.Event()
+
+    def send(url):
+        if url == 'slow':
+            release.wait(5)
+            return 'lent'
+        if url == 'broken':
+            raise ValueError('runtime error: Query timed out')
+        return 'rapide'
+
+    pool = app_module.MirrorPool(['slow', 'fast'], 0.05, 300, ThreadPoolExecutor(max_workers=4))
+    start_time = time.time()
+    assert pool.request(send) == ('fast', 'rapide')
+    assert time.time() - start_time < 1
+    release.set()
+
+    pool = app_module.MirrorPool(['broken', 'fast'], 5, 300, ThreadPoolExecutor(max_workers=4))
+    start_time = time.time()
+    assert pool.request(send) == ('fast', 'rapide')
+    assert time.time() - start_time < 1
+    # Le miroir en échec passe en fin de liste pour les requêtes suivantes
+    assert pool.ordered() == ['fast', 'broken']
+    stats = {mirror['url']: mirror for mirror in pool.stats()}
+    assert (stats['fast']['wins'], stats['broken']['failures']) == (1, 1)
+    assert 'Query timed out' in stats['broken']['last_error']
+
+    pool = app_module.MirrorPool(['broken'], 0.05, 300, ThreadPoolExecutor(max_workers=1))
+    with pytest.raises(ValueError):
+        pool.request(send)
+
+def test_overpass_single_combined_query(tmp_path, monkeypatch):
+    """Test stops and the routes serving them come back from one Overpass call"""
+    import app as app_module
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = []
+    elements = [
+        {'type': 'node', 'id': 1, 'lat': 44.84, 'lon': -0.58, 'tags': {'name': 'Hôtel de Ville', 'highway': 'bus_stop'}},
+        {'type': 'node', 'id': 2, 'lat': 44.85, 'lon': -0.57, 'tags': {'public_transport': 'stop_position'}},
+        {'type': 'relation', 'id': 9, 'tags': {'route': 'tram', 'ref': 'A', 'name': 'Tram A', 'colour': '#81197F'},
+         'members': [{'type': 'node', 'ref': 1, 'role': 'stop'}]},
+    ]
+
+    def fake_post(url, data=None, **kwargs):
+        calls.append((url, data['data']))
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: {'elements': elements})
+
+    monkeypatch.setattr(app_module, 'http_session', lambda provider: SimpleNamespace(post=fake_post))
+    monkeypatch.setattr(app_module, 'overpass_mirrors',
+                        app_module.MirrorPool(['m1', 'm2'], 5, 300, ThreadPoolExecutor(max_workers=2)))
+    monkeypatch.setattr(app_module, 'overpass_tile_cache',
+                        app_module.PersistentCache(str(tmp_path / 'overpass.sqlite3'), 3600, 100, table='tiles'))
+
+    data = app_module.TransitAPIManager.get_transit_data_overpass(44.84, -0.58)
+
+    assert len(calls) == 1
+    assert 'rel(bn.stops)' in calls[0][1]
+    assert [stop['id'] for stop in data['stops']] == ['osm_1']
+    assert data['routes'][0]['short_name'] == 'A'
+    assert data['routes'][0]['color'] == '#81197F'
+    assert data['routes'][0]['stop_ids'] == ['osm_1']
+
+def test_overpass_tiles_cached_on_disk(tmp_path, monkeypatch):
+    """Test only missing tiles are fetched and cached tiles survive a new cache instance"""
+    import re
+    import app as app_module
+    from concurrent.futures import ThreadPoolExecutor
+
+    stops = [(1, 44.8380, -0.5790), (2, 44.8450, -0.5740), (3, 44.8610, -0.5790), (4, 44.9000, -0.5790)]
+    queries = []
+
+    def fake_post(url, data=None, **kwargs):
+        # Overpass simulé : arrêts de l'emprise demandée, une ligne les reliant tous
+        south, west, north, east = map(float, re.search(r'\[bbox:([^\]]+)\]', data['data']).group(1).split(','))
+        queries.append((south, west, north, east))
+        elements = [{'type': 'node', 'id': i, 'lat': lat, 'lon': lon, 'tags': {'name': f'Arrêt {i}', 'highway': 'bus_stop'}}
+                    for i, lat, lon in stops if south <= lat <= north and west <= lon <= east]
+        elements.append({'type': 'relation', 'id': 9, 'tags': {'route': 'bus', 'ref': '9'},
+                         'members': [{'type': 'node', 'ref': i, 'role': 'stop'} for i, _, _ in stops]})
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: {'elements': elements})
+
+    path = str(tmp_path / 'overpass.sqlite3')
+    monkeypatch.setattr(app_module, 'http_session', lambda provider: SimpleNamespace(post=fake_post))
+    monkeypatch.setattr(app_module, 'overpass_mirrors',
+                        app_module.MirrorPool(['m1'], 5, 300, ThreadPoolExecutor(max_workers=1)))
+    monkeypatch.setattr(app_module, 'overpass_tile_cache', app_module.PersistentCache(path, 3600, 100, table='tiles'))
+    manager = app_module.TransitAPIManager
+
+    data = manager.get_transit_data_overpass(44.8380, -0.5790, radius_m=2000)
+    assert sorted(stop['id'] for stop in data['stops']) == ['osm_1', 'osm_2']
+    assert data['routes'][0]['stop_ids'] == ['osm_1', 'osm_2']
+    assert len(queries) == 1
+
+    # Même zone depuis un autre worker : aucun appel Overpass
+    monkeypatch.setattr(app_module, 'overpass_tile_cache', app_module.PersistentCache(path, 3600, 100, table='tiles'))
+    assert manager.get_transit_data_overpass(44.8385, -0.5785, radius_m=2000) is not None
+    assert len(queries) == 1
+
+    # Zone décalée vers le nord : seules les tuiles manquantes sont demandées
+    data = manager.get_transit_data_overpass(44.8600, -0.5790, radius_m=2000)
+    assert len(queries) == 2
+    assert queries[1][0] >= queries[0][2] - 1e-9
+    assert sorted(stop['id'] for stop in data['stops']) == ['osm_2', 'osm_3']
+    assert data['routes'][0]['stop_ids'] == ['osm_2', 'osm_3']
+
+def fake_upstream(path, params):
+    """Réponses Photon / ORS simulées, partagées par le mode WSGI et le mode ASGI"""
+    if path == '/api/':
+        lat, lon = (44.84, -0.58) if params['q'].startswith('A') else (44.85, -0.57)
+        return {'features': [{'geometry': {'coordinates': [lon, lat]}, 'properties': {'name': params['q']}}]}
+    if path == '/reverse':
+        return {'features': [{'properties': {'country': 'France', 'countrycode': 'fr', 'city': 'Bordeaux'}}]}
+    profile = path.rsplit('/', 1)[-1]
+    return {'routes': [{'geometry': '_p~iF~ps|U_ulLnnqC_mqNvxq`@',
+                        'summary': {'distance': 2000, 'duration': {'driving-car': 300, 'cycling-regular': 480}.get(profile, 1500)}}]}
+
+def asgi_upstream(tmp_path, monkeypatch, delay=0.0, feed_zip=None, calls=None):
+    """
+    Module asgi avec client httpx simulé et caches vierges. Avec feed_zip, flux GTFS servi par le
+    client simulé (téléchargement, matrice de marche ORS) ; sinon aucun flux pour la position.
+    """
+    httpx = pytest.importorskip('httpx')
+    pytest.importorskip('a2wsgi')
+    import asyncio
+    import json
+    import app as app_module
+    import asgi as asgi_module
+
+    async def handler(request):
+        if calls is not None:
+            calls.append(request.url.path)
+        await asyncio.sleep(delay)
+        if request.url.path == '/gtfs.zip':
+            return httpx.Response(200, content=feed_zip)
+        if request.url.path.startswith('/v2/matrix/'):
+            body = json.loads(request.content)
+            rows, columns = len(body['sources']), len(body['destinations'])
+            return httpx.Response(200, json={'distances': [[200.0] * columns] * rows,
+                                             'durations': [[150.0] * columns] * rows})
+        return httpx.Response(200, json=fake_upstream(request.url.path, dict(request.url.params)))
+
+    monkeypatch.setattr(asgi_module, 'create_upstream_client',
+                        lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(app_module, 'geocode_cache',
+                        app_module.PersistentCache(str(tmp_path / 'geocode.sqlite3'), 3600, 1000, table='geocode'))
+    monkeypatch.setattr(app_module, 'route_cache', app_module.RouteCache(3600, 1024 * 1024, precision=4))
+    monkeypatch.setattr(app_module, 'gtfs_cache', app_module.LoadedFeeds())
+    monkeypatch.setattr(app_module, 'region_feeds', {})
+    monkeypatch.setattr(app_module, 'GTFS_SNAPSHOT_DIR', str(tmp_path / 'gtfs'))
+    monkeypatch.setattr(app_module, 'GTFS_ARTIFACT_DIR', None)
+    feeds = [{'url': 'http://feeds.test/gtfs.zip'}] if feed_zip else []
+    monkeypatch.setattr(app_module.TransitAPIManager, 'search_gtfs_feeds', staticmethod(lambda lat, lon: feeds))
+    if not feed_zip:
+        monkeypatch.setattr(app_module.GTFSManager, 'load_gtfs_for_region', staticmethod(lambda lat, lon: None))
+        monkeypatch.setattr(app_module.GTFSManager, 'pending_download', staticmethod(lambda lat, lon: None))
+    return httpx, asgi_module
+
+def asgi_post(httpx, asgi_module, requests):
+    """Envoie des requêtes simultanées à l'application ASGI"""
+    import asyncio
+
+    async def run():
+        transport = httpx.ASGITransport(app=asgi_module.application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            responses = await asyncio.gather(*(client.request(method, url, json=body) for method, url, body in requests))
+        await asgi_module.close_upstream_client()
+        return responses
+
+    return asyncio.run(run())
+
+def test_asgi_itineraire_matches_flask(client, tmp_path, monkeypatch):
+    """Test the async serving mode returns the Flask payloads and delegates other routes"""
+    from urllib.parse import urlsplit, parse_qsl
+    import app as app_module
+
+    import threading
+
+    httpx, asgi_module = asgi_upstream(tmp_path, monkeypatch)
+    # Accès SQLite hors de la boucle asyncio
+    cache_threads = []
+    for cache, name in ((app_module.geocode_cache, 'lookup'), (app_module.geocode_cache, 'set'),
+                        (app_module.route_cache, 'get'), (app_module.route_cache, 'put')):
+        def record(*args, _method=getattr(cache, name), **kwargs):
+            cache_threads.append(threading.current_thread().name)
+            return _method(*args, **kwargs)
+        monkeypatch.setattr(cache, name, record)
+
+    body = {'depart': 'A', 'destination': 'B', 'mode': 'optimal'}
+    itinerary, missing, health = asgi_post(httpx, asgi_module, [
+        ('POST', '/api/itineraire', body),
+        ('POST', '/api/itineraire', {'depart': 'A'}),
+        ('GET', '/health', None)
+    ])
+    assert cache_threads and all(name.startswith('cache-async') for name in cache_threads)
+    assert itinerary.status_code == 200
+    assert missing.status_code == 400
+    assert health.status_code == 200 and health.json()['status'] == 'healthy'
+
+    def fake_request(url, params=None, **kwargs):
+        parts = urlsplit(url)
+        data = fake_upstream(parts.path, params or dict(parse_qsl(parts.query)))
+        return SimpleNamespace(raise_for_status=lambda: None, json=lambda: data)
+
+    monkeypatch.setattr(app_module, 'http_session', lambda provider: SimpleNamespace(get=fake_request, post=fake_request))
+    monkeypatch.setattr(app_module, 'geocode_cache',
+                        app_module.PersistentCache(str(tmp_path / 'sync.sqlite3'), 3600, 1000, table='geocode'))
+    monkeypatch.setattr(app_module, 'route_cache', app_module.RouteCache(3600, 1024 * 1024, precision=4))
+    expected = client.post('/api/itineraire', json=body)
+
+    assert expected.status_code == 200
+    data, expected_data = itinerary.json(), expected.get_json()
+    assert data.pop('timestamp') and expected_data.pop('timestamp')
+    assert data == expected_data
+    assert [o['mode'] for o in data['options']] == ['voiture', 'velo', 'pieton']
+    assert missing.json() == client.post('/api/itineraire', json={'depart': 'A'}).get_json()
+
+def test_asgi_itineraire_holds_many_requests(tmp_path, monkeypatch):
+    """Test hundreds of optimal itineraries, transit included, wait on upstream calls in one event loop"""
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    import app as app_module
+    from test_gtfs import build_feed_zip
+
+    delay = 0.2
+    calls = []
+    httpx, asgi_module = asgi_upstream(tmp_path, monkeypatch, delay, feed_zip=build_feed_zip(), calls=calls)
+    # Aucun appel amont synchrone : le pool ne fait que le travail CPU (parsing GTFS, RAPTOR)
+    monkeypatch.setattr(app_module, 'http_session', lambda provider: pytest.fail(f"appel bloquant {provider}"))
+    monkeypatch.setattr(asgi_module, 'gtfs_executor', ThreadPoolExecutor(max_workers=2))
+    monkeypatch.setattr(app_module, 'PLANNER_ACCESS_STOPS', 1)  # Hotel de Ville -> Chartrons, correspondance à Quinconces
+    requests = [('POST', '/api/itineraire',
+                 {'depart': f'A{i}', 'destination': f'B{i}', 'mode': 'optimal', 'heure_depart': '07:50'})
+                for i in range(200)]
+
+    start_time = time.time()
+    responses = asgi_post(httpx, asgi_module, requests)
+    elapsed = time.time() - start_time
+
+    assert all(r.status_code == 200 for r in responses)
+    assert responses[-1].json()['depart']['name'] == 'A199'
+    for response in responses:
+        transit = [o for o in response.json()['options'] if o['mode'] == 'transport']
+        assert transit and [segment['legs'] for segment in transit[0]['segments'] if segment['type'] == 'transit']
+    # Flux téléchargé une fois pour les requêtes simultanées, marches par la matrice ORS
+    assert calls.count('/gtfs.zip') == 1
+    assert calls.count('/v2/matrix/foot-walking') == 200
+    # 200 x (géocodage, flux, marches, itinéraires) en série ou sur 2 threads : > 40 s ; en concurrence :
+    # quelques allers-retours
+    assert elapsed < 25 * delay
+
+def test_itineraire_batch_groups_work(client, monkeypatch):
+    """Test a batch geocodes each address once, routes by matrix, plans per feed and streams NDJSON"""
+    import json
+    import time
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    import app as app_module
+
+    points = {'A1': (44.84, -0.58), 'A2': (44.86, -0.60), 'B1': (44.80, -0.70), 'B2': (44.90, -0.50),
+              'C1': (48.85, 2.35), 'D1': (48.80, 2.13)}
+    feeds = {'bordeaux': {'source': 'gtfs'}, 'paris': {'source': 'gtfs'}}
+    geocoded, matrices, loads, planned = [], [], [], []
+
+    def fake_geocode(address):
+        if address == 'D1':
+            time.sleep(0.3)
+        geocoded.append(address)
+        return (*points[address], address)
+
+    def fake_matrix(origins, destinations, profile):
+        matrices.append((profile, len(origins), len(destinations)))
+        return ([[2.0] * len(destinations) for _ in origins],
+                [[{'driving-car': 5, 'cycling-regular': 8}.get(profile, 25)] * len(destinations) for _ in origins])
+
+    def fake_load(lat, lon):
+        loads.append((lat, lon))
+        return feeds['paris' if lat > 46 else 'bordeaux']
+
+    # Les trois couples bordelais ne passent la barrière qu'ensemble : calculés en parallèle
+    bordeaux_pairs = threading.Barrier(3, timeout=5)
+
+    def fake_plan(gtfs_data, *args):
+        if gtfs_data is feeds['paris']:
+            time.sleep(0.3)
+        else:
+            bordeaux_pairs.wait()
+        planned.append((id(gtfs_data), threading.get_ident()))
+        return None
+
+    monkeypatch.setattr(app_module, 'batch_executor', ThreadPoolExecutor(max_workers=8))
+    monkeypatch.setattr(app_module, 'geocode', fake_geocode)
+    monkeypatch.setattr(app_module, 'get_route_matrix', fake_matrix)
+    monkeypatch.setattr(app_module, 'route_cache', app_module.RouteCache(3600, 1024 * 1024, precision=4))
+    monkeypatch.setattr(app_module, 'multimodal_route_on_feed', fake_plan)
+    monkeypatch.setattr(app_module.GTFSManager, 'load_gtfs_for_region', staticmethod(fake_load))
+    monkeypatch.setattr(app_module.TransitAPIManager, 'detect_country_city',
+                        staticmethod(lambda lat, lon: {'country': 'France', 'country_code': 'FR', 'city': '', 'state': ''}))
+
+    pairs = [{'depart': 'C1', 'destination': 'D1'}, {'depart': 'A1', 'destination': 'B1'},
+             {'depart': 'A1', 'destination': 'B2'}, {'depart': 'A2', 'destination': 'B1'},
+             {'depart': 'C1', 'destination': 'D1', 'mode': 'voiture'}, {'depart': 'A1'}]
+    response = client.post('/api/itineraire/batch', json={'pairs': pairs})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert sorted(line['index'] for line in lines) == list(range(6))
+    results = {line['index']: line for line in lines}
+    assert results[5]['success'] is False
+    # Erreurs de validation d'abord ; les couples bordelais n'attendent pas le géocodage lent de D1,
+    # le couple parisien en transports (flux lent) arrive en dernier
+    order = [line['index'] for line in lines]
+    assert order[0] == 5 and order[-1] == 0
+    assert set(order[1:4]) == {1, 2, 3}
+    assert [o['mode'] for o in results[1]['options']] == ['voiture', 'velo', 'pieton']
+    assert results[1]['options'][0]['route_coords'] is None
+    assert [o['mode'] for o in results[4]['options']] == ['voiture']
+
+    assert sorted(geocoded) == sorted(points)
+    # Un appel matrix par profil et par vague de couples géocodés (Bordeaux, puis Paris)
+    assert sorted(profile for profile, _, _ in matrices) == ['cycling-regular', 'cycling-regular', 'driving-car',
+                                                             'driving-car', 'foot-walking', 'foot-walking']
+    assert len(loads) == 3
+    by_feed = {}
+    for feed, thread in planned:
+        by_feed.setdefault(feed, set()).add(thread)
+    assert len(planned) == 4 and len(by_feed) == 2
+    assert len(by_feed[id(feeds['bordeaux'])]) == 3
+
+    assert client.post('/api/itineraire/batch', json={}).status_code == 400
+
+def test_batch_transit_starts_each_region_when_loaded(monkeypatch):
+    """Test a slow feed load does not hold back pairs whose region is already loaded"""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    import app as app_module
+
+    slow_feed = threading.Event()
+    feeds = {'fast': {'feed_key': 'fast'}, 'slow': {'feed_key': 'slow'}}
+
+    def fake_load(lat, lon):
+        if lat > 46:
+            slow_feed.wait(5)
+            return feeds['slow']
+        return feeds['fast']
+
+    monkeypatch.setattr(app_module, 'batch_executor', ThreadPoolExecutor(max_workers=4))
+    monkeypatch.setattr(app_module.GTFSManager, 'load_gtfs_for_region', staticmethod(fake_load))
+    monkeypatch.setattr(app_module, 'multimodal_route_on_feed', lambda gtfs_data, *args: gtfs_data['feed_key'])
+
+    run = app_module.BatchRun()
+    app_module.batch_transit([(0, (48.85, 2.35, 48.80, 2.13, None)), (1, (44.84, -0.58, 44.80, -0.70, None))], run)
+    assert run.events.get(timeout=2) == ('transport', {1: 'fast'})
+    slow_feed.set()
+    assert run.events.get(timeout=2) == ('transport', {0: 'slow'})
+
+def test_batch_deadline_and_close_cancel_pending_work(monkeypatch):
+    """Test a batch past its deadline, or closed by the client, cancels its queued upstream work"""
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    import app as app_module
+
+    gate = threading.Event()
+    geocoded, matrices = [], []
+
+    def fake_geocode(address):
+        geocoded.append(address)
+        if address == 'nowhere':
+            raise ValueError(f"Impossible de géocoder: {address}")
+        gate.wait(5)
+        return (44.84, -0.58, address)
+
+    monkeypatch.setattr(app_module, 'batch_executor', ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(app_module, 'geocode', fake_geocode)
+    monkeypatch.setattr(app_module, 'BATCH_DEADLINE_S', 0.2)
+    pairs = [{'depart': f'A{i}', 'destination': f'B{i}'} for i in range(5)]
+
+    start = time.monotonic()
+    results = dict(app_module.calculate_itinerary_batch(pairs))
+    assert time.monotonic() - start < 2
+    assert sorted(results) == list(range(5))
+    assert all(result['success'] is False for result in results.values())
+    gate.set()
+    app_module.batch_executor.shutdown(wait=True)
+    # Seul le géocodage déjà démarré a tourné, les autres ont été annulés
+    assert geocoded == ['A0']
+
+    # Générateur fermé (client déconnecté) : tâches en attente annulées
+    gate.clear()
+    geocoded.clear()
+    monkeypatch.setattr(app_module, 'batch_executor', ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(app_module, 'BATCH_DEADLINE_S', 60)
+    batch = app_module.calculate_itinerary_batch([{'depart': 'nowhere', 'destination': 'nowhere'}] + pairs)
+    assert next(batch) == (0, {'success': False, 'error': 'Impossible de géocoder: nowhere'})
+    batch.close()
+    gate.set()
+    app_module.batch_executor.shutdown(wait=True)
+    assert geocoded == ['nowhere', 'A0']
+
+    # Tâches déjà démarrées : pas d'appel amont une fois le lot annulé
+    monkeypatch.setattr(app_module, 'get_route_matrix', lambda *args: matrices.append(args))
+    run = app_module.BatchRun()
+    run.cancel()
+    app_module.batch_route_matrix('driving-car', 'voiture', [(0, (44.84, -0.58), (44.80, -0.70))], run)
+    assert matrices == [] and run.events.get_nowait() == ('voiture', {0: app_module.NO_ROUTE})
+
 def test_404_error(client):
     """Test 404 error handling"""
     response = client.get('/nonexistent-route')
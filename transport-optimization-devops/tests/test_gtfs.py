@@ -0,0 +1,1077 @@
+import pytest
+import sys
+import os
+import io
+import zipfile
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../app')))
+
+import app as app_module
+from app import GTFSManager
+
+# Mini flux GTFS (Bordeaux) pour les tests unitaires
+FEED_FILES = {
+    'stops.txt': (
+        "stop_id,stop_name,stop_lat,stop_lon,stop_code\n"
+        "S1,Victoire,44.8310,-0.5730,V\n"
+        "S2,Hotel de Ville,44.8380,-0.5790,HDV\n"
+        "S3,Quinconces,44.8450,-0.5740,Q\n"
+        "S4,Chartrons,44.8520,-0.5700,C\n"
+        "S5,Merignac Centre,44.8440,-0.6450,MC\n"
+    ),
+    'routes.txt': (
+        "route_id,route_short_name,route_long_name,route_type,route_color\n"
+        "RA,A,Tram A,0,81197F\n"
+        "R9,9,Bus 9,3,00B1EB\n"
+    ),
+    'trips.txt': (
+        "route_id,service_id,trip_id,trip_headsign\n"
+        "RA,WEEK,TA1,Quinconces\n"
+        "RA,WEEK,TA2,Quinconces\n"
+        "R9,WEEK,T91,Chartrons\n"
+        "R9,WEEK,T92,Chartrons\n"
+    ),
+    'stop_times.txt': (
+        "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+        "TA1,08:00:00,08:00:00,S1,1\n"
+        "TA1,08:05:00,08:05:00,S2,2\n"
+        "TA1,08:10:00,08:10:00,S3,3\n"
+        "TA2,09:00:00,09:00:00,S1,1\n"
+        "TA2,09:05:00,09:05:00,S2,2\n"
+        "TA2,09:10:00,09:10:00,S3,3\n"
+        "T91,08:20:00,08:20:00,S3,1\n"
+        "T91,08:30:00,08:30:00,S4,2\n"
+        "T92,25:10:00,25:10:00,S3,1\n"
+        "T92,25:20:00,25:20:00,S4,2\n"
+    ),
+}
+
+CENTER = (44.8380, -0.5790)
+
+
+def build_feed_zip(files=FEED_FILES):
+    """Construit un ZIP GTFS en mémoire"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+    return buffer.getvalue()
+
+
+class FakeResponse:
+    """Réponse HTTP minimale pour requests.get(..., stream=True)"""
+
+    def __init__(self, payload, headers=None):
+        self.payload = payload
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.payload), chunk_size):
+            yield self.payload[i:i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def feed_zip():
+    return build_feed_zip()
+
+
+@pytest.fixture
+def gtfs_data(feed_zip):
+    """Flux GTFS parsé (source gtfs)"""
+    with zipfile.ZipFile(io.BytesIO(feed_zip)) as zf:
+        data = GTFSManager.parse_gtfs_zip(zf, *CENTER)
+    data['source'] = 'gtfs'
+    return data
+
+
+def use_fake_http(monkeypatch, **methods):
+    """Remplace les sessions HTTP mutualisées par des fonctions de test"""
+    session = SimpleNamespace(**methods)
+    monkeypatch.setattr(app_module, 'http_session', lambda provider: session)
+
+
+def test_download_streams_to_disk(monkeypatch, feed_zip):
+    """Le ZIP est écrit par morceaux sur disque puis parsé"""
+    monkeypatch.setattr(app_module, 'GTFS_DOWNLOAD_CHUNK_SIZE', 64)
+    use_fake_http(monkeypatch, get=lambda *a, **kw: FakeResponse(feed_zip))
+
+    data = GTFSManager.download_and_parse_gtfs('http://example.test/gtfs.zip', *CENTER)
+
+    assert data is not None
+    assert len(data['stops']) == 5
+    assert set(data['routes']) == {'RA', 'R9'}
+
+
+def test_download_size_cap(monkeypatch, feed_zip):
+    """Un flux plus gros que le plafond est rejeté"""
+    use_fake_http(monkeypatch, get=lambda *a, **kw: FakeResponse(feed_zip))
+
+    with pytest.raises(ValueError):
+        GTFSManager.download_gtfs_to_file('http://example.test/gtfs.zip', max_bytes=100)
+
+    big = FakeResponse(b'', headers={'Content-Length': str(10 ** 12)})
+    use_fake_http(monkeypatch, get=lambda *a, **kw: big)
+    with pytest.raises(ValueError):
+        GTFSManager.download_gtfs_to_file('http://example.test/gtfs.zip')
+
+
+def test_timetable_store_is_columnar(gtfs_data):
+    """stop_times stockés en colonnes, horaires en secondes"""
+    timetable = gtfs_data['timetable']
+
+    assert len(timetable) == 10
+    assert timetable.departure.typecode == 'i'
+    assert timetable.sequence.typecode == 'h'
+    rows = list(timetable.rows('S3'))
+    assert len(rows) == 4
+    assert (8 * 3600 + 10 * 60) in [dep for _, _, dep, _ in rows]
+    assert (25 * 3600 + 10 * 60) in [dep for _, _, dep, _ in rows]
+    assert timetable.nbytes == 10 * (4 + 4 + 4 + 2)
+
+
+def test_routes_from_timetable(gtfs_data):
+    """Lignes à un arrêt et lignes connectant deux arrêts"""
+    routes = GTFSManager.get_routes_at_stop(gtfs_data, 'S3')
+    assert [r['id'] for r in routes] == ['RA', 'R9']
+
+    connecting = GTFSManager.find_connecting_routes(gtfs_data, 'S1', 'S3')
+    assert [r['id'] for r in connecting] == ['RA']
+
+    # Mauvais sens: fallback sur les lignes du départ
+    reverse = GTFSManager.find_connecting_routes(gtfs_data, 'S4', 'S3')
+    assert [r['id'] for r in reverse] == ['R9']
+
+
+def test_spatial_index_matches_linear_scan(gtfs_data):
+    """Même ordre et mêmes distances qu'un parcours complet"""
+    lat, lon = 44.8400, -0.5760
+    expected = []
+    for stop in gtfs_data['stops'].values():
+        distance = app_module.haversine_distance(lat, lon, stop['lat'], stop['lon'])
+        if distance <= 1.5:
+            expected.append({**stop, 'distance': round(distance * 1000, 0)})
+    expected.sort(key=lambda x: x['distance'])
+
+    assert GTFSManager.find_nearby_stops(gtfs_data, lat, lon, 1.5) == expected
+    assert GTFSManager.find_nearby_stops(gtfs_data, lat, lon, 1.5, limit=2) == expected[:2]
+
+
+def test_spatial_index_nearest():
+    """k plus proches avec rayon de recherche croissant"""
+    stops = {
+        'near': {'lat': 48.8566, 'lon': 2.3522},
+        'mid': {'lat': 48.8700, 'lon': 2.3522},
+        'far': {'lat': 49.5000, 'lon': 2.3522},
+    }
+    index = app_module.StopSpatialIndex(stops)
+
+    assert [sid for sid, _ in index.nearest(48.8566, 2.3522, k=2)] == ['near', 'mid']
+    assert [sid for sid, _ in index.nearest(48.8566, 2.3522, k=3)] == ['near', 'mid', 'far']
+    assert [sid for sid, _ in index.nearest(48.8566, 2.3522, k=3, max_radius_km=5)] == ['near', 'mid']
+
+
+def test_haversine_batch_matches_scalar():
+    """Les versions vectorisées donnent les mêmes distances que la version scalaire"""
+    lats = [44.8378, 48.8566, -33.8688]
+    lons = [-0.5792, 2.3522, 151.2093]
+
+    batch = app_module.haversine_batch(45.7640, 4.8357, lats, lons)
+    matrix = app_module.haversine_matrix(lats[:2], lons[:2], lats, lons)
+
+    for j in range(3):
+        assert batch[j] == pytest.approx(app_module.haversine_distance(45.7640, 4.8357, lats[j], lons[j]))
+        for i in range(2):
+            assert matrix[i][j] == pytest.approx(app_module.haversine_distance(lats[i], lons[i], lats[j], lons[j]))
+
+
+def test_next_departures_bisect(gtfs_data):
+    """Départs triés en secondes, y compris après minuit"""
+    at = app_module.datetime(2025, 3, 10, 8, 3)
+    departures = GTFSManager.get_next_departures(gtfs_data, 'S2', at=at)
+    assert [d['time'] for d in departures] == ['08:05:00', '09:05:00']
+
+    # 25:10 du jour de service = 01:10 le lendemain, après les départs du jour
+    evening = GTFSManager.get_next_departures(gtfs_data, 'S3', at=app_module.datetime(2025, 3, 10, 9, 0))
+    assert [d['time'] for d in evening] == ['09:10:00', '01:10:00']
+
+    # À 00:30, le trip de 25:10 de la veille passe à 01:10
+    night = GTFSManager.get_next_departures(gtfs_data, 'S3', limit=2, at=app_module.datetime(2025, 3, 10, 0, 30))
+    assert [d['time'] for d in night] == ['01:10:00', '08:10:00']
+
+    filtered = GTFSManager.get_next_departures(gtfs_data, 'S3', route_filter={'R9'},
+                                               at=app_module.datetime(2025, 3, 10, 0, 30))
+    assert [d['route'] for d in filtered] == ['9', '9', '9']
+
+
+def test_route_patterns(gtfs_data):
+    """Une séquence d'arrêts distincte par ligne, partagée par les trips identiques"""
+    timetable = gtfs_data['timetable']
+
+    assert len(timetable.patterns) == 2
+    assert timetable.trip_pattern[timetable.trip_index['TA1']] == timetable.trip_pattern[timetable.trip_index['TA2']]
+    assert timetable.routes_at('S3') == {'RA', 'R9'}
+    assert timetable.routes_between('S1', 'S3') == {'RA'}
+    assert timetable.routes_between('S3', 'S1') == set()
+    assert timetable.routes_between('S1', 'S4') == set()
+
+
+def test_overtaking_trip_gets_own_pattern():
+    """Un trip qui en dépasse un autre sur la même séquence forme son propre pattern"""
+    files = dict(FEED_FILES)
+    files['trips.txt'] += "RA,WEEK,TA3,Quinconces\n"
+    files['stop_times.txt'] += (
+        "TA3,08:02:00,08:02:00,S1,1\n"
+        "TA3,08:03:00,08:03:00,S2,2\n"
+        "TA3,08:06:00,08:06:00,S3,3\n"
+    )
+    with zipfile.ZipFile(io.BytesIO(build_feed_zip(files))) as zf:
+        data = GTFSManager.parse_gtfs_zip(zf)
+    timetable = data['timetable']
+
+    trip_pattern = {trip: timetable.trip_pattern[timetable.trip_index[trip]] for trip in ('TA1', 'TA2', 'TA3')}
+    assert trip_pattern['TA1'] == trip_pattern['TA2'] != trip_pattern['TA3']
+    # À Hotel de Ville à 08:03, l'express (arrivée 08:06) et non TA1 parti à 08:05 (arrivée 08:10)
+    journey = data['planner'].plan({'S2': 0}, {'S3': 0}, departure=8 * 3600 + 3 * 60)
+    assert journey['legs'][0]['trip_id'] == 'TA3'
+    assert journey['arrival'] == 8 * 3600 + 6 * 60
+
+
+def test_planner_with_transfer(gtfs_data):
+    """Tram A puis correspondance bus 9 à Quinconces"""
+    planner = gtfs_data['planner']
+    journey = planner.plan({'S1': 120}, {'S4': 60}, departure=7 * 3600 + 55 * 60)
+
+    transit = [leg for leg in journey['legs'] if leg['type'] == 'transit']
+    assert [leg['route_id'] for leg in transit] == ['RA', 'R9']
+    assert transit[0]['from_stop'] == 'S1' and transit[1]['to_stop'] == 'S4'
+    assert journey['transfers'] == 1
+    assert journey['arrival'] == 8 * 3600 + 30 * 60 + 60
+    # Attente: 07:57 -> 08:00 puis 08:10 -> 08:20
+    assert journey['wait'] == 3 * 60 + 10 * 60
+    assert journey['ride'] == 10 * 60 + 10 * 60
+
+    # Sans correspondance autorisée: pas d'itinéraire
+    assert planner.plan({'S1': 120}, {'S4': 60}, departure=7 * 3600 + 55 * 60, max_transfers=0) is None
+
+
+def test_planner_overnight_and_earliest_trip(gtfs_data):
+    """Prend le trip suivant, y compris après minuit (25:10 de la veille)"""
+    planner = gtfs_data['planner']
+
+    later = planner.plan({'S1': 0}, {'S2': 0}, departure=8 * 3600 + 1)
+    assert later['legs'][0]['trip_id'] == 'TA2'
+
+    night = planner.plan({'S3': 0}, {'S4': 0}, departure=30 * 60)
+    assert night['legs'][0]['trip_id'] == 'T92'
+    assert night['arrival'] == 1 * 3600 + 20 * 60
+
+
+def test_plan_journey_from_coordinates(monkeypatch, gtfs_data):
+    """Arrêts candidats trouvés autour des coordonnées de départ/arrivée"""
+    monkeypatch.setattr(app_module, 'get_route_matrix', lambda *a, **kw: None)
+    journey = GTFSManager.plan_journey(gtfs_data, 44.8312, -0.5731, 44.8519, -0.5702,
+                                       app_module.datetime(2025, 3, 10, 7, 50))
+
+    assert journey['start_stop']['id'] == 'S1'
+    # Descendre à Quinconces et finir à pied (08:21) bat le bus 9 (08:30)
+    assert journey['end_stop']['id'] == 'S3'
+    assert journey['arrival'] < 8 * 3600 + 30 * 60
+
+
+def test_walking_legs_single_matrix_call(monkeypatch):
+    """Un seul appel matrix pour toutes les marches d'accès et finales"""
+    calls = []
+
+    class MatrixResponse:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            body = calls[-1]
+            rows, cols = len(body['sources']), len(body['destinations'])
+            return {'distances': [[1000.0 * (i + j + 1) for j in range(cols)] for i in range(rows)],
+                    'durations': [[60.0 * (i + j + 1) for j in range(cols)] for i in range(rows)]}
+
+    def fake_post(url, json=None, **kwargs):
+        assert url.endswith('/v2/matrix/foot-walking')
+        calls.append(json)
+        return MatrixResponse()
+
+    use_fake_http(monkeypatch, post=fake_post)
+    start_stops = [{'lat': 44.83, 'lon': -0.57}, {'lat': 44.84, 'lon': -0.58}, {'lat': 44.85, 'lon': -0.59}]
+    end_stops = [{'lat': 44.86, 'lon': -0.60}, {'lat': 44.87, 'lon': -0.61}]
+
+    access, egress = app_module.get_walking_legs(44.82, -0.56, start_stops, end_stops, 44.88, -0.62)
+
+    assert len(calls) == 1
+    assert [duration for _, duration, _ in access] == [1.0, 2.0, 3.0]
+    # Ligne i+1 (arrêt d'arrivée i), dernière colonne (destination)
+    assert [duration for _, duration, _ in egress] == [5.0, 6.0]
+
+
+def test_walking_legs_fallback_deduplicated(monkeypatch):
+    """Sans matrice: un appel directions par arrêt distinct (3 + 3 au lieu de 18)"""
+    monkeypatch.setattr(app_module, 'get_route_matrix', lambda *a, **kw: None)
+    calls = []
+
+    def fake_route(lat1, lon1, lat2, lon2, profile='driving-car'):
+        calls.append((lat1, lon1, lat2, lon2))
+        return [], 1.0, 12.0
+
+    monkeypatch.setattr(app_module, 'get_route', fake_route)
+    stops = [{'lat': 44.83 + i / 100, 'lon': -0.57} for i in range(3)]
+
+    access, egress = app_module.get_walking_legs(44.82, -0.56, stops, stops, 44.88, -0.62)
+
+    assert len(calls) == 6
+    assert access == [(1.0, 12.0, False)] * 3 and egress == [(1.0, 12.0, False)] * 3
+
+
+def test_snapshot_roundtrip(tmp_path, gtfs_data):
+    """L'instantané mmap restitue le même flux (tableaux en vues sur le fichier)"""
+    path = str(tmp_path / 'region.snapshot')
+    app_module.GTFSSnapshot.save(gtfs_data, path, meta={'key': 'region'})
+    loaded = app_module.GTFSSnapshot.load(path)
+
+    assert loaded['stops'] == gtfs_data['stops']
+    assert loaded['routes'] == gtfs_data['routes']
+    assert dict(loaded['trips']) == gtfs_data['trips']
+    assert loaded['snapshot']['key'] == 'region'
+
+    original, restored = gtfs_data['timetable'], loaded['timetable']
+    assert isinstance(restored.departure, memoryview)
+    for name in app_module.GTFSSnapshot.TIMETABLE_ARRAYS:
+        assert list(getattr(restored, name)) == list(getattr(original, name)), name
+    assert restored.stop_offsets == original.stop_offsets
+    assert list(restored.patterns) == list(original.patterns)
+    assert restored.stop_patterns == original.stop_patterns
+    assert list(loaded['planner'].foot_targets) == list(gtfs_data['planner'].foot_targets)
+
+    query = ({'S1': 120}, {'S4': 60}, 7 * 3600 + 55 * 60)
+    assert loaded['planner'].plan(*query) == gtfs_data['planner'].plan(*query)
+    loaded['source'] = 'gtfs'
+    at = app_module.datetime(2025, 3, 10, 7, 55)
+    assert (GTFSManager.get_next_departures(loaded, 'S3', at=at)
+            == GTFSManager.get_next_departures(gtfs_data, 'S3', at=at))
+
+
+def test_snapshot_indexes_served_from_columns(tmp_path, gtfs_data):
+    """Arrêts, lignes et index par arrêt relus en colonnes mmap, sans dict reconstruit au chargement"""
+    path = str(tmp_path / 'region.snapshot')
+    app_module.GTFSSnapshot.save(gtfs_data, path)
+    loaded = app_module.GTFSSnapshot.load(path)
+    timetable, stops = loaded['timetable'], loaded['stops']
+
+    assert isinstance(stops, app_module.StopTable) and isinstance(loaded['routes'], app_module.RouteTable)
+    assert isinstance(stops.lat_col, memoryview) and isinstance(stops.stop_ids.blob, memoryview)
+    assert not isinstance(timetable.stop_index, dict) and not isinstance(timetable.trip_index, dict)
+    assert not isinstance(timetable.stop_offsets, dict) and not isinstance(timetable.stop_patterns, dict)
+    assert not loaded['stop_index'].lats.flags.owndata
+
+    assert timetable.stop_index['S3'] == gtfs_data['timetable'].stop_index['S3']
+    assert 'S9' not in timetable.stop_index and timetable.stop_offsets.get('S9') is None
+    assert timetable.routes_between('S1', 'S4') == gtfs_data['timetable'].routes_between('S1', 'S4')
+    assert [stop_id for stop_id, _ in loaded['stop_index'].nearest(*CENTER, 3)] == \
+        [stop_id for stop_id, _ in gtfs_data['stop_index'].nearest(*CENTER, 3)]
+
+    # Réécriture depuis un instantané chargé (tables reprises telles quelles)
+    copy = str(tmp_path / 'copy.snapshot')
+    app_module.GTFSSnapshot.save(loaded, copy)
+    assert app_module.GTFSSnapshot.load(copy)['stops'] == gtfs_data['stops']
+
+    footprint = GTFSManager.footprint(loaded)
+    assert footprint['objects'] == 0 and footprint['arrays'] == 0
+
+
+FEED_URL = 'http://example.test/gtfs.zip'
+
+
+def cached_feed(gtfs_data, hours_old=0, feed_key=FEED_URL, center=CENTER):
+    """Entrée de gtfs_cache telle qu'enregistrée par GTFSManager.cache_feed"""
+    return {**gtfs_data, 'feed_key': feed_key, 'center': center, 'coverage': GTFSManager.coverage(gtfs_data),
+            'loaded_at': app_module.datetime.now() - app_module.timedelta(hours=hours_old)}
+
+
+def test_region_served_from_snapshot(tmp_path, monkeypatch, gtfs_data):
+    """Un worker sans cache mémoire relit l'instantané du flux au lieu de retélécharger"""
+    monkeypatch.setattr(app_module, 'GTFS_SNAPSHOT_DIR', str(tmp_path))
+    monkeypatch.setattr(app_module, 'gtfs_cache', app_module.LoadedFeeds())
+    monkeypatch.setattr(app_module, 'region_feeds', {})
+    GTFSManager.save_snapshot(FEED_URL, gtfs_data)
+
+    def no_download(*args, **kwargs):
+        raise AssertionError('téléchargement inattendu')
+
+    monkeypatch.setattr(app_module.TransitAPIManager, 'search_gtfs_feeds', staticmethod(lambda *a: [{'url': FEED_URL}]))
+    monkeypatch.setattr(GTFSManager, 'download_and_parse_gtfs', staticmethod(no_download))
+    data = GTFSManager.load_gtfs_for_region(44.8380, -0.5790)
+
+    assert data['source'] == 'gtfs'
+    assert set(data['stops']) == set(gtfs_data['stops'])
+    assert app_module.gtfs_cache[FEED_URL] is data
+
+
+def test_loaded_feed_lookup_prefers_gtfs_over_osm(monkeypatch, gtfs_data):
+    """Un fallback OSM (petite emprise) ne masque pas le flux GTFS chargé autour de lui"""
+    osm = {'source': 'osm', 'loaded_at': app_module.datetime.now(),
+           'coverage': [44.8370, -0.5800, 44.8390, -0.5780]}
+    far = {**cached_feed(gtfs_data, feed_key='far'), 'coverage': [48.80, 2.25, 48.90, 2.40]}
+    feeds = app_module.LoadedFeeds({'osm:44.84_-0.58': osm, 'far': far})
+    monkeypatch.setattr(app_module, 'gtfs_cache', feeds)
+    monkeypatch.setattr(app_module, 'region_feeds', {'44.84_-0.58': 'osm:44.84_-0.58'})
+
+    # Seuls les flux de la cellule de la position sont testés
+    assert feeds.find(44.8380, -0.5790) == 'osm:44.84_-0.58'
+    assert feeds.find(48.85, 2.35) == 'far'
+    assert feeds.find(40.0, 0.0) is None
+
+    feeds[FEED_URL] = cached_feed(gtfs_data)
+    assert GTFSManager.find_loaded_feed(44.8380, -0.5790)[0] == FEED_URL
+    assert app_module.region_feeds['44.84_-0.58'] == FEED_URL
+
+    del feeds[FEED_URL]
+    assert GTFSManager.find_loaded_feed(44.8380, -0.5790)[0] == 'osm:44.84_-0.58'
+    assert not any(FEED_URL in keys for keys in feeds.cells.values())
+
+
+def test_feed_cached_once_for_nearby_regions(monkeypatch, gtfs_data):
+    """Deux positions de la même ville partagent le flux, résolu par son emprise"""
+    monkeypatch.setattr(app_module, 'GTFS_SNAPSHOTS', False)
+    monkeypatch.setattr(app_module, 'gtfs_cache', app_module.LoadedFeeds())
+    monkeypatch.setattr(app_module, 'region_feeds', {})
+
+    searches, downloads = [], []
+
+    def search(lat, lon):
+        searches.append((lat, lon))
+        return [{'url': FEED_URL}]
+
+    def download(url, *args):
+        downloads.append(url)
+        return gtfs_data
+
+    monkeypatch.setattr(app_module.TransitAPIManager, 'search_gtfs_feeds', staticmethod(search))
+    monkeypatch.setattr(GTFSManager, 'download_and_parse_gtfs', staticmethod(download))
+
+    first = GTFSManager.load_gtfs_for_region(44.8310, -0.5730)
+    second = GTFSManager.load_gtfs_for_region(44.8500, -0.6100)
+    # Hors emprise des arrêts mais même flux renvoyé par la recherche
+    third = GTFSManager.load_gtfs_for_region(44.9000, -0.5000)
+
+    assert first is second is third
+    assert downloads == [FEED_URL]
+    assert len(searches) == 2
+    assert list(app_module.gtfs_cache) == [FEED_URL]
+    assert set(app_module.region_feeds) == {'44.83_-0.57', '44.85_-0.61', '44.9_-0.5'}
+    assert first['coverage'] == [44.831, -0.645, 44.852, -0.57]
+
+
+def test_compile_feed_artifact(tmp_path, monkeypatch, feed_zip):
+    """compile-feed produit un artefact chargé pour les positions dans son emprise"""
+    source = tmp_path / 'feed.zip'
+    source.write_bytes(feed_zip)
+    artifacts = tmp_path / 'feeds'
+    artifacts.mkdir()
+
+    assert app_module.main(['compile-feed', str(source), str(artifacts / 'bordeaux.snapshot')]) == 0
+
+    header = app_module.GTFSSnapshot.read_header(str(artifacts / 'bordeaux.snapshot'))
+    assert header['meta']['kind'] == 'artifact'
+    assert header['meta']['bbox'] == [44.831, -0.645, 44.852, -0.57]
+
+    monkeypatch.setattr(app_module, 'GTFS_ARTIFACT_DIR', str(artifacts))
+    monkeypatch.setattr(app_module, 'GTFS_SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    monkeypatch.setattr(app_module, 'gtfs_cache', app_module.LoadedFeeds())
+    monkeypatch.setattr(app_module, 'region_feeds', {})
+    monkeypatch.setattr(app_module.TransitAPIManager, 'search_gtfs_feeds', staticmethod(lambda *a: []))
+    monkeypatch.setattr(app_module.TransitAPIManager, 'get_transit_data_overpass',
+                        staticmethod(lambda *a: {'stops': [], 'routes': []}))
+
+    data = GTFSManager.load_gtfs_for_region(44.845, -0.60)
+    assert data['source'] == 'gtfs'
+    # Flux complet, sans filtre géographique
+    assert set(data['timetable'].stop_ids) == {'S1', 'S2', 'S3', 'S4'}
+
+    assert GTFSManager.find_artifact(48.85, 2.35) is None
+    assert GTFSManager.load_gtfs_for_region(48.85, 2.35)['source'] == 'osm'
+
+
+def make_scheduler(tmp_path, regions=()):
+    return app_module.RegionScheduler(list(regions), hot_limit=5, hot_file=str(tmp_path / 'hot.json'))
+
+
+def test_stale_region_served_while_refreshing(tmp_path, monkeypatch, gtfs_data):
+    """Une entrée expirée est servie immédiatement, le rechargement part en arrière-plan"""
+    import threading
+
+    scheduler = make_scheduler(tmp_path)
+    monkeypatch.setattr(app_module, 'region_scheduler', scheduler)
+    monkeypatch.setattr(app_module, 'GTFS_SCHEDULER_INTERVAL_S', 3600)
+    stale = cached_feed(gtfs_data, hours_old=25)
+    monkeypatch.setattr(app_module, 'gtfs_cache', app_module.LoadedFeeds({FEED_URL: stale}))
+    monkeypatch.setattr(app_module, 'region_feeds', {})
+
+    release = threading.Event()
+    refreshed = []
+
+    def slow_refresh(lat, lon, current=None):
+        release.wait(5)
+        refreshed.append((lat, lon, current is stale))
+        app_module.gtfs_cache[FEED_URL] = cached_feed(gtfs_data)
+
+    monkeypatch.setattr(GTFSManager, 'refresh_region', staticmethod(slow_refresh))
+
+    # Planificateur arrêté: rechargement synchrone
+    release.set()
+    assert GTFSManager.load_gtfs_for_region(44.8380, -0.5790) is None
+    assert refreshed == [(44.838, -0.579, True)]
+
+    app_module.gtfs_cache[FEED_URL] = stale
+    release.clear()
+    scheduler.ensure_started()
+    assert GTFSManager.load_gtfs_for_region(44.8380, -0.5790) is stale
+    assert GTFSManager.load_gtfs_for_region(44.8380, -0.5790) is stale
+    assert scheduler.status()['refreshing'] == [FEED_URL]
+
+    release.set()
+    scheduler.executor.shutdown(wait=True)
+    assert refreshed[1:] == [(*CENTER, True)]
+    assert app_module.gtfs_cache[FEED_URL] is not stale
+    assert scheduler.status()['hot_regions'] == ['44.84_-0.58']
+
+
+def test_warmup_and_ready_probe(tmp_path, monkeypatch, gtfs_data):
+    """Préchargement des régions configurées et /ready en attente pendant celui-ci"""
+    scheduler = make_scheduler(tmp_path, regions=[(44.8378, -0.5792)])
+    monkeypatch.setattr(app_module, 'region_scheduler', scheduler)
+    monkeypatch.setattr(app_module, 'GTFS_SCHEDULER', False)
+    monkeypatch.setattr(app_module, 'gtfs_cache', app_module.LoadedFeeds())
+    monkeypatch.setattr(app_module, 'region_feeds', {})
+    (tmp_path / 'hot.json').write_text('["48.85_2.35"]')
+
+    loaded = []
+
+    def fake_refresh(lat, lon, current=None):
+        loaded.append(app_module.region_key_for(lat, lon))
+        if lat > 48:
+            raise RuntimeError('flux indisponible')
+        GTFSManager.cache_feed(FEED_URL, {**gtfs_data, 'loaded_at': app_module.datetime.now()}, lat, lon)
+
+    monkeypatch.setattr(GTFSManager, 'refresh_region', staticmethod(fake_refresh))
+
+    client = app_module.app.test_client()
+    scheduler.warmup['state'] = 'running'
+    response = client.get('/ready')
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'warming up'
+
+    scheduler._warmup()
+    assert loaded == ['44.84_-0.58', '48.85_2.35']
+    status = scheduler.status()
+    assert (status['state'], status['regions'], status['loaded'], status['failed']) == ('done', 2, 1, 1)
+    assert client.get('/ready').get_json()['warmup']['state'] == 'done'
+
+
+def test_scheduler_tick_refreshes_ahead_and_drops_idle(tmp_path, monkeypatch, gtfs_data):
+    """Les flux des régions suivies sont rechargés avant expiration, les autres libérés après la grâce"""
+    scheduler = make_scheduler(tmp_path, regions=[(44.8378, -0.5792)])
+    monkeypatch.setattr(app_module, 'region_scheduler', scheduler)
+    monkeypatch.setattr(app_module, 'gtfs_cache', app_module.LoadedFeeds({
+        FEED_URL: cached_feed(gtfs_data, hours_old=23),
+        'lyon': cached_feed(gtfs_data, hours_old=49, feed_key='lyon'),
+        'toulouse': cached_feed(gtfs_data, hours_old=1, feed_key='toulouse'),
+    }))
+    monkeypatch.setattr(app_module, 'region_feeds', {'44.84_-0.58': FEED_URL, '45.76_4.84': 'lyon',
+                                                      '43.6_1.44': 'toulouse'})
+    scheduled = []
+    monkeypatch.setattr(scheduler, 'refresh_async', lambda key: scheduled.append(key) or True)
+
+    scheduler.record('43.6_1.44')
+    scheduler.tick()
+
+    assert scheduled == [FEED_URL]
+    assert set(app_module.gtfs_cache) == {FEED_URL, 'toulouse'}
+    assert set(app_module.region_feeds) == {'44.84_-0.58', '43.6_1.44'}
+    assert app_module.json.loads((tmp_path / 'hot.json').read_text()) == ['43.6_1.44']
+
+
+def test_concurrent_region_loads_coalesced(monkeypatch, gtfs_data):
+    """Une rafale de requêtes sur une région froide ne déclenche qu'un chargement"""
+    import threading
+    import time
+
+    flights = app_module.SingleFlight()
+    monkeypatch.setattr(app_module, 'gtfs_loads', flights)
+    monkeypatch.setattr(app_module, 'gtfs_cache', app_module.LoadedFeeds())
+    monkeypatch.setattr(app_module, 'region_feeds', {})
+    monkeypatch.setattr(app_module, 'region_scheduler', app_module.RegionScheduler([], 5, '/nonexistent/hot.json'))
+
+    loads = []
+
+    def slow_load(lat, lon, region_key, current):
+        loads.append(region_key)
+        time.sleep(0.3)
+        data = app_module.gtfs_cache[region_key] = {**gtfs_data, 'loaded_at': app_module.datetime.now()}
+        return data
+
+    monkeypatch.setattr(GTFSManager, '_load_region', staticmethod(slow_load))
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(GTFSManager.load_gtfs_for_region(*CENTER)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == ['44.84_-0.58']
+    assert len(results) == 8 and all(result is results[0] for result in results)
+    stats = flights.stats()
+    assert (stats['executed'], stats['coalesced'], stats['in_flight']) == (1, 7, [])
+
+
+def test_single_flight_shares_errors_and_times_out():
+    """Les appels regroupés reçoivent l'exception du premier, ou expirent"""
+    import threading
+
+    flights = app_module.SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError('flux invalide')
+
+    def call(timeout=None):
+        try:
+            flights.do('k', failing, timeout=timeout)
+        except Exception as e:
+            errors.append(type(e).__name__)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+
+    call(timeout=0.05)
+    follower = threading.Thread(target=call)
+    follower.start()
+    while flights.stats()['coalesced'] < 2:
+        pass
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert sorted(errors) == ['TimeoutError', 'ValueError', 'ValueError']
+    assert flights.stats()['timeouts'] == 1
+
+
+# Flux de métropole simulé : une ligne lointaine (Arcachon) en plus du centre-ville
+LARGE_FEED_FILES = {
+    **FEED_FILES,
+    'stops.txt': FEED_FILES['stops.txt'] + "S6,Arcachon,44.6600,-1.1700,ARC\n",
+    'trips.txt': FEED_FILES['trips.txt'] + "R9,WEEK,T93,Arcachon\n",
+    'stop_times.txt': FEED_FILES['stop_times.txt'] + (
+        "T93,10:00:00,10:00:00,S6,1\n"
+        "T93,10:05:00,10:05:00,S6,2\n"
+        "T93,10:10:00,10:10:00,S6,3\n"
+        "T93,10:15:00,10:15:00,S6,4\n"
+    ),
+}
+
+
+def test_full_feed_parse_within_budget(feed_zip):
+    """Sans centre, tout le flux est chargé ; au-delà du budget mémoire le parsing s'arrête"""
+    with zipfile.ZipFile(io.BytesIO(build_feed_zip(LARGE_FEED_FILES))) as zf:
+        data = GTFSManager.parse_gtfs_zip(zf, memory_budget_mb=0)
+        assert len(data['timetable'].trip_idx) == 14
+        assert set(data['timetable'].stop_offsets) == {'S1', 'S2', 'S3', 'S4', 'S6'}
+
+        budget_mb = 12 * app_module.TimetableStore.ROW_BYTES / (1024 * 1024)
+        with pytest.raises(app_module.GTFSBudgetExceeded):
+            GTFSManager.parse_gtfs_zip(zf, memory_budget_mb=budget_mb)
+
+
+def test_feed_over_budget_loaded_around_position(monkeypatch):
+    """Un flux trop gros pour le budget est chargé autour de la position, sous une clé dédiée"""
+    monkeypatch.setattr(app_module, 'GTFS_SNAPSHOTS', False)
+    monkeypatch.setattr(app_module, 'gtfs_cache', app_module.LoadedFeeds())
+    monkeypatch.setattr(app_module, 'region_feeds', {})
+    monkeypatch.setattr(app_module, 'GTFS_MEMORY_BUDGET_MB', 12 * app_module.TimetableStore.ROW_BYTES / (1024 * 1024))
+    monkeypatch.setattr(app_module.TransitAPIManager, 'search_gtfs_feeds', staticmethod(lambda *a: [{'url': FEED_URL}]))
+    use_fake_http(monkeypatch, get=lambda *a, **kw: FakeResponse(build_feed_zip(LARGE_FEED_FILES)))
+
+    data = GTFSManager.load_gtfs_for_region(*CENTER)
+
+    assert data['partial'] is True
+    assert data['feed_key'] == f"{FEED_URL}#44.84_-0.58"
+    assert len(data['timetable'].trip_idx) == 10
+    # Emprise limitée aux arrêts desservis : Arcachon n'est pas couvert par ce chargement
+    assert data['coverage'] == [44.831, -0.579, 44.852, -0.57]
+    assert not GTFSManager.covers(data, 44.66, -1.17)
+
+
+def test_partial_loads_capped_per_feed(monkeypatch, gtfs_data):
+    """Les zones d'un flux hors budget sont bornées par flux, les moins servies retirées"""
+    monkeypatch.setattr(app_module, 'gtfs_cache', app_module.LoadedFeeds())
+    monkeypatch.setattr(app_module, 'region_feeds', {})
+    monkeypatch.setattr(app_module, 'GTFS_PARTIAL_MAX_PER_FEED', 2)
+    partial = {**gtfs_data, 'partial': True}
+
+    GTFSManager.cache_feed(f"{FEED_URL}#44.84_-0.58", partial, 44.838, -0.579)
+    GTFSManager.cache_feed(f"{FEED_URL}#44.85_-0.57", partial, 44.852, -0.570)
+    GTFSManager.cache_feed('http://other.test/gtfs.zip#44.9_-0.5', partial, 44.9, -0.5)
+    # Première zone servie à nouveau : la seconde devient la moins récemment utilisée
+    assert GTFSManager.find_loaded_feed(44.838, -0.579)[0] == f"{FEED_URL}#44.84_-0.58"
+    GTFSManager.cache_feed(f"{FEED_URL}#44.83_-0.57", partial, 44.831, -0.573)
+
+    assert set(app_module.gtfs_cache) == {f"{FEED_URL}#44.84_-0.58", f"{FEED_URL}#44.83_-0.57",
+                                          'http://other.test/gtfs.zip#44.9_-0.5'}
+    assert f"{FEED_URL}#44.85_-0.57" not in app_module.region_feeds.values()
+
+    monkeypatch.setattr(app_module, 'GTFS_MEMORY_BUDGET_MB', 1e-6)
+    GTFSManager.cache_feed(f"{FEED_URL}#44.82_-0.56", partial, 44.82, -0.56)
+    assert [key for key in app_module.gtfs_cache if key.startswith(FEED_URL)] == [f"{FEED_URL}#44.82_-0.56"]
+
+
+def test_over_budget_feed_downloaded_once_for_several_zones(tmp_path, monkeypatch):
+    """Zones d'un même flux hors budget : un seul téléchargement, puis un parsing par zone depuis l'archive"""
+    import threading
+    import time
+
+    monkeypatch.setattr(app_module, 'GTFS_SNAPSHOTS', True)
+    monkeypatch.setattr(app_module, 'GTFS_SNAPSHOT_DIR', str(tmp_path))
+    monkeypatch.setattr(app_module, 'gtfs_cache', app_module.LoadedFeeds())
+    monkeypatch.setattr(app_module, 'region_feeds', {})
+    monkeypatch.setattr(app_module, 'gtfs_loads', app_module.SingleFlight())
+    monkeypatch.setattr(app_module, 'GTFS_MEMORY_BUDGET_MB', 12 * app_module.TimetableStore.ROW_BYTES / (1024 * 1024))
+    monkeypatch.setattr(app_module.TransitAPIManager, 'search_gtfs_feeds', staticmethod(lambda *a: [{'url': FEED_URL}]))
+
+    release = threading.Event()
+    downloads = []
+
+    def slow_get(*args, **kwargs):
+        downloads.append(1)
+        release.wait(5)
+        return FakeResponse(build_feed_zip(LARGE_FEED_FILES))
+
+    use_fake_http(monkeypatch, get=slow_get)
+    parses = []
+    parse = GTFSManager.parse_gtfs_zip
+    monkeypatch.setattr(GTFSManager, 'parse_gtfs_zip', staticmethod(
+        lambda zf, *args, **kwargs: parses.append(args[:1]) or parse(zf, *args, **kwargs)))
+
+    results = {}
+    arcachon = (44.66, -1.17)
+    center = threading.Thread(target=lambda: results.setdefault('center', GTFSManager.load_gtfs_for_region(*CENTER)))
+    remote = threading.Thread(target=lambda: results.setdefault('arcachon', GTFSManager.load_gtfs_for_region(*arcachon)))
+    center.start()
+    while not downloads:
+        time.sleep(0.01)
+    remote.start()
+    while app_module.gtfs_loads.stats()['coalesced'] < 1:
+        time.sleep(0.01)
+    release.set()
+    center.join()
+    remote.join()
+
+    assert len(downloads) == 1
+    assert results['center']['feed_key'] == f"{FEED_URL}#44.84_-0.58"
+    assert results['arcachon']['feed_key'] == f"{FEED_URL}#44.66_-1.17"
+    assert GTFSManager.covers(results['arcachon'], *arcachon)
+    # Flux complet tenté une fois, puis une passe limitée par zone
+    assert parses == [(), (CENTER[0],), (arcachon[0],)]
+    assert os.path.exists(GTFSManager.archive_path(FEED_URL))
+
+
+def test_feed_memory_footprint_reported(tmp_path, monkeypatch, gtfs_data):
+    """L'empreinte mémoire de chaque flux est calculée au chargement et exposée par /health"""
+    monkeypatch.setattr(app_module, 'gtfs_cache', app_module.LoadedFeeds())
+    monkeypatch.setattr(app_module, 'region_feeds', {})
+
+    entry = GTFSManager.cache_feed(FEED_URL, gtfs_data, *CENTER)
+    timetable = gtfs_data['timetable']
+    footprint = entry['footprint']
+    assert footprint['arrays'] >= timetable.nbytes + timetable.pattern_nbytes
+    assert footprint['shared'] == 0 and footprint['objects'] > 0
+    assert footprint['total'] == footprint['arrays'] + footprint['objects']
+
+    # Colonnes d'un instantané mmap: comptées comme partagées entre workers
+    path = str(tmp_path / 'feed.snapshot')
+    app_module.GTFSSnapshot.save(gtfs_data, path)
+    mapped = GTFSManager.footprint(app_module.GTFSSnapshot.load(path))
+    assert mapped['shared'] >= timetable.nbytes + timetable.pattern_nbytes
+
+    with app_module.app.test_client() as client:
+        memory = client.get('/health').get_json()['gtfs_memory']
+    assert memory['feeds'][FEED_URL] == footprint
+    assert memory['total'] == footprint['total']
+
+
+def test_osm_route_membership_from_relations():
+    """Les lignes OSM ne desservent que les arrêts membres de leur relation, départs estimés à la demande"""
+    from datetime import datetime
+
+    osm_data = {
+        'stops': [{'id': f'osm_{i}', 'name': f'Arrêt {i}', 'lat': 44.83 + i * 0.001, 'lon': -0.58} for i in range(4)],
+        'routes': [
+            {'id': 'osm_route_1', 'short_name': 'A', 'long_name': 'Tram A', 'type': 'tram', 'color': '#81197F',
+             'stop_ids': ['osm_0', 'osm_1', 'osm_2', 'osm_99']},
+            {'id': 'osm_route_2', 'short_name': '9', 'long_name': 'Bus 9', 'type': 'bus', 'color': '#00B1EB',
+             'stop_ids': ['osm_2', 'osm_3']},
+        ],
+    }
+    data = GTFSManager.build_osm_gtfs_data(osm_data)
+    network = data['timetable']
+
+    assert 'stop_ids' not in data['routes']['osm_route_1']
+    assert network.routes_at('osm_2') == {'osm_route_1', 'osm_route_2'}
+    assert network.routes_at('osm_3') == {'osm_route_2'}
+    assert network.routes_between('osm_0', 'osm_2') == {'osm_route_1'}
+    assert network.routes_between('osm_2', 'osm_0') == set()
+    assert [r['short_name'] for r in GTFSManager.get_routes_at_stop(data, 'osm_0')] == ['A']
+
+    departures = GTFSManager.get_next_departures(data, 'osm_2', limit=6, at=datetime(2025, 1, 15, 8, 0))
+    times = [d['time'] for d in departures]
+    assert len(departures) == 6 and times == sorted(times) and times[0] >= '08:00:00'
+    assert all(d['estimated'] for d in departures)
+    assert {d['route'] for d in departures} == {'A', '9'}
+    assert {d['headsign'] for d in departures if d['route'] == '9'} == {'Arrêt 3'}
+
+    # Filtre de lignes : uniquement le tram, toutes les 8 minutes
+    tram = GTFSManager.get_next_departures(data, 'osm_2', limit=3, route_filter={'osm_route_1'},
+                                           at=datetime(2025, 1, 15, 8, 0))
+    assert [d['route'] for d in tram] == ['A'] * 3
+    assert tram[1]['time'] > tram[0]['time']
+
+
+def test_osm_headsign_from_full_relation():
+    """La direction affichée est celle de la relation complète, pas l'arrêt au bord du rayon de recherche"""
+    from datetime import datetime
+
+    node = lambda i, lat, name: {'type': 'node', 'id': i, 'lat': lat, 'lon': -0.58, 'tags': {'name': name}}
+    members = lambda *ids: [{'type': 'node', 'ref': i} for i in ids]
+    data = {'elements': [
+        node(1, 44.830, 'Centre'), node(2, 44.835, 'Place'), node(3, 44.840, 'Bord'),
+        node(4, 44.950, 'Terminus Lointain'),
+        {'type': 'relation', 'id': 10, 'tags': {'ref': 'A', 'route': 'tram'}, 'members': members(1, 2, 3, 4)},
+        {'type': 'relation', 'id': 11, 'tags': {'ref': '9', 'route': 'bus', 'to': 'Gare Saint-Jean'},
+         'members': members(3, 2, 1, 99)},
+    ]}
+    osm_data = app_module.TransitAPIManager.parse_overpass(data)
+    trimmed = app_module.TransitAPIManager.assemble_overpass_tiles([osm_data], 44.830, -0.58, 2000)
+    assert {stop['id'] for stop in trimmed['stops']} == {'osm_1', 'osm_2', 'osm_3'}
+
+    gtfs_data = GTFSManager.build_osm_gtfs_data(trimmed)
+    assert 'headsign' not in gtfs_data['routes']['osm_route_10']
+    departures = GTFSManager.get_next_departures(gtfs_data, 'osm_2', limit=10, at=datetime(2025, 1, 15, 8, 0))
+    headsigns = {d['route']: d['headsign'] for d in departures}
+    assert headsigns == {'A': 'Terminus Lointain', '9': 'Gare Saint-Jean'}
+
+
+def test_osm_membership_scales_with_relations():
+    """Taille proportionnelle aux membres des relations, pas au produit arrêts x lignes"""
+    stops = [{'id': f'osm_{i}', 'name': f'S{i}', 'lat': 44.8 + (i % 40) * 0.002, 'lon': -0.6 + (i // 40) * 0.002}
+             for i in range(800)]
+    routes = [{'id': f'osm_route_{r}', 'short_name': str(r), 'type': 'bus',
+               'stop_ids': [f'osm_{(r * 5 + k) % 800}' for k in range(20)]} for r in range(150)]
+
+    data = GTFSManager.build_osm_gtfs_data({'stops': stops, 'routes': routes})
+
+    assert len(data['timetable']) == 150 * 20
+    assert data['trips'] == {}
+    assert data['timetable'].nbytes < 64 * 1024
+
+
+CATALOG_CSV = (
+    "id,data_type,status,location.country_code,location.municipality,provider,name,"
+    "urls.authentication_type,urls.direct_download,urls.latest,"
+    "location.bounding_box.minimum_latitude,location.bounding_box.maximum_latitude,"
+    "location.bounding_box.minimum_longitude,location.bounding_box.maximum_longitude\n"
+    "mdb-1,gtfs,active,FR,Bordeaux,TBM,,0,http://tbm.test/gtfs.zip,https://mdb.test/1.zip,44.70,45.00,-0.80,-0.40\n"
+    "mdb-2,gtfs,active,FR,,SNCF,TER,0,http://sncf.test/ter.zip,,41.30,51.10,-5.10,9.60\n"
+    "mdb-3,gtfs,deprecated,FR,Bordeaux,Ancien,,0,http://old.test/gtfs.zip,,44.70,45.00,-0.80,-0.40\n"
+    "mdb-4,gtfs_rt,active,FR,Bordeaux,TBM,RT,0,http://tbm.test/rt,,44.70,45.00,-0.80,-0.40\n"
+    "mdb-5,gtfs,active,FR,Lyon,TCL,,2,http://tcl.test/gtfs.zip,,45.60,45.90,4.70,5.10\n"
+)
+
+
+def test_feed_catalog_resolves_without_network(tmp_path, monkeypatch):
+    """Le catalogue sur disque résout une position vers ses flux, du plus local au plus large"""
+    path = tmp_path / 'catalog.csv'
+    path.write_text(CATALOG_CSV)
+    catalog = app_module.FeedCatalog(str(path), 'http://catalog.test/feeds.csv', 24)
+    assert catalog.load()
+    monkeypatch.setattr(app_module, 'feed_catalog', catalog)
+
+    def no_network(*args, **kwargs):
+        raise AssertionError('appel réseau inattendu')
+
+    use_fake_http(monkeypatch, get=no_network)
+
+    feeds = app_module.TransitAPIManager.search_gtfs_feeds(*CENTER)
+    assert [feed['id'] for feed in feeds] == ['mdb-1', 'mdb-2']
+    assert feeds[0]['url'] == 'https://mdb.test/1.zip'
+    assert feeds[1]['name'] == 'SNCF - TER'
+    assert catalog.status()['feeds'] == 2
+
+    # Flux avec authentification ignoré, repli sur les sources préconfigurées
+    assert app_module.TransitAPIManager.search_gtfs_feeds(45.7640, 4.8357)[0]['id'] == 'mdb-2'
+    assert app_module.TransitAPIManager.search_gtfs_feeds(35.6762, 139.6503)[0]['name'] == 'Tokyo Metro'
+
+
+def test_feed_catalog_read_when_worker_starts(tmp_path, monkeypatch):
+    """Le catalogue n'est pas lu à l'import mais au démarrage des tâches du worker"""
+    path = tmp_path / 'catalog.csv'
+    path.write_text(CATALOG_CSV)
+    catalog = app_module.FeedCatalog(str(path), 'http://catalog.test/feeds.csv', 24)
+    monkeypatch.setattr(app_module, 'feed_catalog', catalog)
+    monkeypatch.setattr(app_module, 'GTFS_SCHEDULER', False)
+    monkeypatch.setattr(catalog, '_run', lambda: None)
+    assert catalog.status()['feeds'] == 0
+
+    app_module.start_background_tasks()
+    assert catalog.status()['feeds'] == 2
+
+
+def test_feed_catalog_background_refresh(tmp_path, monkeypatch):
+    """Le catalogue absent ou trop ancien est retéléchargé puis rechargé ; un export invalide est ignoré"""
+    path = tmp_path / 'catalog.csv'
+    catalog = app_module.FeedCatalog(str(path), 'http://catalog.test/feeds.csv', 24)
+    assert not catalog.load()
+
+    use_fake_http(monkeypatch, get=lambda *a, **kw: FakeResponse(CATALOG_CSV.encode()))
+    catalog.tick()
+    assert path.exists()
+    assert [feed['id'] for feed in catalog.resolve(*CENTER)] == ['mdb-1', 'mdb-2']
+
+    # Export vide: le fichier en place est conservé
+    os.utime(path, (0, 0))
+    use_fake_http(monkeypatch, get=lambda *a, **kw: FakeResponse(b'id,data_type\n'))
+    catalog.tick()
+    assert catalog.status()['last_error'] == 'catalogue téléchargé vide'
+    assert len(catalog.resolve(*CENTER)) == 2
+    assert sorted(os.listdir(tmp_path)) == ['catalog.csv', 'catalog.csv.lock']
+
+
+def test_feed_catalog_single_download_across_processes(tmp_path, monkeypatch):
+    """Un seul processus télécharge le catalogue absent ; les autres relisent le fichier qu'il a écrit"""
+    path = tmp_path / 'catalog.csv'
+    downloads = []
+    use_fake_http(monkeypatch, get=lambda *a, **kw: downloads.append(1) or FakeResponse(CATALOG_CSV.encode()))
+
+    # Téléchargement en cours ailleurs (verrou tenu par un autre processus) : pas de second téléchargement
+    leader = app_module.FeedCatalog(str(path), 'http://catalog.test/feeds.csv', 24)
+    lock_fd = leader.try_lock()
+    assert lock_fd is not None
+    follower = app_module.FeedCatalog(str(path), 'http://catalog.test/feeds.csv', 24)
+    follower.tick()
+    assert downloads == [] and follower.resolve(*CENTER) == []
+    assert follower.try_lock() is None
+
+    # Le détenteur du verrou publie le fichier : relu sans téléchargement
+    path.write_text(CATALOG_CSV)
+    os.close(lock_fd)
+    follower.tick()
+    assert downloads == [] and len(follower.resolve(*CENTER)) == 2
+
+    # Fichier de verrou laissé par un processus tué : libre, le catalogue trop ancien est retéléchargé
+    os.utime(path, (0, 0))
+    follower.tick()
+    assert downloads == [1]
+    assert sorted(os.listdir(tmp_path)) == ['catalog.csv', 'catalog.csv.lock']
+
+
+# Même flux avec calendrier : TA2 circule le samedi seulement, 14 juillet férié (horaires du samedi)
+CALENDAR_FEED_FILES = {
+    **FEED_FILES,
+    'trips.txt': FEED_FILES['trips.txt'].replace('RA,WEEK,TA2', 'RA,SAT,TA2'),
+    'calendar.txt': (
+        "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date\n"
+        "WEEK,1,1,1,1,1,0,0,20250101,20251231\n"
+        "SAT,0,0,0,0,0,1,0,20250101,20251231\n"
+    ),
+    'calendar_dates.txt': (
+        "service_id,date,exception_type\n"
+        "WEEK,20250714,2\n"
+        "SAT,20250714,1\n"
+    ),
+}
+
+
+@pytest.fixture
+def calendar_data():
+    with zipfile.ZipFile(io.BytesIO(build_feed_zip(CALENDAR_FEED_FILES))) as zf:
+        data = GTFSManager.parse_gtfs_zip(zf)
+    data['source'] = 'gtfs'
+    return data
+
+
+def test_service_calendar_filters_departures(calendar_data):
+    """Seuls les trips en service le jour demandé (ou la veille après minuit) sont proposés"""
+    from datetime import datetime
+
+    def times(stop_id, at):
+        return [(d['time'], d['headsign']) for d in GTFSManager.get_next_departures(calendar_data, stop_id, at=at)]
+
+    wednesday, saturday, holiday = datetime(2025, 1, 15, 7, 0), datetime(2025, 1, 18, 7, 0), datetime(2025, 7, 14, 7, 0)
+    assert times('S1', wednesday) == [('08:00:00', 'Quinconces')]
+    assert times('S1', saturday) == [('09:00:00', 'Quinconces')]
+    assert times('S1', holiday) == [('09:00:00', 'Quinconces')]
+
+    # T92 (25:10, service de semaine) : visible le samedi à 1h (service du vendredi), pas le dimanche
+    assert times('S3', datetime(2025, 1, 18, 1, 0))[0] == ('01:10:00', 'Chartrons')
+    assert times('S3', datetime(2025, 1, 19, 1, 0)) == []
+
+    calendar = calendar_data['calendar']
+    assert list(calendar.active_services(holiday.date())) == [0, 1, 1]
+
+
+def test_service_calendar_memo_thread_safe(calendar_data):
+    """Le mémo des jours de service reste cohérent sous accès concurrents (insertions et évictions)"""
+    from datetime import date, timedelta
+    from concurrent.futures import ThreadPoolExecutor
+
+    calendar = calendar_data['calendar']
+    first = date(2025, 1, 1)
+
+    def sweep(offset):
+        return [bytes(calendar.active_services(first + timedelta(days=(offset + i) % 200))) for i in range(200)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        sweeps = list(pool.map(sweep, range(16)))
+
+    assert len(calendar.days) <= 2 * app_module.GTFS_CALENDAR_HORIZON_DAYS + 3
+    assert sweeps[0][(date(2025, 1, 18) - first).days] == bytes([0, 1, 1])
+
+
+def test_planner_respects_service_calendar(tmp_path, calendar_data):
+    """Le calcul d'itinéraire ignore les trips hors service, y compris après relecture d'un instantané"""
+    from datetime import date
+
+    def arrival(data, day):
+        calendar = data['calendar']
+        journey = data['planner'].plan({'S1': 0}, {'S3': 0}, 7 * 3600,
+                                       trip_filter=lambda shift: calendar.trip_filter(day))
+        return app_module.format_gtfs_time(journey['arrival'])
+
+    assert arrival(calendar_data, date(2025, 1, 15)) == '08:10:00'
+    assert arrival(calendar_data, date(2025, 1, 18)) == '09:10:00'
+
+    path = str(tmp_path / 'calendar.snapshot')
+    app_module.GTFSSnapshot.save(calendar_data, path)
+    loaded = app_module.GTFSSnapshot.load(path)
+    assert loaded['calendar'].service_ids == calendar_data['calendar'].service_ids
+    assert arrival(loaded, date(2025, 1, 18)) == '09:10:00'
+    assert loaded['calendar'].active_services(date(2025, 7, 14)) == calendar_data['calendar'].active_services(date(2025, 7, 14))